@@ -2,11 +2,13 @@ import numpy as np
 import argparse
 import torch
 from torch.backends import cudnn
-import torch.nn.functional as tfunc
 from torch.utils.data import DataLoader
 from math import sqrt
 import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from .utils.dataloader import RSNADataSet
 from .utils.score import compute_auroc
 from .utils.model import DenseNet121, DenseNet121Eff, load_checkpoint
@@ -42,56 +44,114 @@ class RSNAInference():
         torch_out = self.model(sample_image.cuda())
         np.testing.assert_allclose(to_numpy(torch_out), ort_outs[0], rtol=1e-03, atol=1e-05)
 
-    def load_inference_model(self, run_type, onnx_checkpoint):
+    def load_inference_model(self, run_type, onnx_checkpoint, num_requests=2):
         if run_type == 'pytorch':
-            model = self.model
+            model = TorchRunner(self.model, self.device, num_requests)
         elif run_type == 'onnx':
-            model = onnxruntime.InferenceSession(onnx_checkpoint)
+            model = OnnxRunner(onnxruntime.InferenceSession(onnx_checkpoint), num_requests)
         else:
             ie = IECore()
             model_xml = os.path.splitext(onnx_checkpoint)[0] + ".xml"
             model_bin = os.path.splitext(model_xml)[0] + ".bin"
             model_temp = ie.read_network(model_xml, model_bin)
-            model = ie.load_network(network=model_temp, device_name='CPU')
+            model = OpenVINORunner(ie.load_network(network=model_temp, device_name='CPU',
+                                                   num_requests=num_requests), num_requests)
         return model
 
-    def validate_models(self, run_type, onnx_checkpoint =''):
-        cudnn.benchmark = True
-        out_gt = torch.FloatTensor()
-        out_pred = torch.FloatTensor()
-        model = self.load_inference_model(run_type, onnx_checkpoint)
+    def evaluate(self, run_type, onnx_checkpoint='', num_requests=2):
+        """ Returns AUROC of each class and throughput of the backend.
 
-        with torch.no_grad():
-            for var_input, var_target in self.data_loader_test:
-                if run_type in ('pytorch', 'onnx'):
-                    var_target = var_target.to(self.device)
-                    var_input = var_input.to(self.device)
-                    out_gt = out_gt.to(self.device)
-                    out_pred = out_pred.to(self.device)
-                    out_gt = torch.cat((out_gt, var_target), 0)
-                else:
-                    out_gt = torch.cat((out_gt, var_target), 0)
-                _, c, h, w = var_input.size()
-                var_input = var_input.view(-1, c, h, w)
-                to_tensor = transforms.ToTensor()
-                if run_type == 'pytorch':
-                    out = model(var_input)
-                elif run_type == 'onnx':
-                    ort_inputs = {model.get_inputs()[0].name: to_numpy(var_input)}
-                    out = model.run(None, ort_inputs)
-                    out = np.array(out)
-                    out = to_tensor(out).squeeze(1).transpose(dim0=1, dim1=0).to(self.device)
-                else:
-                    out = model.infer(inputs={'input': var_input})['output']
-                    out = to_tensor(out).squeeze(1)
-
-                out_pred = torch.cat((out_pred, out), 0)
-                one_hot_gt = tfunc.one_hot(out_gt.squeeze(1).long()).float()
-                auroc_individual = compute_auroc(one_hot_gt, out_pred, self.class_count)
+        Predictions are written to buffers preallocated for the whole test set. Up to `num_requests`
+        batches are inferred while the data loader decodes the next ones, AUROC is computed once at the end.
+        """
+        cudnn.benchmark = True
+        model = self.load_inference_model(run_type, onnx_checkpoint, num_requests)
+        num_images = len(self.data_loader_test.dataset)
+        out_gt = np.zeros(num_images, dtype=np.int64)
+        out_pred = np.zeros((num_images, self.class_count), dtype=np.float32)
+        in_flight = deque()
+
+        def finish_oldest():
+            offset, handle = in_flight.popleft()
+            out = model.wait(handle)
+            out_pred[offset:offset + out.shape[0]] = out
+
+        offset = 0
+        start = time.perf_counter()
+        for var_input, var_target in self.data_loader_test:
+            if len(in_flight) == model.num_requests:
+                finish_oldest()
+            batch_size = var_input.shape[0]
+            out_gt[offset:offset + batch_size] = var_target.view(-1).numpy()
+            in_flight.append((offset, model.start(var_input)))
+            offset += batch_size
+        while in_flight:
+            finish_oldest()
+        elapsed = time.perf_counter() - start
+
+        one_hot_gt = np.eye(self.class_count, dtype=np.float32)[out_gt]
+        auroc_individual = compute_auroc(torch.from_numpy(one_hot_gt), torch.from_numpy(out_pred), self.class_count)
+        stats = {'images': num_images, 'total_s': elapsed,
+                 'images_per_s': num_images / elapsed if elapsed > 0 else 0.0}
+        return auroc_individual, stats
+
+    def validate_models(self, run_type, onnx_checkpoint ='', num_requests=2):
+        auroc_individual, stats = self.evaluate(run_type, onnx_checkpoint, num_requests)
+        print(f"{run_type}: {stats['images_per_s']:.1f} images/s")
         auroc_mean = np.array(auroc_individual).mean()
         return auroc_mean
 
 
+class TorchRunner():
+    """ Launches batches on the device without waiting, results are copied back to host in wait. """
+    def __init__(self, model, device, num_requests=2):
+        self.model = model
+        self.device = device
+        self.num_requests = num_requests
+
+    def start(self, var_input):
+        with torch.no_grad():
+            return self.model(var_input.to(self.device, non_blocking=True))
+
+    def wait(self, handle):
+        return handle.float().cpu().numpy()
+
+
+class OnnxRunner():
+    """ Runs the session in a pool of threads, ONNX Runtime releases the GIL during inference. """
+    def __init__(self, session, num_requests=2):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.num_requests = num_requests
+        self.pool = ThreadPoolExecutor(num_requests)
+
+    def start(self, var_input):
+        return self.pool.submit(self.session.run, None, {self.input_name: to_numpy(var_input)})
+
+    def wait(self, handle):
+        return handle.result()[0]
+
+
+class OpenVINORunner():
+    """ Runs batches on free infer requests of the executable network asynchronously. """
+    def __init__(self, exec_net, num_requests=2):
+        self.exec_net = exec_net
+        self.num_requests = num_requests
+        self.free = deque(range(num_requests))
+
+    def start(self, var_input):
+        request_id = self.free.popleft()
+        self.exec_net.requests[request_id].async_infer({'input': to_numpy(var_input)})
+        return request_id
+
+    def wait(self, request_id):
+        request = self.exec_net.requests[request_id]
+        request.wait()
+        out = request.output_blobs['output'].buffer.copy()
+        self.free.append(request_id)
+        return out
+
+
 def to_numpy(tensor):
     return tensor.detach().cpu().numpy() if tensor.requires_grad else tensor.cpu().numpy()
 
@@ -132,8 +192,9 @@ def main(args):
 
     rsna_inference = RSNAInference(model, data_loader_test, class_count, checkpoint, class_names, device)
 
-    test_auroc = rsna_inference.validate_models(run_type='pytorch')
-    print(f"Test AUROC is {test_auroc}")
+    for run_type in args.run_type:
+        test_auroc = rsna_inference.validate_models(run_type, args.onnx_checkpoint, args.num_requests)
+        print(f"Test AUROC is {test_auroc}")
 
 
 if __name__=="__main__":
@@ -167,5 +228,21 @@ if __name__=="__main__":
         help="Beta for the model.",
         default=None,
         type=float)
+    parser.add_argument("--run_type",
+        required=False,
+        help="Backends to evaluate",
+        default=['pytorch'],
+        nargs='+',
+        choices=['pytorch', 'onnx', 'openvino'])
+    parser.add_argument("--onnx_checkpoint",
+        required=False,
+        help="Path to ONNX model, IR is expected next to it with .xml and .bin extensions",
+        default='',
+        type=str)
+    parser.add_argument("--num_requests",
+        required=False,
+        help="Number of batches inferred in parallel",
+        default=2,
+        type=int)
     custom_args = parser.parse_args()
     main(custom_args)
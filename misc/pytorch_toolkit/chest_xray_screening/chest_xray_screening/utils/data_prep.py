@@ -1,57 +1,188 @@
 import os
 import json
+from multiprocessing import Pool
 from pydicom import dcmread
 from tqdm import tqdm as tq
 import numpy as np
 from PIL import Image
 import argparse
 import pandas as pd
-
-def dcm_to_jpg(args):
-
+try:
+    from .packed_store import PACKED_IMAGES, PACKED_INDEX
+except ImportError:
+    # run as a script from the utils folder
+    from packed_store import PACKED_IMAGES, PACKED_INDEX
+
+PIXEL_STATS = 'pixel_stats.json'
+LABELS = ["Lung Opacity", "Normal", "No Lung Opacity / Not Normal"]
+
+
+def list_dicoms(dirpath):
+    return sorted(f for f in os.listdir(dirpath) if f.endswith('.dcm'))
+
+
+def image_name(fpath):
+    return fpath.split('.dcm')[0] + '.jpg'
+
+
+def pixel_stats(np_array):
+    """ Count, mean and sum of squared deviations from the mean of the pixels. """
+    np_array = np_array.astype(np.float64)
+    mean = np_array.mean()
+    return [np_array.size, mean, float(((np_array - mean) ** 2).sum())]
+
+
+def merge_stats(a, b):
+    """ Combines pixel stats of two sets of pixels (Chan et al. parallel variance). """
+    count = a[0] + b[0]
+    if count == 0:
+        return [0, 0.0, 0.0]
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / count
+    m2 = a[2] + b[2] + delta ** 2 * a[0] * b[0] / count
+    return [count, mean, m2]
+
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_packed_index(savepath):
+    """ Names of the rows of the packed store in order and the set of names whose rows are written. """
+    index = read_json(os.path.join(savepath, PACKED_INDEX), {'names': [], 'done': []})
+    return index['names'], set(index['done'])
+
+
+def prepare_packed_store(savepath, names, shape):
+    """ Returns the path of the packed [N, H, W] uint8 store and the row of each image name.
+
+    Rows of images converted by previous runs are kept, the store grows by rows for new names.
+    The index is not updated here, so new rows are not listed in it until they are written.
+    """
+    store_path = os.path.join(savepath, PACKED_IMAGES)
+    old = read_packed_index(savepath)[0] if os.path.exists(store_path) else []
+    known = set(old)
+    order = old + [n for n in names if n not in known]
+    if len(order) > len(old):
+        tmp_path = store_path + '.tmp'
+        images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(order),) + tuple(shape))
+        if old:
+            old_images = np.load(store_path, mmap_mode='r')
+            for s in range(0, len(old), 256):
+                e = min(s + 256, len(old))
+                images[s:e] = old_images[s:e]
+            del old_images
+        images.flush()
+        del images
+        os.replace(tmp_path, store_path)
+    return store_path, {n: i for i, n in enumerate(order)}
+
+
+def process_dicom(job):
+    """ Decodes one DICOM, writes it as JPEG and/or to its row of the packed store, returns its pixel stats. """
+    dcm_path, jpg_path, store_path, row = job
+    np_array = dcmread(dcm_path).pixel_array
+    if jpg_path is not None:
+        Image.fromarray(np_array).save(jpg_path)
+    if store_path is not None:
+        images = np.load(store_path, mmap_mode='r+')
+        if np_array.dtype != np.uint8 or np_array.shape != images.shape[1:]:
+            raise ValueError(f'{dcm_path}: expected {images.shape[1:]} uint8 pixels, '
+                             f'got {np_array.shape} {np_array.dtype}')
+        images[row] = np_array
+        images.flush()
+    return pixel_stats(np_array)
+
+
+def try_process_dicom(job):
+    """ Runs process_dicom, returns its pixel stats and None or None and the error message. """
+    try:
+        return process_dicom(job), None
+    except Exception as e:  # pylint: disable=broad-except
+        return None, f'{job[0]}: {e}'
+
+
+def preprocess(args):
+    """ Single pass over the DICOMs which writes the requested outputs and the pixel stats.
+
+    Every DICOM is decoded once in a pool of processes. Stats of each image are saved, so a re-run
+    decodes only the files missing in one of the requested outputs. Files which fail to decode are
+    reported and skipped.
+    """
     dirpath = os.path.join(args.dpath, 'original/')
     savepath = os.path.join(args.dpath, 'processed_data/')
     if not os.path.isdir(savepath):
         os.makedirs(savepath)
-    file_list = os.listdir(dirpath)
-    for fpath in tq(file_list):
-        ds = dcmread(os.path.join(dirpath, fpath))
-        np_array = ds.pixel_array
-        im = Image.fromarray(np_array)
-        name = fpath.split('.dcm')[0]
-        im.save(os.path.join(savepath, name + ".jpg"))
-
-    print('Completed')
+    file_list = list_dicoms(dirpath)
+    names = [image_name(f) for f in file_list]
+    stats_path = os.path.join(savepath, PIXEL_STATS)
+    stats = read_json(stats_path, {})
+
+    store_path, rows, done_rows = None, {}, set()
+    if args.packed and file_list:
+        header = dcmread(os.path.join(dirpath, file_list[0]), stop_before_pixels=True)
+        done_rows = read_packed_index(savepath)[1] if os.path.exists(os.path.join(savepath, PACKED_IMAGES)) \
+            else set()
+        store_path, rows = prepare_packed_store(savepath, names, (header.Rows, header.Columns))
+
+    jobs = []
+    for fpath, name in zip(file_list, names):
+        jpg_path = os.path.join(savepath, name) if args.jpg else None
+        write_jpg = jpg_path is not None and not os.path.exists(jpg_path)
+        write_row = store_path is not None and name not in done_rows
+        if write_jpg or write_row or name not in stats:
+            jobs.append((name, (os.path.join(dirpath, fpath), jpg_path if write_jpg else None,
+                                store_path if write_row else None, rows.get(name))))
+
+    # stats are saved even if the run is interrupted, so a re-run continues from the decoded files
+    failed = []
+    try:
+        with Pool(args.workers) as pool:
+            results = pool.imap(try_process_dicom, [job for _, job in jobs], chunksize=8)
+            for (name, job), (image_stats, error) in tq(zip(jobs, results), total=len(jobs)):
+                if error is None:
+                    stats[name] = image_stats
+                    if job[2] is not None:
+                        done_rows.add(name)
+                else:
+                    print(f'Skipped {error}')
+                    stats.pop(name, None)
+                    failed.append(name)
+    finally:
+        write_json(stats_path, stats)
+        if store_path is not None:
+            # rows of skipped images stay in the store but are not done, so they are rewritten by the
+            # next run and the data loader refuses to read them
+            write_json(os.path.join(savepath, PACKED_INDEX),
+                       {'names': sorted(rows, key=rows.get), 'done': sorted(done_rows & set(rows))})
+
+    total = [0, 0.0, 0.0]
+    for name in names:
+        if name in stats:
+            total = merge_stats(total, stats[name])
+    print(f'Processed {len(jobs) - len(failed)} of {len(file_list)} files, skipped {len(failed)} files')
+    print(f'Mean: {total[1]}')
+    print(f'Standard Deviation: {np.sqrt(total[2] / max(total[0], 1))}')
 
 
-def mean_sd_calculator(args):
-    dirpath = os.path.join(args.dpath, 'original/')
-    file_list = os.listdir(dirpath)
-    mean_list = []
-    sd_list = []
-    for fpath in tq(file_list):
-        ds = dcmread(dirpath+fpath)
-        np_array = ds.pixel_array
-        mean = np.mean(np_array)
-        mean_list.append(mean)
-        sd = np.std(np_array)
-        sd_list.append(sd)
-
-    print(f'Mean: {np.mean(mean_list)}')
-    print(f'Standard Deviation: {np.std(sd_list)}')
-
 def create_annotation(args):
 
-    file_list = os.listdir(os.path.join(args.dpath, 'processed_data/'))
+    file_list = list_dicoms(os.path.join(args.dpath, 'original/'))
     df_class=pd.read_csv(os.path.join(args.dpath, 'stage_2_detailed_class_info.csv'))
-    labels=["Lung Opacity","Normal","No Lung Opacity / Not Normal"]
-    dict_annotation = {}
-    for file in tq(file_list):
-        patient_id = file.split('.jpg')[0]
-        tmp = df_class[df_class["patientId"] == patient_id]["class"].values[0]
-        idx = labels.index(tmp)
-        dict_annotation[str(file)] = idx
-
+    # Patients with several boxes have a row per box with the same class
+    classes = df_class.drop_duplicates('patientId').set_index('patientId')['class']
+    patient_ids = [f.split('.dcm')[0] for f in file_list]
+    idx = classes.reindex(patient_ids).map(LABELS.index)
+    dict_annotation = {image_name(f): int(i) for f, i in zip(file_list, idx)}
 
     with open(os.path.join(args.dpath, 'rsna_annotation.json'), 'w') as f:
         json.dump(dict_annotation, f)
@@ -61,10 +192,8 @@ def create_annotation(args):
 
 def main(args):
 
-    if args.jpg:
-        dcm_to_jpg(args)
-    if args.msd:
-        mean_sd_calculator(args)
+    if args.jpg or args.packed or args.msd:
+        preprocess(args)
     if args.ann:
         create_annotation(args)
 
@@ -77,6 +206,12 @@ if __name__=="__main__":
         help="Convert DCM files to jpg",
         default=False,
         action='store_true')
+    parser.add_argument(
+        "--packed",
+        required=False,
+        help="Write DCM files to a packed uint8 array store",
+        default=False,
+        action='store_true')
     parser.add_argument(
         "--msd",
         required=False,
@@ -95,6 +230,12 @@ if __name__=="__main__":
         help="Absolute path to folder containing the dataset",
         default= None,
         type = str)
+    parser.add_argument(
+        "--workers",
+        required=False,
+        help="Number of processes decoding DCM files",
+        default=os.cpu_count(),
+        type=int)
 
     custom_args = parser.parse_args()
 
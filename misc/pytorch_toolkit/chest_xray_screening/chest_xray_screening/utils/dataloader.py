@@ -1,8 +1,11 @@
+import json
 from PIL import Image
+import numpy as np
 import torch
 from torchvision import transforms
 from torch.utils.data import Dataset
 from pathlib import Path
+from .packed_store import PACKED_IMAGES, PACKED_INDEX
 
 
 class RSNADataSet(Dataset):
@@ -21,12 +24,37 @@ class RSNADataSet(Dataset):
 
         self.transform = transform
 
+        # images written by data_prep.py --packed are read from rows of the store instead of JPEG files
+        self.packed_path = Path.joinpath(image_directory, PACKED_IMAGES)
+        self.rows = None
+        self.images = None
+        index_path = Path.joinpath(image_directory, PACKED_INDEX)
+        if index_path.exists():
+            with open(index_path) as f:
+                index = json.load(f)
+            # only rows listed as done hold images, others failed to decode or were not written yet
+            done = set(index['done'])
+            self.rows = {name: row for row, name in enumerate(index['names']) if name in done}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+    def read_image(self, image_name, image_id):
+        if self.rows is None:
+            return Image.open(image_name).convert('RGB')
+        if image_id not in self.rows:
+            raise FileNotFoundError(f'{image_id} is not written to the packed store {self.packed_path}')
+        if self.images is None:
+            self.images = np.load(self.packed_path, mmap_mode='r')
+        return Image.fromarray(self.images[self.rows[image_id]]).convert('RGB')
 
     def __getitem__(self, index):
 
         image_name = self.image_names[index]
-        image = Image.open(image_name).convert('RGB')
         image_id = str(image_name).rsplit('/', maxsplit = 1)[-1]
+        image = self.read_image(image_name, image_id)
         label = self.labels[image_id]
 
         if self.transform is not None:
@@ -0,0 +1,4 @@
+# File names of the packed image store written by data_prep.py and read by dataloader.py,
+# kept apart so the data loader does not import the dependencies of the DICOM conversion
+PACKED_IMAGES = 'images.u8.npy'
+PACKED_INDEX = 'images.json'
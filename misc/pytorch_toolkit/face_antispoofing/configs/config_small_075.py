@@ -10,7 +10,8 @@ test_steps = None
 
 datasets = dict(LCCFASD_root='./LCC_FASDcropped',
                 Celeba_root='./CelebA_Spoof',
-                Casia_root='./CASIA')
+                Casia_root='./CASIA',
+                Store_root=None)
 
 external = dict(train=dict(), val=dict(), test=dict())
 
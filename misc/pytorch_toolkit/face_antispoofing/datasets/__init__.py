@@ -1,4 +1,5 @@
 from .casia_surf import CasiaSurfDataset
 from .celeba_spoof import CelebASpoofDataset
 from .lcc_fasd import LccFasdDataset
+from .face_store import FaceStoreDataset, FaceStoreWriter
 from .database import get_datasets
@@ -77,6 +77,18 @@ class CasiaSurfDataset(Dataset):
 
         return torch.cat(images, dim=0), 1-int(label)
 
+    def get_faces(self, idx, margin=0.0):
+        """ RGB images of all modalities, the face boxes (x, y, w, h) inside them and the label """
+        img_names, label = self.items[idx]
+        images, boxes = [], []
+        for img_name in img_names:
+            img = cv.imread(os.path.join(self.dir, img_name), flags=1)
+            images.append(cv.cvtColor(img, cv.COLOR_BGR2RGB))
+            boxes.append((0, 0, img.shape[1], img.shape[0]))
+        # the stored label is the training target (1 is spoof), FaceStoreDataset also passes it to the
+        # label dependent transform, unlike __getitem__ which passes the raw label string
+        return images, boxes, [1-int(label)]
+
     def get_all_modalities(self, img_path: str, depth: bool = True, ir: bool = True) -> list:
         result = [img_path]
         if depth:
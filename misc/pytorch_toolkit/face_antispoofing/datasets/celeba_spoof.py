@@ -19,6 +19,8 @@ import numpy as np
 import torch
 from torch.utils.data import Dataset
 
+from .face_store import margin_box
+
 
 class CelebASpoofDataset(Dataset):
     def __init__(self, root_folder, test_mode=False, transform=None, multi_learning=True):
@@ -40,22 +42,14 @@ class CelebASpoofDataset(Dataset):
     def __getitem__(self, idx):
         data_item = self.data[str(idx)]
         img = cv.imread(os.path.join(self.root_folder, data_item['path']))
-        bbox = data_item['bbox']
-
-        real_h, real_w, _ = img.shape
-        x1 = clamp(int(bbox[0]*(real_w / 224)), 0, real_w)
-        y1 = clamp(int(bbox[1]*(real_h / 224)), 0, real_h)
-        w1 = int(bbox[2]*(real_w / 224))
-        h1 = int(bbox[3]*(real_h / 224))
+        x1, y1, x2, y2 = face_box(data_item['bbox'], img.shape)
 
-        cropped_face = img[y1 : clamp(y1 + h1, 0, real_h), x1 : clamp(x1 + w1, 0, real_w), :]
+        cropped_face = img[y1 : y2, x1 : x2, :]
         cropped_face = cv.cvtColor(cropped_face, cv.COLOR_BGR2RGB)
 
         if self.multi_learning:
-            labels = data_item['labels']
-            label = int(labels[43])
-            real_labels = tuple(map(int, labels[0:40]))
-            labels = [label, int(labels[40]), int(labels[41]), *real_labels]
+            labels = get_labels(data_item)
+            label = labels[0]
         else:
             labels = int(data_item['labels'][43])
             label = labels
@@ -65,5 +59,30 @@ class CelebASpoofDataset(Dataset):
         cropped_face = np.transpose(cropped_face, (2, 0, 1)).astype(np.float32)
         return (torch.tensor(cropped_face), torch.tensor(labels, dtype=torch.long))
 
+    def get_faces(self, idx, margin=0.0):
+        """ RGB face crop with margin, the face box (x, y, w, h) inside the crop and multi task labels """
+        data_item = self.data[str(idx)]
+        img = cv.imread(os.path.join(self.root_folder, data_item['path']))
+        real_h, real_w, _ = img.shape
+        x1, y1, x2, y2 = face_box(data_item['bbox'], img.shape)
+        mx1, my1, mx2, my2 = margin_box(x1, y1, x2, y2, margin, real_w, real_h)
+        cropped_face = cv.cvtColor(img[my1 : my2, mx1 : mx2, :], cv.COLOR_BGR2RGB)
+        return [cropped_face], [(x1 - mx1, y1 - my1, x2 - x1, y2 - y1)], get_labels(data_item)
+
+def face_box(bbox, shape):
+    """ Rescales bbox from the 224 space of the annotation to the image, returns x1, y1, x2, y2 """
+    real_h, real_w = shape[:2]
+    x1 = clamp(int(bbox[0]*(real_w / 224)), 0, real_w)
+    y1 = clamp(int(bbox[1]*(real_h / 224)), 0, real_h)
+    w1 = int(bbox[2]*(real_w / 224))
+    h1 = int(bbox[3]*(real_h / 224))
+    return x1, y1, clamp(x1 + w1, 0, real_w), clamp(y1 + h1, 0, real_h)
+
+def get_labels(data_item):
+    """ Spoof label followed by spoof type, illumination and 40 face attributes """
+    labels = data_item['labels']
+    real_labels = tuple(map(int, labels[0:40]))
+    return [int(labels[43]), int(labels[40]), int(labels[41]), *real_labels]
+
 def clamp(x, min_x, max_x):
     return min(max(x, min_x), max_x)
@@ -11,11 +11,13 @@
  limitations under the License.
 """
 
+import os
 from functools import partial
 
 from .celeba_spoof import CelebASpoofDataset
 from .casia_surf import CasiaSurfDataset
 from .lcc_fasd import LccFasdDataset
+from .face_store import FaceStoreDataset, INDEX
 
 def do_nothing(**args):
     pass
@@ -23,7 +25,7 @@ def do_nothing(**args):
 # import your reader and replace do_nothing with it
 external_reader=do_nothing
 
-def get_datasets(config):
+def get_datasets(config, use_store=True):
 
     celeba_root = config.datasets.Celeba_root
     lccfasd_root = config.datasets.LCCFASD_root
@@ -64,4 +66,13 @@ def get_datasets(config):
                 'external_val': partial(external_reader, **config.external.val_params),
 
                 'external_test': partial(external_reader, **config.external.test_params)}
+
+    # datasets packed by prepare_face_store.py are read from the store instead of the image files
+    store_root = config.datasets.get('Store_root')
+    if use_store and store_root:
+        for name in datasets:
+            store_dir = os.path.join(store_root, name)
+            if os.path.isfile(os.path.join(store_dir, INDEX)):
+                datasets[name] = partial(FaceStoreDataset, store_dir=store_dir,
+                                         multi_learning=config.multi_task_learning)
     return datasets
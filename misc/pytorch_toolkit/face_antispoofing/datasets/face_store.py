@@ -0,0 +1,123 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+PIXELS = 'pixels.u8'
+INDEX = 'index.npz'
+
+
+def margin_box(x1, y1, x2, y2, margin, width, height):
+    """ Box expanded by `margin` of its size on each side and clamped to the image """
+    mx, my = int(margin * (x2 - x1)), int(margin * (y2 - y1))
+    return max(x1 - mx, 0), max(y1 - my, 0), min(x2 + mx, width), min(y2 + my, height)
+
+
+class FaceStoreWriter:
+    """ Appends RGB face crops to a raw uint8 file and keeps their shapes, face boxes and labels
+
+    Every sample has the same number of images (modalities) and the same number of labels.
+    The store becomes visible only after close().
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.pixels = open(os.path.join(store_dir, PIXELS + '.tmp'), 'wb')
+        self.position = 0
+        self.offsets, self.shapes, self.boxes, self.records, self.labels = [], [], [], [], []
+
+    def add(self, images, boxes, labels):
+        records = []
+        for img, box in zip(images, boxes):
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            records.append(len(self.offsets))
+            self.offsets.append(self.position)
+            self.shapes.append(img.shape)
+            self.boxes.append(box)
+            self.pixels.write(img.tobytes())
+            self.position += img.size
+        self.records.append(records)
+        self.labels.append(labels)
+
+    def close(self):
+        self.pixels.close()
+        index_path = os.path.join(self.store_dir, INDEX)
+        num_labels = len(self.labels[0]) if self.labels else 1
+        with open(index_path + '.tmp', 'wb') as f:
+            np.savez(f,
+                     offsets=np.array(self.offsets, dtype=np.int64),
+                     shapes=np.array(self.shapes, dtype=np.int32).reshape(-1, 3),
+                     boxes=np.array(self.boxes, dtype=np.int32).reshape(-1, 4),
+                     records=np.array(self.records, dtype=np.int64),
+                     labels=np.array(self.labels, dtype=np.int16).reshape(-1, num_labels))
+        os.replace(os.path.join(self.store_dir, PIXELS + '.tmp'), os.path.join(self.store_dir, PIXELS))
+        os.replace(index_path + '.tmp', index_path)
+
+
+class FaceStoreDataset(Dataset):
+    """ Reads face crops written by prepare_face_store.py from a memory mapped file without decoding
+
+    Boxes are (x, y, w, h) of the face inside the stored crop, `margin` widens them up to the
+    margin the crops were stored with. The first label is the spoof label, the rest are the
+    CelebA Spoof attributes used in multi task learning.
+    """
+    def __init__(self, store_dir, transform=None, multi_learning=True, margin=0.0):
+        self.store_dir = store_dir
+        with np.load(os.path.join(store_dir, INDEX)) as index:
+            self.offsets = index['offsets']
+            self.shapes = index['shapes']
+            self.boxes = index['boxes']
+            self.records = index['records']
+            self.labels = index['labels']
+        self.transform = transform
+        self.multi_learning = multi_learning and self.labels.shape[1] > 1
+        self.margin = margin
+        self.pixels = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pixels'] = None
+        return state
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_face(self, record):
+        if self.pixels is None:
+            self.pixels = np.memmap(os.path.join(self.store_dir, PIXELS), dtype=np.uint8, mode='r')
+        h, w, c = self.shapes[record]
+        start = self.offsets[record]
+        img = self.pixels[start:start + h * w * c].reshape(h, w, c)
+        x, y, box_w, box_h = self.boxes[record]
+        x1, y1, x2, y2 = margin_box(x, y, x + box_w, y + box_h, self.margin, w, h)
+        return img[y1:y2, x1:x2]
+
+    def __getitem__(self, idx):
+        labels = self.labels[idx]
+        label = int(labels[0])
+        images = []
+        for record in self.records[idx]:
+            img = self.get_face(record)
+            if self.transform:
+                img = self.transform(label=label, img=img)['image']
+            img = np.transpose(img, (2, 0, 1)).astype(np.float32)
+            images.append(torch.tensor(img))
+        if self.multi_learning:
+            target = torch.tensor(labels.astype(np.int64), dtype=torch.long)
+        else:
+            target = torch.tensor(label, dtype=torch.long)
+        return torch.cat(images, dim=0), target
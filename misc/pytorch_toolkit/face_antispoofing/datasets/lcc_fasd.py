@@ -82,6 +82,13 @@ class LccFasdDataset(Dataset):
         image = np.transpose(image, (2, 0, 1)).astype(np.float32)
         return torch.tensor(image), y_label
 
+    def get_faces(self, idx, margin=0.0):
+        """ RGB face image, the face box (x, y, w, h) inside it and the label, images are already cropped """
+        image = cv.imread(os.path.join(self.root_dir, self.list_img[idx]), flags=1)
+        image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+        h, w = image.shape[:2]
+        return [image], [(0, 0, w, h)], [int(self.labels[idx])]
+
     @staticmethod
     def get_val_img(root_dir):
         name_of_real_img = filter(lambda x: x.endswith('.png') or x.endswith('.jpg'),
@@ -24,7 +24,7 @@ current_dir = osp.dirname(osp.abspath(inspect.getfile(inspect.currentframe())))
 parent_dir = osp.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 import utils
-from demo_tools import TorchCNN, VectorCNN, FaceDetector
+from demo_tools import TorchCNN, VectorCNN, FaceDetector, FramePipeline
 
 def pred_spoof(frame, detections, spoof_model):
     """Get prediction for all detected faces on the frame"""
@@ -64,19 +64,29 @@ def run(params, capture, face_det, spoof_model, write_video=False):
     fps = 24
     writer_video = cv.VideoWriter('output_video_demo.mp4', fourcc, fps, resolution)
     win_name = 'Antispoofing Recognition'
-    while cv.waitKey(1) != 27:
-        has_frame, frame = capture.read()
-        if not has_frame:
-            return
-        detections = face_det.get_detections(frame)
-        confidence = pred_spoof(frame, detections, spoof_model)
+    # capture, detection and classification of consecutive frames overlap, camera frames are dropped
+    # instead of queued when the models fall behind
+    pipeline = FramePipeline(capture, face_det,
+                             lambda frame, detections: pred_spoof(frame, detections, spoof_model),
+                             queue_size=params.queue_size, drop_frames=params.cam_id >= 0)
+    for frame, detections, confidence in pipeline:
         frame = draw_detections(frame, detections, confidence, params.spoof_thresh)
         cv.imshow(win_name, frame)
         if write_video:
             writer_video.write(cv.resize(frame, resolution))
+        if cv.waitKey(1) == 27:
+            break
     capture.release()
     writer_video.release()
     cv.destroyAllWindows()
+    log_stats(pipeline.summary())
+
+def log_stats(summary):
+    """Logs FPS and latency of every stage"""
+    log.info(f"FPS: {summary.pop('fps'):.1f}, dropped frames: {summary.pop('dropped_frames')}")
+    for stage, latency in summary.items():
+        log.info(f"{stage} latency: mean {latency['mean_ms']:.1f} ms, p50 {latency['p50_ms']:.1f} ms, "
+                 f"p95 {latency['p95_ms']:.1f} ms")
 
 def main():
     """Prepares data for the antispoofing recognition demo"""
@@ -99,6 +109,10 @@ def main():
                              'impl.', type=str, default=None)
     parser.add_argument('--write_video', type=bool, default=False,
                         help='if you set this arg to True, the video of the demo will be recoreded')
+    parser.add_argument('--spf_batch_size', type=int, default=8,
+                        help='max number of faces classified by one request of OpenVINO model')
+    parser.add_argument('--queue_size', type=int, default=2,
+                        help='number of frames waiting between the stages of the demo')
     args = parser.parse_args()
     device = args.device + f':{args.GPU}' if args.device == 'cuda' else 'cpu'
     write_video = args.write_video
@@ -124,7 +138,7 @@ def main():
         spoof_model = TorchCNN(spoof_model, args.spf_model, config, device=device)
     else:
         assert args.spf_model.endswith('.xml')
-        spoof_model = VectorCNN(args.spf_model)
+        spoof_model = VectorCNN(args.spf_model, args.device, max_batch_size=args.spf_batch_size)
     # running demo
     run(args, cap, face_detector, spoof_model, write_video)
 
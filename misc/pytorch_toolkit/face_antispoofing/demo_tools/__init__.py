@@ -1,2 +1,3 @@
 from .ie_tools import load_ie_model
 from .wrapers import TorchCNN, VectorCNN, FaceDetector
+from .pipeline import FramePipeline, LatencyStats
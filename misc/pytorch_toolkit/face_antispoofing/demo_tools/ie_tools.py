@@ -23,13 +23,13 @@ from openvino.inference_engine import IECore
 
 class IEModel:
     """Class for inference of models in the Inference Engine format"""
-    def __init__(self, exec_net, inputs_info, input_key, output_key, switch_rb=False):
+    def __init__(self, exec_net, inputs_info, input_key, output_key, switch_rb=False, dynamic_batch=False):
         self.net = exec_net
         self.inputs_info = inputs_info
         self.input_key = input_key
         self.output_key = output_key
-        self.reqs_ids = []
         self.switch_rb = switch_rb
+        self.dynamic_batch = dynamic_batch
 
     def _preprocess(self, img):
         _, _, h, w = self.get_input_shape()
@@ -43,27 +43,29 @@ class IEModel:
         res = self.net.infer(inputs={self.input_key: self._preprocess(img)})
         return np.copy(res[self.output_key])
 
-    def forward_async(self, img):
-        id = len(self.reqs_ids)
-        self.net.start_async(request_id=id,
-                             inputs={self.input_key: self._preprocess(img)})
-        self.reqs_ids.append(id)
-
-    def grab_all_async(self):
-        outputs = []
-        for id in self.reqs_ids:
-            self.net.requests[id].wait(-1)
-            res = self.net.requests[id].output_blobs[self.output_key].buffer
-            outputs.append(np.copy(res))
-        self.reqs_ids = []
-        return outputs
+    def forward_batch_async(self, imgs, request_id=0):
+        """Starts one request on a batch of images, up to the batch size of the network"""
+        batch = np.zeros(self.get_input_shape(), dtype=np.uint8)
+        for i, img in enumerate(imgs):
+            batch[i] = self._preprocess(img)[0]
+        request = self.net.requests[request_id]
+        if self.dynamic_batch:
+            # rows after len(imgs) are not computed
+            request.set_batch(len(imgs))
+        request.async_infer(inputs={self.input_key: batch})
+
+    def wait_batch(self, batch_size, request_id=0):
+        """Waits for the request and returns outputs of the first batch_size images"""
+        request = self.net.requests[request_id]
+        request.wait(-1)
+        return np.copy(request.output_blobs[self.output_key].buffer[:batch_size])
 
     def get_input_shape(self):
         """Returns an input shape of the wrapped IE model"""
         return self.inputs_info[self.input_key].input_data.shape
 
 
-def load_ie_model(model_xml, device, plugin_dir, cpu_extension='', num_reqs=1, **kwargs):
+def load_ie_model(model_xml, device, plugin_dir, cpu_extension='', num_reqs=1, max_batch_size=1, **kwargs):
     """Loads a model in the Inference Engine format"""
     # Plugin initialization for specified device and load extensions library if specified
     log.info(f"Initializing Inference Engine plugin for {device}")
@@ -82,10 +84,13 @@ def load_ie_model(model_xml, device, plugin_dir, cpu_extension='', num_reqs=1, *
     log.info("Preparing input blobs")
     input_blob = next(iter(net.input_info))
     out_blob = next(iter(net.outputs))
-    net.batch_size = 1
+    net.batch_size = max_batch_size
+    # CPU plugin can run a request on first rows of the batch only
+    dynamic_batch = max_batch_size > 1 and 'CPU' in device
+    config = {'DYN_BATCH_ENABLED': 'YES'} if dynamic_batch else {}
 
     # Loading model to the plugin
     log.info("Loading model to the plugin")
-    exec_net = IECore().load_network(network=net, device_name=device, num_requests=num_reqs)
-    model = IEModel(exec_net, net.input_info, input_blob, out_blob, **kwargs)
+    exec_net = IECore().load_network(network=net, device_name=device, config=config, num_requests=num_reqs)
+    model = IEModel(exec_net, net.input_info, input_blob, out_blob, dynamic_batch=dynamic_batch, **kwargs)
     return model
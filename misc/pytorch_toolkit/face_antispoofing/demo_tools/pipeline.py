@@ -0,0 +1,160 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+class LatencyStats:
+    """Thread safe latencies of the pipeline stages"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+
+    def add(self, stage, start):
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[stage].append(elapsed)
+
+    def summary(self):
+        """Mean, median and 95th percentile latency of each stage in milliseconds"""
+        with self.lock:
+            return {stage: {'mean_ms': 1000 * np.mean(values),
+                            'p50_ms': 1000 * np.percentile(values, 50),
+                            'p95_ms': 1000 * np.percentile(values, 95)}
+                    for stage, values in self.latencies.items() if values}
+
+
+class FramePipeline:
+    """Runs frame capture, face detection and spoof classification as overlapping stages
+
+    Every stage works in its own thread on a different frame, so the frame rate is limited by
+    the slowest stage instead of the sum of all of them. Stages are connected by queues of
+    `queue_size` frames. For a camera (`drop_frames=True`) frames are dropped when the detector
+    falls behind, so the shown frames stay fresh. All faces of a frame are classified as one batch.
+    """
+    def __init__(self, capture, face_detector, classify, queue_size=2, drop_frames=False):
+        self.capture = capture
+        self.face_detector = face_detector
+        self.classify = classify
+        self.drop_frames = drop_frames
+        self.stats = LatencyStats()
+        self.stop_event = threading.Event()
+        self.queues = [queue.Queue(queue_size) for _ in range(3)]
+        self.dropped = 0
+        self.num_frames = 0
+        self.total_time = 0.0
+        self.error = None
+
+    def read_frames(self, output):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            has_frame, frame = self.capture.read()
+            if not has_frame:
+                break
+            self.stats.add('capture', start)
+            item = {'frame': frame, 'start': time.perf_counter()}
+            if self.drop_frames:
+                try:
+                    output.put_nowait(item)
+                except queue.Full:
+                    self.dropped += 1
+            else:
+                self.put(output, item)
+        self.put(output, None)
+
+    def detect(self, input_, output):
+        while True:
+            item = self.get(input_)
+            if item is None:
+                break
+            start = time.perf_counter()
+            item['detections'] = self.face_detector.get_detections(item['frame'])
+            self.stats.add('detection', start)
+            self.put(output, item)
+        self.put(output, None)
+
+    def classify_faces(self, input_, output):
+        while True:
+            item = self.get(input_)
+            if item is None:
+                break
+            start = time.perf_counter()
+            item['confidence'] = self.classify(item['frame'], item['detections'])
+            self.stats.add('classification', start)
+            self.put(output, item)
+        self.put(output, None)
+
+    def get(self, input_):
+        """Blocking get which returns None when the pipeline is stopped"""
+        while not self.stop_event.is_set():
+            try:
+                return input_.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def put(self, output, item):
+        """Blocking put which gives up when the pipeline is stopped"""
+        while not self.stop_event.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run_stage(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as error: # pylint: disable=broad-except
+            # raised again in the consumer thread
+            self.error = error
+            self.stop()
+
+    def __iter__(self):
+        """Yields frames with their detections and confidences in the capture order"""
+        frames, detections, results = self.queues
+        stages = [(self.read_frames, frames), (self.detect, frames, detections),
+                  (self.classify_faces, detections, results)]
+        threads = [threading.Thread(target=self.run_stage, args=stage, daemon=True) for stage in stages]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        try:
+            while True:
+                item = self.get(results)
+                if item is None:
+                    break
+                self.stats.add('end_to_end', item['start'])
+                self.num_frames += 1
+                yield item['frame'], item['detections'], item['confidence']
+        finally:
+            self.total_time = time.perf_counter() - start
+            self.stop()
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        summary = self.stats.summary()
+        summary['fps'] = self.num_frames / self.total_time if self.total_time > 0 else 0.0
+        summary['dropped_frames'] = self.dropped
+        return summary
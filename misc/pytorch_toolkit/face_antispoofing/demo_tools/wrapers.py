@@ -35,7 +35,7 @@ class FaceDetector:
 
     def get_detections(self, frame):
         """Returns all detections on frame"""
-        _, _, h, w = self.net.get_input_shape().shape
+        _, _, h, w = self.net.get_input_shape()
         out = self.net.forward(cv.resize(frame, (w, h)))
         detections = self.__decode_detections(out, frame.shape)
         return detections
@@ -68,13 +68,29 @@ class FaceDetector:
         return detections
 
 class VectorCNN:
-    """Wrapper class for a nework returning a vector"""
-    def __init__(self, model_path, device='CPU', switch_rb=False):
-        self.net = load_ie_model(model_path, device, None, '', switch_rb=switch_rb)
+    """Wrapper class for a nework returning a vector
+
+    With max_batch_size > 1 the batch is split into chunks of max_batch_size images,
+    each chunk is one request and up to num_reqs chunks are in flight.
+    """
+    def __init__(self, model_path, device='CPU', switch_rb=False, max_batch_size=1, num_reqs=2):
+        self.max_batch_size = max_batch_size
+        self.num_reqs = num_reqs if max_batch_size > 1 else 1
+        self.net = load_ie_model(model_path, device, None, '', num_reqs=self.num_reqs,
+                                 max_batch_size=max_batch_size, switch_rb=switch_rb)
 
     def forward(self, batch):
         """Performs forward of the underlying network on a given batch"""
-        outputs = [self.net.forward(frame) for frame in batch]
+        if self.max_batch_size == 1:
+            return [self.net.forward(frame) for frame in batch]
+        chunks = [batch[i:i + self.max_batch_size] for i in range(0, len(batch), self.max_batch_size)]
+        outputs = []
+        for i in range(0, len(chunks), self.num_reqs):
+            group = chunks[i:i + self.num_reqs]
+            for request_id, chunk in enumerate(group):
+                self.net.forward_batch_async(chunk, request_id)
+            for request_id, chunk in enumerate(group):
+                outputs.extend(self.net.wait_batch(len(chunk), request_id))
         return outputs
 
 class TorchCNN:
@@ -99,7 +115,7 @@ class TorchCNN:
             img = img/255
             img = (img - mean)/std
             preprocessed_imges.append(img)
-        return torch.tensor(preprocessed_imges, dtype=torch.float32)
+        return torch.from_numpy(np.stack(preprocessed_imges).astype(np.float32))
 
     def forward(self, batch):
         batch = self.preprocessing(batch)
@@ -0,0 +1,64 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import argparse
+import os
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+from datasets import FaceStoreWriter, get_datasets
+from utils import read_py_config
+
+_dataset = None
+_margin = None
+
+
+def init_worker(dataset, margin):
+    global _dataset, _margin
+    _dataset, _margin = dataset, margin
+
+
+def read_faces(idx):
+    return _dataset.get_faces(idx, _margin)
+
+
+def main():
+    """Packs face crops of the datasets into memory mapped stores read by FaceStoreDataset"""
+    parser = argparse.ArgumentParser(description='prepare face store')
+    parser.add_argument('--config', type=str, default='./configs/config.py', required=False,
+                        help='path to config file with roots of the datasets')
+    parser.add_argument('--store_root', type=str, required=True,
+                        help='folder for the stores, set it as Store_root in the config to use them')
+    parser.add_argument('--datasets', type=str, nargs='+',
+                        default=['celeba_spoof_train', 'celeba_spoof_val', 'celeba_spoof_test'],
+                        help='names of the datasets from datasets/database.py')
+    parser.add_argument('--margin', type=float, default=0.2,
+                        help='part of the face size kept around the face on each side')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of decoding processes')
+    args = parser.parse_args()
+
+    config = read_py_config(args.config)
+    datasets = get_datasets(config, use_store=False)
+    for name in args.datasets:
+        dataset = datasets[name](transform=None)
+        writer = FaceStoreWriter(os.path.join(args.store_root, name))
+        with Pool(args.workers, initializer=init_worker, initargs=(dataset, args.margin)) as pool:
+            for faces in tqdm(pool.imap(read_faces, range(len(dataset)), chunksize=64),
+                              desc=name, total=len(dataset), leave=False):
+                writer.add(*faces)
+        writer.close()
+        print(f'{name}: {len(dataset)} samples are saved to {writer.store_dir}')
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,10 @@
  limitations under the License.
 """
 import sacrebleu
+import torch
+import torch.distributed as dist
 from .utils import all_gather
+from .utils.all_gather import is_dist_avail_and_initialized
 
 
 class BLEU:
@@ -54,3 +57,50 @@ class BLEU:
             self.preds.extend(preds[i])
             for j in range(self.num_refs):
                 self.refs[j].extend(refs[i][j])
+
+
+class BLEUStats:
+    """Corpus BLEU accumulated as sufficient statistics.
+
+    Each rank keeps n-gram matches/totals and hypothesis/reference lengths in a
+    small tensor, so distributed reduction is a single all_reduce instead of
+    gathering decoded strings.
+    """
+    max_ngram_order = 4
+
+    def __init__(self, num_refs=1, distributed=False):
+        assert num_refs == 1, "sufficient statistics are additive for a single reference only"
+        self.num_refs = num_refs
+        self.distributed = distributed
+        self.reset()
+
+    def add(self, preds, gt):
+        assert len(gt) == self.num_refs
+        bleu = sacrebleu.corpus_bleu(preds, gt)
+        self.stats += torch.tensor(
+            bleu.counts + bleu.totals + [bleu.sys_len, bleu.ref_len],
+            dtype=torch.long
+        )
+
+    def value(self):
+        stats = self._reduce() if self.distributed else self.stats
+        n = self.max_ngram_order
+        stats = stats.tolist()
+        metric = {
+            'bleu': sacrebleu.compute_bleu(
+                stats[:n], stats[n:2 * n], stats[2 * n], stats[2 * n + 1], smooth_method='exp'
+            ).score
+        }
+        return metric
+
+    def reset(self):
+        self.stats = torch.zeros(2 * self.max_ngram_order + 2, dtype=torch.long)
+
+    def _reduce(self):
+        """Sum of statistics over ranks, the local statistics are left unchanged."""
+        if not is_dist_avail_and_initialized():
+            return self.stats
+        device = "cuda" if dist.get_backend() == "nccl" else "cpu"
+        stats = self.stats.to(device, copy=True)
+        dist.all_reduce(stats)
+        return stats.cpu()
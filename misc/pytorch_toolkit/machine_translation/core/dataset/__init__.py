@@ -13,11 +13,13 @@
 from .nmt_dataset import NMTDataset
 from .text_container import TextContainer
 from .lmdb_container import LMDBContainer
+from .token_container import TokenContainer
 
 
 CONTAINERS = {
     "txt": TextContainer,
-    "lmdb": LMDBContainer
+    "lmdb": LMDBContainer,
+    "tokens": TokenContainer
 }
 
 def build_dataset(cfg):
@@ -0,0 +1,161 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import glob
+import json
+import queue
+import threading
+import lmdb
+from tqdm import tqdm
+from .lmdb_container import Page
+
+
+class KeyRanges:
+    """Sorted list of finished [begin, end) ranges of integer keys."""
+    def __init__(self, ranges=None):
+        self.ranges = [list(r) for r in ranges] if ranges else []
+
+    def add(self, keys):
+        for key in sorted(keys):
+            self._add_range(key, key + 1)
+
+    def update(self, other):
+        for begin, end in other.ranges:
+            self._add_range(begin, end)
+
+    def __len__(self):
+        return sum(end - begin for begin, end in self.ranges)
+
+    def missing(self, size):
+        keys, last = [], 0
+        for begin, end in self.ranges:
+            keys.extend(range(last, min(begin, size)))
+            last = max(last, end)
+        keys.extend(range(last, size))
+        return keys
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.ranges, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return KeyRanges()
+        with open(path) as f:
+            return KeyRanges(json.load(f))
+
+    def _add_range(self, begin, end):
+        ranges = []
+        for b, e in self.ranges:
+            if e < begin or b > end:
+                ranges.append([b, e])
+            else:
+                begin, end = min(b, begin), max(e, end)
+        ranges.append([begin, end])
+        ranges.sort()
+        self.ranges = ranges
+
+
+class ShardPage(Page):
+    """Page that checkpoints the keys it has committed after every store."""
+    def __init__(self, env, progress_path, page_size=100000):
+        super().__init__(env, page_size)
+        self.progress_path = progress_path
+        self.progress = KeyRanges.load(progress_path)
+        self.pending = []
+
+    def add(self, val, key=None):
+        self.pending.append(self.idx if key is None else int(key))
+        super().add(val, key)
+
+    def _store_page(self):
+        super()._store_page()
+        self.progress.add(self.pending)
+        self.progress.save(self.progress_path)
+        self.pending = []
+
+
+class ShardWriter(threading.Thread):
+    """Background thread that writes (text, key) batches into the LMDB shard of one rank."""
+    def __init__(self, shard_dir, rank, map_size=10**12, page_size=1000, max_queue=16):
+        super().__init__(daemon=True)
+        self.path = shard_path(shard_dir, rank)
+        self.progress_path = progress_path(shard_dir, rank)
+        self.map_size = map_size
+        self.page_size = page_size
+        self.queue = queue.Queue(max_queue)
+        self.error = None
+
+    def put(self, text, keys):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((text, keys))
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        finished = False
+        try:
+            env = lmdb.open(self.path, map_size=self.map_size)
+            page = ShardPage(env, self.progress_path, self.page_size)
+            while not finished:
+                item = self.queue.get()
+                if item is None:
+                    finished = True
+                    continue
+                for text, key in zip(*item):
+                    page.add(text, int(key))
+            page.close()
+            env.close()
+        except Exception as e:
+            self.error = e
+            # unblock the producer
+            while not finished:
+                finished = self.queue.get() is None
+
+
+def shard_path(shard_dir, rank):
+    return os.path.join(shard_dir, f"shard_{rank}")
+
+
+def progress_path(shard_dir, rank):
+    return os.path.join(shard_dir, f"progress_{rank}.json")
+
+
+def load_progress(shard_dir):
+    progress = KeyRanges()
+    for path in glob.glob(os.path.join(shard_dir, "progress_*.json")):
+        progress.update(KeyRanges.load(path))
+    return progress
+
+
+def merge_shards(shard_dir, output_lmdb, map_size=10**12, page_size=100000, is_tqdm=True):
+    env = lmdb.open(output_lmdb, map_size=map_size)
+    page = Page(env, page_size)
+    names = sorted(glob.glob(os.path.join(shard_dir, "shard_*")))
+    iterator = tqdm(names) if is_tqdm else names
+    for name in iterator:
+        shard = lmdb.open(name, lock=False, readonly=True)
+        with shard.begin() as txn:
+            for key, val in txn.cursor():
+                page.add(val.decode(encoding="UTF-8", errors="strict"), int(key))
+        shard.close()
+    page.close()
+    env.close()
@@ -0,0 +1,97 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import io
+import os
+import json
+import numpy as np
+from tqdm import tqdm
+from torch.utils.data import Dataset
+
+
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+
+
+class TokenContainer(Dataset):
+    """Pre-tokenized corpus stored as one flat memory-mapped array of token ids.
+
+    Sentence `i` occupies `tokens[offsets[i]:offsets[i + 1]]`. The arrays are
+    opened lazily so every DataLoader worker maps the files on its own and
+    samples are returned as zero-copy views.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.size = self.meta["size"]
+        self.tokens = None
+        self.offsets = None
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        if self.tokens is None:
+            self._open()
+        begin, end = self.offsets[idx], self.offsets[idx + 1]
+        return {"text": self.tokens[begin:end], "key": idx}
+
+    def _open(self):
+        self.tokens = np.memmap(
+            os.path.join(self.path, TOKENS_FILE),
+            dtype=self.meta["dtype"],
+            mode="r"
+        )
+        self.offsets = np.load(os.path.join(self.path, OFFSETS_FILE), mmap_mode="r")
+
+    @staticmethod
+    def from_txt(names, output, tokenizer, chunk_size=100000, is_tqdm=True):
+        os.makedirs(output, exist_ok=True)
+        dtype = np.uint16 if tokenizer.vocab_size() <= np.iinfo(np.uint16).max + 1 else np.int32
+        lengths = []
+
+        def flush(f, lines):
+            ids = tokenizer.encode_batch(lines, return_tensors=None)
+            for x in ids:
+                np.asarray(x, dtype=dtype).tofile(f)
+                lengths.append(len(x))
+
+        with open(os.path.join(output, TOKENS_FILE), "wb") as f:
+            iterator = tqdm(names) if is_tqdm else names
+            for name in iterator:
+                lines = []
+                with io.open(name, mode="r", encoding="utf-8") as corpus:
+                    for i, _line in enumerate(corpus):
+                        line = _line.rstrip("\n")
+                        if line:
+                            lines.append(line)
+                        if len(lines) == chunk_size:
+                            flush(f, lines)
+                            lines = []
+                            if is_tqdm:
+                                iterator.set_description(f"[{i}]")
+                                iterator.refresh()
+                if lines:
+                    flush(f, lines)
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(os.path.join(output, OFFSETS_FILE), offsets)
+        with open(os.path.join(output, META_FILE), "w") as f:
+            json.dump({
+                "size": len(lengths),
+                "dtype": np.dtype(dtype).name,
+                "vocab_size": tokenizer.vocab_size(),
+                "pad_idx": tokenizer.pad_idx()
+            }, f, indent=4)
@@ -70,14 +70,36 @@ class LANMT(nn.Module):
         # encoder
         out = self.encoder(src, src_mask, tgt, tgt_mask)
         latent = out["latent"] if tgt is None else out["sampled_z"]
+        out.update(self._decode(out["prior_states"], latent, src_mask, tgt_mask, max_len))
+        return out
+
+    def validation_forward(self, src, tgt, max_len=None, **kwargs):
+        """Runs the loss (tgt-conditioned) and the inference (src only) passes
+        sharing a single prior encoder pass. The inference logits are returned
+        as `inference_logits`.
+        """
+        src_mask = torch.ne(src, self.src_pad_idx).float()
+        tgt_mask = torch.ne(tgt, self.tgt_pad_idx).float()
+
+        # encoder
+        out = self.encoder(src, src_mask, tgt, tgt_mask)
+        out.update(self._decode(out["prior_states"], out["sampled_z"], src_mask, tgt_mask, max_len))
 
+        # inference reuses prior states of the encoder
+        latent = self.encoder.deterministic_sample_from_prob(out["prior_prob"])
+        inference = self._decode(out["prior_states"], latent, src_mask, None, max_len)
+        out["inference_logits"] = inference["token_predictor_logits"]
+        return out
+
+    def _decode(self, prior_states, latent, src_mask, tgt_mask=None, max_len=None):
+        out = {}
         # predict length
         out["length_predictor_logits"], delta = self.length_predictor(
-            out["prior_states"] + latent, src_mask
+            prior_states + latent, src_mask
         )
 
         # generate tgt_mask & tgt_lens
-        if tgt is not None:
+        if tgt_mask is not None:
             tgt_lens, out["tgt_mask"] = tgt_mask.sum(-1).long(), tgt_mask
         else:
             tgt_lens, out["tgt_mask"] = self.mask_generator(
@@ -89,7 +111,7 @@ class LANMT(nn.Module):
 
         # decoder
         decoder_states = self.decoder(
-            pred_emb, out["tgt_mask"], out["prior_states"], src_mask
+            pred_emb, out["tgt_mask"], prior_states, src_mask
         )
         out["token_predictor_logits"] = self.token_predictor(decoder_states)
         return out
@@ -44,9 +44,15 @@ class NMTTokenizer:
         for i in range(len(batch)):
             src.append(batch[i]["src"])
             tgt.append(batch[i]["tgt"])
-        src = self.src.encode_batch(src, return_tensors='pt')
-        tgt = self.tgt.encode_batch(tgt, return_tensors='pt')
+        src = self._collate(self.src, src)
+        tgt = self._collate(self.tgt, tgt)
         return {
             "src": src,
             "tgt": tgt
         }
+
+    @staticmethod
+    def _collate(tokenizer, batch):
+        if isinstance(batch[0], str):
+            return tokenizer.encode_batch(batch, return_tensors='pt')
+        return tokenizer.pad_batch(batch, return_tensors='pt')
@@ -11,6 +11,7 @@
  limitations under the License.
 """
 import os
+import numpy as np
 import torch
 from tokenizers import SentencePieceBPETokenizer
 from tokenizers.processors import BertProcessing
@@ -47,11 +48,25 @@ class SPBPETokenizer:
             ids = torch.LongTensor(ids)
         return ids
 
+    def pad_batch(self, batch, return_tensors='pt'):
+        """Pads already tokenized samples (e.g. from TokenContainer) to the longest one."""
+        length = min(max(len(x) for x in batch), self.max_length)
+        ids = np.full((len(batch), length), self.pad_idx(), dtype=np.int64)
+        for i, x in enumerate(batch):
+            x = x[:length]
+            ids[i, :len(x)] = x
+        if return_tensors=='pt':
+            ids = torch.from_numpy(ids)
+        return ids
+
     def decode(self, input_ids, remove_extra=True, postprocess=False):
         line = self.tokenizer.decode(
             input_ids,
             skip_special_tokens=True
         )
+        return self._clean(line, remove_extra, postprocess)
+
+    def _clean(self, line, remove_extra=True, postprocess=False):
         if remove_extra:
             line = line.replace('<s> ', '').replace('</s>', '').replace('<pad>', '').lstrip(' ')
         if postprocess:
@@ -59,10 +74,8 @@ class SPBPETokenizer:
         return line
 
     def decode_batch(self, batch, remove_extra=True, postprocess=False):
-        text = []
-        for i in range(batch.size(0)):
-            text.append(self.decode(batch[i].tolist(), remove_extra, postprocess))
-        return text
+        text = self.tokenizer.decode_batch(batch.tolist(), skip_special_tokens=True)
+        return [self._clean(line, remove_extra, postprocess) for line in text]
 
     def _postprocess(self, line):
         tokens = line.lower().split()
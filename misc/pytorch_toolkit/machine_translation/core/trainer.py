@@ -18,7 +18,7 @@ from torch.utils.data import DataLoader
 from .tokenizer import build_tokenizer
 from .dataset import build_dataset
 from .models import build_model
-from .bleu import BLEU
+from .bleu import BLEU, BLEUStats
 
 
 class NMTTrainer(pl.LightningModule):
@@ -36,7 +36,9 @@ class NMTTrainer(pl.LightningModule):
         cfg.model.params.tgt_pad_idx = self.tokenizer.pad_idx("tgt")
         self.model = build_model(cfg.model)
         # metric
-        self.metric = BLEU(
+        self.fast_validation = self.cfg.get("fast_validation", False)
+        metric = BLEUStats if self.fast_validation else BLEU
+        self.metric = metric(
             num_refs=1,
             distributed=cfg.distributed_backend == 'ddp'
         )
@@ -56,10 +58,15 @@ class NMTTrainer(pl.LightningModule):
         return {"loss": loss["loss"].unsqueeze(0)}
 
     def validation_step(self, batch, batch_idx):
-        loss = self.model.loss(**self.model(**batch), **batch)
+        if self.fast_validation:
+            out = self.model.validation_forward(**batch)
+            loss = self.model.loss(**out, **batch)
+            preds = out["inference_logits"].argmax(-1)
+        else:
+            loss = self.model.loss(**self.model(**batch), **batch)
+            out = self.model(src=batch["src"])
+            preds = out["token_predictor_logits"].softmax(-1).argmax(-1)
         # evaluate BLEU
-        out = self.model(src=batch["src"])
-        preds = out["token_predictor_logits"].softmax(-1).argmax(-1)
         preds = self.tokenizer.decode_batch(preds, 'tgt', postprocess=True)
         gt = [self.tokenizer.decode_batch(batch["tgt"], 'tgt', postprocess=True)]
         self.metric.add(preds=preds, gt=gt)
@@ -20,13 +20,11 @@ import torch.distributed as dist
 # model
 from transformers import MarianMTModel, MarianTokenizer
 # dataset
-from core.dataset.lmdb_container import LMDBContainer, Page
+from core.dataset.lmdb_container import LMDBContainer
+from core.dataset.lmdb_shards import ShardWriter, load_progress, merge_shards
 from core.dataset.text_container import TextContainer
-from torch.utils.data import DataLoader
-# lmdb
-import lmdb
+from torch.utils.data import DataLoader, Subset
 # utils
-from core.utils import all_gather
 from tqdm.autonotebook import tqdm
 
 
@@ -59,14 +57,6 @@ def main(gpu, args):
     	world_size=args.world_size,
     	rank=rank
     )
-    ############################################################
-    # Open target LMDB (rank = 0)
-    ############################################################
-    if rank == 0:
-        print(f"[{rank}] load lmdb...")
-        env = lmdb.open(args.output_lmdb, map_size=args.lmdb_map_size)
-        page = Page(env, 1000)
-
     torch.manual_seed(42)
     torch.cuda.set_device(gpu)
     ############################################################
@@ -78,25 +68,27 @@ def main(gpu, args):
     # Dataset
     ############################################################
     print(f"[{rank}] load dataset...")
-    if args.input_format == "lmdb":
-        dataset = LMDBContainer(args.input_corpus)
-    else:
-        dataset = TextContainer(args.input_corpus)
+    dataset = load_dataset(args)
+    # resume: skip keys already committed to any shard
+    keys = load_progress(args.shard_dir).missing(len(dataset))
+    chunk = (len(keys) + args.world_size - 1) // args.world_size
+    keys = keys[rank * chunk:(rank + 1) * chunk]
+    print(f"[{rank}] {len(keys)} samples left to translate")
+    dist.barrier()
     tokenizer = Tokenizer(args.langs)
-    sampler = torch.utils.data.distributed.DistributedSampler(
-    	dataset,
-    	num_replicas=args.world_size,
-    	rank=rank
-    )
     loader = DataLoader(
-        dataset=dataset,
+        dataset=Subset(dataset, keys),
         batch_size=args.batch_size,
         shuffle=False,
         num_workers=args.num_workers,
-        sampler=sampler,
         collate_fn=tokenizer
     )
     ############################################################
+    # Open shard LMDB of current rank
+    ############################################################
+    writer = ShardWriter(args.shard_dir, rank, args.lmdb_map_size, args.lmdb_page_size)
+    writer.start()
+    ############################################################
     # Translation loop
     ############################################################
     print(f"[{rank}] run loop...")
@@ -107,17 +99,17 @@ def main(gpu, args):
         with torch.no_grad():
             preds = model.generate(**sample)
         text = tokenizer.fn.batch_decode(preds, skip_special_tokens=True)
-        text = all_gather(text)
-        key = all_gather(batch["key"])
-        if rank == 0:
-            for i in range(len(text)):
-                for j in range(len(text[i])):
-                    page.add(text[i][j], key[i][j])
-    if rank == 0:
-        page.close()
+        writer.put(text, batch["key"])
+    writer.close()
     ############################################################
 
 
+def load_dataset(args):
+    if args.input_format == "lmdb":
+        return LMDBContainer(args.input_corpus)
+    return TextContainer(args.input_corpus)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-n', '--nodes', default=1, type=int, metavar='N')
@@ -132,10 +124,26 @@ if __name__ == "__main__":
     parser.add_argument('--output-lmdb', type=str, help="path to output lmdb file")
     parser.add_argument('--lmdb-map-size', type=int, default=10**12, help="lmdb map size")
     parser.add_argument('--lmdb-page-size', type=int, default=1000, help="lmdb page size")
+    # shards
+    parser.add_argument('--shard-dir', type=str, default=None,
+                        help="folder to store per-rank shards and progress, default: <output_lmdb>_shards")
+    parser.add_argument('--merge-only', action='store_true', help="merge existed shards into output lmdb")
     args = parser.parse_args()
+    if args.shard_dir is None:
+        args.shard_dir = args.output_lmdb.rstrip("/") + "_shards"
+    os.makedirs(args.shard_dir, exist_ok=True)
     #########################################################
     args.world_size = args.gpus * args.nodes
     os.environ['MASTER_ADDR'] = '127.0.0.1'
     os.environ['MASTER_PORT'] = '8888'
     #########################################################
-    mp.spawn(main, nprocs=args.gpus, args=(args,))
+    if not args.merge_only:
+        mp.spawn(main, nprocs=args.gpus, args=(args,))
+    if args.nr == 0:
+        size = len(load_dataset(args))
+        done = len(load_progress(args.shard_dir))
+        if done < size:
+            print(f"{size - done} samples are not translated yet, rerun to resume")
+        else:
+            print("merge shards...")
+            merge_shards(args.shard_dir, args.output_lmdb, args.lmdb_map_size)
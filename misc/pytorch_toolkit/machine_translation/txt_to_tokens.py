@@ -0,0 +1,28 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import argparse
+from core.dataset import TokenContainer
+from core.tokenizer import SPBPETokenizer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=str, help="path to corpus files with comma separator like path1,path2,...,pathN")
+    parser.add_argument("--tokenizer", type=str, help="path to tokenizer folder")
+    parser.add_argument("--max-length", type=int, default=150, help="max number of tokens per sentence")
+    parser.add_argument("--output", type=str, help="path to output folder")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="number of sentences tokenized at once")
+    args = parser.parse_args()
+
+    names = args.names.split(',')
+    tokenizer = SPBPETokenizer(args.tokenizer, enable_padding=False, max_length=args.max_length)
+    TokenContainer.from_txt(names, args.output, tokenizer, args.chunk_size)
@@ -19,6 +19,7 @@ import os
 import time
 import random
 import multiprocessing
+import shutil
 
 import torch
 import numpy as np
@@ -143,35 +144,208 @@ def scan_files(dataset_dir):
     return files
 
 
+#audio files of dataset folder packed into one int16 memmap with offset index.
+#cumulative sums of signal power and of 50ms window power in dB are precomputed for every HOP samples
+#to get statistics of segments without reading them
+class PackedAudio:
+    DUMP_VER = "v2"
+    #half of 50ms window used to estimate noise stationarity
+    HOP = int(0.050 * FREQ) // 2
+    #file written the last, the packed dir is complete if it exists
+    DONE_FILE = "files.txt"
+
+    def __init__(self, packed_dir):
+        self.packed_dir = packed_dir
+        self.offsets = np.load(os.path.join(packed_dir, "offsets.npy"))
+        self.hop_offsets = np.load(os.path.join(packed_dir, "hop_offsets.npy"))
+        with open(os.path.join(packed_dir, self.DONE_FILE), "rt") as inp:
+            self.file_names = [l.rstrip("\n") for l in inp.readlines()]
+        self.sizes = np.diff(self.offsets)
+        self.hops = np.diff(self.hop_offsets)
+        #every file has hops+1 rows of cumulative sums
+        self.csum_offsets = self.hop_offsets + np.arange(len(self.hop_offsets))
+        self.audio = None
+        self.csum = None
+
+    @staticmethod
+    def get_dir(dataset_dir):
+        return os.path.join(dataset_dir, "packed." + PackedAudio.DUMP_VER)
+
+    @staticmethod
+    def is_packed(packed_dir):
+        return os.path.isfile(os.path.join(packed_dir, PackedAudio.DONE_FILE))
+
+    def __len__(self):
+        return len(self.file_names)
+
+    #do not pickle memmaps, each process opens them by itself
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["audio"] = None
+        state["csum"] = None
+        return state
+
+    def _open(self):
+        self.audio = np.memmap(os.path.join(self.packed_dir, "audio.int16"), dtype=np.int16, mode="r")
+        self.csum = np.memmap(os.path.join(self.packed_dir, "csum.float64"), dtype=np.float64, mode="r")
+        self.csum = self.csum.reshape(-1, 3)
+
+    #rows of cumulative sums of power, dB and squared dB of file
+    def get_csum(self, f_idx):
+        if self.csum is None:
+            self._open()
+        return self.csum[self.csum_offsets[f_idx]:self.csum_offsets[f_idx + 1]]
+
+    def read_segment(self, f_idx, start, stop):
+        if self.audio is None:
+            self._open()
+        offset = self.offsets[f_idx]
+        sample = self.audio[offset + start:offset + stop]
+        sample = sample.astype(np.float32) * (1.0 / np.iinfo(np.int16).max)
+        return torch.from_numpy(sample)
+
+    #read random segment. if valid mask of HOP aligned starts is given then start is sampled from valid ones
+    def read_random_segment(self, f_idx, size_to_read, valid=None):
+        size = int(self.sizes[f_idx])
+        if size < size_to_read:
+            sample = self.read_segment(f_idx, 0, size)
+            pad = torch.zeros(size_to_read - size, dtype=torch.float32)
+            return torch.cat([pad,sample],-1)
+
+        if valid is not None and valid.any():
+            start = random.choice(np.flatnonzero(valid)) * self.HOP
+        else:
+            start = random.randint(0, size - size_to_read)
+        return self.read_segment(f_idx, start, start + size_to_read)
+
+    #mean power of every HOP aligned segment of size_to_read samples
+    def segment_power(self, f_idx, size_to_read):
+        csum = self.get_csum(f_idx)[:, 0]
+        hops = int(self.hops[f_idx])
+        starts = (int(self.sizes[f_idx]) - size_to_read) // self.HOP + 1
+        if starts <= 0:
+            return np.array([csum[hops] / hops if hops else 0.0])
+        wnd = size_to_read // self.HOP
+        return (csum[wnd:wnd + starts] - csum[:starts]) / wnd
+
+    #std of 50ms window power in dB of every HOP aligned segment of size_to_read samples
+    def segment_db_std(self, f_idx, size_to_read):
+        hops = int(self.hops[f_idx])
+        if hops < 3:
+            return np.zeros(1)
+        csum = self.get_csum(f_idx)
+        starts = max(1, (int(self.sizes[f_idx]) - size_to_read) // self.HOP + 1)
+        wnds = min(size_to_read // self.HOP, hops) - 1
+        s = csum[wnds:wnds + starts, 1] - csum[:starts, 1]
+        s2 = csum[wnds:wnds + starts, 2] - csum[:starts, 2]
+        var = (s2 - s * s / wnds) / max(1, wnds - 1)
+        return np.sqrt(np.maximum(var, 0))
+
+    #pack into temporary dir and move it into place at the end
+    #so interrupted or concurrent packing never leaves incomplete packed_dir
+    @staticmethod
+    def pack(dataset_dir, packed_dir=None):
+        t0 = time.time()
+        packed_dir = packed_dir if packed_dir else PackedAudio.get_dir(dataset_dir)
+        tmp_dir = "{}.tmp{}".format(packed_dir, os.getpid())
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        try:
+            files = scan_files(dataset_dir)
+            offsets = [0]
+            hop_offsets = [0]
+            with open(os.path.join(tmp_dir, "audio.int16"), "wb") as out_audio, \
+                 open(os.path.join(tmp_dir, "csum.float64"), "wb") as out_csum, \
+                 multiprocessing.Pool() as pool:
+                for audio, csum in pool.imap(pack_file_task, [f.file_name for f in files], chunksize=16):
+                    audio.tofile(out_audio)
+                    csum.tofile(out_csum)
+                    offsets.append(offsets[-1] + audio.size)
+                    hop_offsets.append(hop_offsets[-1] + csum.shape[0] - 1)
+
+            np.save(os.path.join(tmp_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+            np.save(os.path.join(tmp_dir, "hop_offsets.npy"), np.array(hop_offsets, dtype=np.int64))
+            with open(os.path.join(tmp_dir, PackedAudio.DONE_FILE), "wt") as out:
+                for f in files:
+                    out.write(f.file_name + "\n")
+
+            try:
+                os.replace(tmp_dir, packed_dir)
+            except OSError:
+                #another process has moved its complete packed dir into place
+                if not PackedAudio.is_packed(packed_dir):
+                    raise
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+        t1 = time.time()
+        printlog("{} files are packed into {} by {:.1f}s".format(len(files), packed_dir, t1 - t0))
+        return PackedAudio(packed_dir)
+
+def pack_file_task(file_name):
+    x = AudioFile(file_name=file_name).read_all().numpy()
+    audio = np.round(np.clip(x, -1, 1) * np.iinfo(np.int16).max).astype(np.int16)
+    hops = x.size // PackedAudio.HOP
+    power = (x[:hops * PackedAudio.HOP].reshape(hops, PackedAudio.HOP) ** 2).mean(1).astype(np.float32)
+    power = power.astype(np.float64)
+    #power in dB of 50ms windows, the last row repeats the sum as there is one window less than hops
+    db = 10 * np.log10(0.5 * (power[1:] + power[:-1]) + EPS)
+    csum = np.zeros((hops + 1, 3), dtype=np.float64)
+    csum[1:, 0] = np.cumsum(power)
+    csum[1:hops, 1] = np.cumsum(db)
+    csum[1:hops, 2] = np.cumsum(db * db)
+    csum[hops, 1:] = csum[hops - 1, 1:] if hops > 0 else 0
+    return audio, csum
+
+
 class DNSDataset(torch.utils.data.Dataset):
     def __init__(self,
                  dns_datasets,
                  size_to_read,
                  zero_signal_iter=5,
                  zero_signal_level=-40,
-                 non_stationary_noise_iter=5):
+                 non_stationary_noise_iter=5,
+                 packed=False):
         self.non_stationary_noise_iter = non_stationary_noise_iter
         self.zero_signal_iter = zero_signal_iter
         self.zero_signal_level = zero_signal_level
         self.size_to_read = size_to_read
+        self.packed = packed
+
+        if packed:
+            def load_packed(dataset_dir):
+                packed_dir = PackedAudio.get_dir(dataset_dir)
+                if PackedAudio.is_packed(packed_dir):
+                    return PackedAudio(packed_dir)
+                return PackedAudio.pack(dataset_dir, packed_dir)
+
+            self.files_clean = load_packed(os.path.join(dns_datasets, "clean"))
+            self.files_noise = load_packed(os.path.join(dns_datasets, "noise"))
+            sizes_clean = self.files_clean.sizes
+            sizes_noise = self.files_noise.sizes
+        else:
+            self.files_clean = scan_files(os.path.join(dns_datasets, "clean"))
+            self.files_noise = scan_files(os.path.join(dns_datasets, "noise"))
+            sizes_clean = [f.size for f in self.files_clean]
+            sizes_noise = [f.size for f in self.files_noise]
 
-        self.files_clean = scan_files(os.path.join(dns_datasets, "clean"))
-        self.files_noise = scan_files(os.path.join(dns_datasets, "noise"))
-
-        def make_idx(files):
+        def make_idx(sizes):
             idx = []
-            for f_idx, f in enumerate(files):
-                idx += [f_idx] * max(1, f.size // self.size_to_read)
+            for f_idx, size in enumerate(sizes):
+                idx += [f_idx] * max(1, int(size) // self.size_to_read)
             random.shuffle(idx)
             return idx
 
-        self.idx_clean = make_idx(self.files_clean)
-        self.idx_noise = make_idx(self.files_noise)
+        self.idx_clean = make_idx(sizes_clean)
+        self.idx_noise = make_idx(sizes_noise)
 
     def __len__(self):
         return len(self.idx_clean)
 
     def __getitem__(self, sample_i):
+        if self.packed:
+            return self.getitem_packed(sample_i)
 
         f_clean_idx = self.idx_clean[sample_i]
         f_clean = self.files_clean[f_clean_idx]
@@ -212,3 +386,26 @@ class DNSDataset(torch.utils.data.Dataset):
                 break
 
         return x_noise, x_clean
+
+    #the same sampling as __getitem__ but empty clean and stationary noise segments
+    #are rejected by precomputed power lookup instead of reading them
+    def getitem_packed(self, sample_i):
+        f_clean_idx = self.idx_clean[sample_i]
+
+        valid = None
+        if self.zero_signal_iter > 0:
+            ms_threshold = 10 ** (self.zero_signal_level / 10)# signal less than -40 db is empty
+            valid = self.files_clean.segment_power(f_clean_idx, self.size_to_read) >= ms_threshold
+        x_clean = self.files_clean.read_random_segment(f_clean_idx, self.size_to_read, valid)
+
+        #sample nonstantionary noise
+        nsni = self.non_stationary_noise_iter
+        while True:
+            f_noise_idx = random.choice(self.idx_noise)
+            valid = self.files_noise.segment_db_std(f_noise_idx, self.size_to_read) >= 3
+            if valid.any() or nsni <= 0:
+                break
+            nsni = nsni - 1
+        x_noise = self.files_noise.read_random_segment(f_noise_idx, self.size_to_read, valid)
+
+        return x_noise, x_clean
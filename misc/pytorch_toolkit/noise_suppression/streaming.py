@@ -0,0 +1,178 @@
+"""
+ Copyright (c) 2021 Intel Corporation
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import argparse
+import logging
+import os
+import time
+import wave
+
+import numpy as np
+import torch
+
+import models
+from dataset import AudioFile, FREQ
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S',level=logging.INFO)
+logger = logging.getLogger('{} streaming'.format(os.getpid()))
+def printlog(*args):
+    logger.info(' '.join([str(v) for v in args]))
+
+
+#run model chunk by chunk and carry states between chunks like the demo does with IR
+class StreamingDenoiser:
+    def __init__(self, model, device="cpu"):
+        self.model = model.to(device).eval()
+        self.device = device
+        #the smallest input size model can process
+        self.hop_size = model.get_sample_length_ceil(1)
+        #output is delayed by this number of samples relative to input
+        self.delay = model.get_sample_ahead()
+        self.states = self._allocate_states()
+        self.latencies = []
+
+    def _allocate_states(self):
+        chunk = torch.zeros((1, self.hop_size), dtype=torch.float, device=self.device)
+        with torch.no_grad():
+            _, _, states = self.model(chunk)
+        return [torch.zeros_like(s) for s in states]
+
+    def reset(self):
+        for s in self.states:
+            s.zero_()
+        self.latencies = []
+
+    #process one hop_size chunk [T] or [B,T] and return denoised chunk of the same shape
+    def process(self, chunk):
+        squeeze = chunk.dim() == 1
+        if squeeze:
+            chunk = chunk.unsqueeze(0)
+        assert chunk.shape[-1] == self.hop_size, \
+            "chunk size {} != hop size {}".format(chunk.shape[-1], self.hop_size)
+
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            y, _, states = self.model(chunk.to(self.device), self.states)
+            #copy new states into preallocated buffers to reuse them on next chunk
+            for s_buf, s in zip(self.states, states):
+                s_buf.copy_(s)
+        self.latencies.append(time.perf_counter() - t0)
+
+        return y[0] if squeeze else y
+
+    #denoise whole signal [T] chunk by chunk. output has the same delay as offline model output
+    def process_signal(self, x):
+        size = x.shape[-1]
+        pad = -size % self.hop_size
+        if pad > 0:
+            x = torch.nn.functional.pad(x, (0, pad), mode='constant', value=0)
+        outputs = [self.process(chunk) for chunk in torch.split(x, self.hop_size, dim=-1)]
+        return torch.cat(outputs, -1)[..., :size]
+
+    def get_stats(self):
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies)
+        chunk_time = self.hop_size / FREQ
+        return {
+            "chunks": len(latencies),
+            "chunk_ms": 1000 * chunk_time,
+            "latency_mean_ms": 1000 * float(latencies.mean()),
+            "latency_p95_ms": 1000 * float(np.percentile(latencies, 95)),
+            "latency_max_ms": 1000 * float(latencies.max()),
+            "rtf": float(latencies.mean()) / chunk_time
+        }
+
+
+#compare streamed output with offline output for the same signal
+def check_streaming(model, x, atol=1e-4, device="cpu"):
+    denoiser = StreamingDenoiser(model, device)
+    pad = -x.shape[-1] % denoiser.hop_size
+    x = torch.nn.functional.pad(x, (0, pad), mode='constant', value=0)
+
+    with torch.no_grad():
+        y_offline = denoiser.model(x.unsqueeze(0).to(device))[0][0]
+    y_stream = denoiser.process_signal(x)
+
+    max_diff = (y_offline - y_stream).abs().max().item()
+    return max_diff <= atol, max_diff
+
+
+def write_wav(file_name, y):
+    y = (y.clamp(-1, 1) * np.iinfo(np.int16).max).cpu().numpy().astype(np.int16)
+    with wave.open(file_name, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(FREQ)
+        wav.writeframes(y.tobytes())
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        required=True,
+        help="directory with trained model")
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=True,
+        help="noisy wav file to denoise")
+    parser.add_argument(
+        "--output",
+        default=None,
+        type=str,
+        help="wav file to save denoised signal")
+    parser.add_argument(
+        "--check",
+        action='store_true',
+        help="compare streamed output with offline output")
+    parser.add_argument(
+        "--atol",
+        default=1e-4,
+        type=float,
+        help="tolerance for streamed and offline output difference")
+    parser.add_argument(
+        "--no_cuda",
+        action='store_true',
+        help="Disable GPU calculation")
+    args = parser.parse_args(args)
+
+    device = "cuda" if torch.cuda.is_available() and not args.no_cuda else "cpu"
+    model = models.model_from_dir(args.model_dir)
+    x = AudioFile(args.input).read_all()
+
+    denoiser = StreamingDenoiser(model, device)
+    y = denoiser.process_signal(x)
+    #shift output by delay to be aligned with input
+    y = y[denoiser.delay:]
+    for n, v in denoiser.get_stats().items():
+        printlog("{} - {}".format(n, v))
+
+    if args.output:
+        write_wav(args.output, y)
+
+    if args.check:
+        ok, max_diff = check_streaming(model, x, args.atol, device)
+        printlog("streamed vs offline max abs diff {} {}".format(max_diff, "OK" if ok else "FAIL"))
+        if not ok:
+            raise RuntimeError("streamed output differs from offline output by {}".format(max_diff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+ Copyright (c) 2021 Intel Corporation
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import os
+import unittest
+import wave
+from tempfile import mkdtemp
+import numpy as np
+import torch
+from dataset import DNSDataset, PackedAudio, FREQ, EPS
+
+
+
+def write_wav(file_name, size, scale, rng):
+    data = (rng.standard_normal(size) * scale).clip(-32767, 32767).astype(np.int16)
+    with wave.open(file_name, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(FREQ)
+        wav.writeframes(data.tobytes())
+
+
+class TestPackedDataset(unittest.TestCase):
+    def test_packed_is_same_as_files(self):
+        rng = np.random.default_rng(42)
+        dns_datasets = mkdtemp()
+        for folder in ["clean", "noise"]:
+            os.makedirs(os.path.join(dns_datasets, folder))
+            for i, size in enumerate([FREQ + 123, 3 * FREQ, 1000]):
+                file_name = os.path.join(dns_datasets, folder, "{}.wav".format(i))
+                write_wav(file_name, size, 10 ** (i + 1), rng)
+
+        size_to_read = FREQ // 2
+        dataset_files = DNSDataset(dns_datasets, size_to_read)
+        dataset_packed = DNSDataset(dns_datasets, size_to_read, packed=True)
+        self.assertEqual(True, PackedAudio.is_packed(PackedAudio.get_dir(os.path.join(dns_datasets, "clean"))))
+
+        for files, packed in [(dataset_files.files_clean, dataset_packed.files_clean),
+                              (dataset_files.files_noise, dataset_packed.files_noise)]:
+            self.assertEqual(len(files), len(packed))
+            for f_idx, f in enumerate(files):
+                x = f.read_all()
+                self.assertEqual(True, torch.equal(x, packed.read_segment(f_idx, 0, f.size)))
+
+                if f.size < size_to_read:
+                    continue
+                power = packed.segment_power(f_idx, size_to_read)
+                db_std = packed.segment_db_std(f_idx, size_to_read)
+                for i, start in enumerate(range(0, f.size - size_to_read + 1, PackedAudio.HOP)):
+                    segment = x[start:start + size_to_read]
+                    self.assertAlmostEqual(segment.pow(2).mean().item(), power[i], delta=1e-5 * power[i])
+
+                    rms_wnd_size = int(0.050 * FREQ)
+                    rms2 = torch.nn.functional.avg_pool1d(segment.pow(2)[None,None,:],
+                                                          rms_wnd_size, stride=rms_wnd_size//2)
+                    db = 10 * torch.log10(rms2+EPS)
+                    self.assertAlmostEqual(torch.std(db).item(), db_std[i], places=3)
+
+        x_noise, x_clean = dataset_packed[0]
+        self.assertEqual((size_to_read,), tuple(x_noise.shape))
+        self.assertEqual((size_to_read,), tuple(x_clean.shape))
+
+        #packed data is reused by the next run
+        dataset_packed = DNSDataset(dns_datasets, size_to_read, packed=True)
+        self.assertEqual(len(dataset_files), len(dataset_packed))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+ Copyright (c) 2021 Intel Corporation
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import unittest
+import torch
+from models import model_create
+from streaming import StreamingDenoiser, check_streaming
+
+
+
+class TestStreaming(unittest.TestCase):
+    def test_streaming(self):
+        torch.manual_seed(42)
+        model = model_create("config.json")
+        denoiser = StreamingDenoiser(model)
+
+        x = 0.1 * torch.randn(3 * denoiser.hop_size + 100)
+        ok, max_diff = check_streaming(model, x)
+        self.assertEqual(True, ok, "streamed output differs from offline output by {}".format(max_diff))
+
+        y = denoiser.process_signal(x)
+        self.assertEqual(x.shape, y.shape)
+        self.assertEqual(4, denoiser.get_stats()["chunks"])
+
+if __name__ == '__main__':
+    unittest.main()
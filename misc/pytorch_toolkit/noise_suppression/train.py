@@ -369,7 +369,7 @@ def process(rank, args, port):
     # only one process scan folders then share info to other
     if rank in [-1, 0]:
         printlog("create train dataset from", args.dns_datasets)
-        dataset_train = dataset.DNSDataset(args.dns_datasets, size_to_read=size_to_read )
+        dataset_train = dataset.DNSDataset(args.dns_datasets, size_to_read=size_to_read, packed=args.packed)
 
     if rank>-1:
         #lets sync after data creation
@@ -455,6 +455,10 @@ def main(args=None):
         default=None,
         required=True,
         help="DNS-Chalange datasets directory")
+    parser.add_argument(
+        "--packed",
+        action='store_true',
+        help="pack clean and noise audio into int16 memmaps with precomputed segment power (once) and train on them")
     parser.add_argument(
         "--eval_data",
         default=None,
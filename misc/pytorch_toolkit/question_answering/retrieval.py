@@ -0,0 +1,224 @@
+"""
+ Copyright (c) 2020 Intel Corporation
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import argparse
+import logging
+import os
+import timeit
+import numpy as np
+import torch
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s',datefmt='%Y-%m-%d %H:%M:%S',level=logging.INFO)
+logger = logging.getLogger('{} retrieval'.format(os.getpid()))
+def printlog(*args):
+    logger.info(' '.join([str(v) for v in args]))
+
+
+def exact_topk(q_vec, c_vec, k, batch_size=1024):
+    """ top-k nearest contexts (L2) for each question computed by matmul for batches of questions """
+    q_vec = torch.as_tensor(q_vec)
+    c_vec = torch.as_tensor(c_vec).to(q_vec.device)
+    k = min(k, c_vec.shape[0])
+    c_norm = c_vec.pow(2).sum(1)
+    dist_all, index_all = [], []
+    for s in range(0, q_vec.shape[0], batch_size):
+        q = q_vec[s:s + batch_size]
+        #|q|^2 does not change order of contexts for question so it is added only for returned distances
+        d = c_norm.unsqueeze(0) - 2 * torch.matmul(q, c_vec.t())
+        d, index = torch.topk(d, k, dim=1, largest=False, sorted=True)
+        dist_all.append(d + q.pow(2).sum(1, keepdim=True))
+        index_all.append(index)
+    return torch.cat(dist_all), torch.cat(index_all)
+
+
+def _sq_dist(x, centroids):
+    return (x * x).sum(1, keepdims=True) - 2 * x.dot(centroids.T) + (centroids * centroids).sum(1)[None, :]
+
+
+def kmeans(x, k, iters=20, seed=0, batch_size=65536):
+    rng = np.random.RandomState(seed)
+    centroids = x[rng.choice(x.shape[0], k, replace=x.shape[0] < k)].copy()
+    for _ in range(iters):
+        assign = assign_nearest(x, centroids, batch_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        #reinit empty clusters by random points
+        if empty.any():
+            centroids[empty] = x[rng.choice(x.shape[0], empty.sum())]
+    return centroids
+
+
+def assign_nearest(x, centroids, batch_size=65536):
+    return np.concatenate([
+        _sq_dist(x[s:s + batch_size], centroids).argmin(1)
+        for s in range(0, x.shape[0], batch_size)
+    ]).astype(np.int64)
+
+
+class IVFPQIndex:
+    """ inverted file index with product quantization of residuals
+
+    Contexts are assigned to nlist coarse centroids. Residuals to the centroid are split
+    into m sub vectors and each one is encoded by uint8 code of sub quantizer with 256 centroids.
+    Search visits nprobe nearest lists and scores their codes by lookup tables (ADC).
+    """
+    def __init__(self, nlist=64, m=8, nbits=8, nprobe=8):
+        self.nlist = nlist
+        self.m = m
+        self.ksub = 2 ** nbits
+        assert self.ksub <= 256, "codes are stored as uint8"
+        self.nprobe = nprobe
+        self.coarse = None
+        self.pq = None
+        self.codes = None
+        self.ids = None
+        self.list_offsets = None
+
+    def train(self, x, iters=20, seed=0):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        d = x.shape[1]
+        assert d % self.m == 0, "dimension {} is not divisible by m={}".format(d, self.m)
+        self.coarse = kmeans(x, self.nlist, iters, seed)
+        residuals = x - self.coarse[assign_nearest(x, self.coarse)]
+        dsub = d // self.m
+        self.pq = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], self.ksub, iters, seed + j + 1)
+            for j in range(self.m)
+        ])
+        return self
+
+    def add(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        assign = assign_nearest(x, self.coarse)
+        residuals = x - self.coarse[assign]
+        dsub = x.shape[1] // self.m
+        codes = np.stack([
+            assign_nearest(residuals[:, j * dsub:(j + 1) * dsub], self.pq[j])
+            for j in range(self.m)
+        ], 1).astype(np.uint8)
+
+        #keep codes sorted by list to have one contiguous slice per list
+        order = np.argsort(assign, kind='stable')
+        self.codes = codes[order]
+        self.ids = order.astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.nlist))])
+        return self
+
+    def search(self, q, k, nprobe=None):
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.nlist)
+        q = np.ascontiguousarray(q, dtype=np.float32)
+        dsub = q.shape[1] // self.m
+        probes = np.argsort(_sq_dist(q, self.coarse), axis=1)[:, :nprobe]
+
+        dist = np.full((q.shape[0], k), np.inf, dtype=np.float32)
+        index = np.full((q.shape[0], k), -1, dtype=np.int64)
+        for qi in range(q.shape[0]):
+            cand_d, cand_i = [], []
+            for li in probes[qi]:
+                s, e = self.list_offsets[li], self.list_offsets[li + 1]
+                if s == e:
+                    continue
+                r = q[qi] - self.coarse[li]
+                #[m, ksub] distances from residual sub vectors to sub quantizers centroids
+                table = ((self.pq - r.reshape(self.m, 1, dsub)) ** 2).sum(2)
+                cand_d.append(table[np.arange(self.m), self.codes[s:e]].sum(1))
+                cand_i.append(self.ids[s:e])
+            if not cand_d:
+                continue
+            cand_d = np.concatenate(cand_d)
+            cand_i = np.concatenate(cand_i)
+            n = min(k, cand_d.shape[0])
+            top = np.argpartition(cand_d, n - 1)[:n]
+            top = top[np.argsort(cand_d[top])]
+            dist[qi, :n] = cand_d[top]
+            index[qi, :n] = cand_i[top]
+        return dist, index
+
+    def save(self, path):
+        np.savez(
+            path,
+            params=np.array([self.nlist, self.m, self.ksub, self.nprobe]),
+            coarse=self.coarse,
+            pq=self.pq,
+            codes=self.codes,
+            ids=self.ids,
+            list_offsets=self.list_offsets)
+
+    @staticmethod
+    def load(path):
+        data = np.load(path)
+        nlist, m, ksub, nprobe = [int(v) for v in data['params']]
+        index = IVFPQIndex(nlist, m, int(np.log2(ksub)), nprobe)
+        index.coarse = data['coarse']
+        index.pq = data['pq']
+        index.codes = data['codes']
+        index.ids = data['ids']
+        index.list_offsets = data['list_offsets']
+        return index
+
+
+def benchmark(index, q_vec, c_vec, k=10, nprobe=None):
+    """ recall@k of the index relative to exact search and search latency per question """
+    q_vec = np.asarray(q_vec, dtype=np.float32)
+
+    start_time = timeit.default_timer()
+    _, exact = exact_topk(torch.from_numpy(q_vec), torch.as_tensor(c_vec, dtype=torch.float32), k)
+    exact_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    _, approx = index.search(q_vec, k, nprobe)
+    approx_time = timeit.default_timer() - start_time
+
+    exact = exact.numpy()
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+    return {
+        "recall@{}".format(k): hits / exact.size,
+        "exact_ms_per_query": 1000 * exact_time / len(q_vec),
+        "ivfpq_ms_per_query": 1000 * approx_time / len(q_vec),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=str, required=True, help="npy file with context embeddings [C, D]")
+    parser.add_argument("--questions", type=str, required=True, help="npy file with question embeddings [Q, D]")
+    parser.add_argument("--index", type=str, default=None, help="npz file to load IVF-PQ index from or save trained one to")
+    parser.add_argument("--nlist", default=64, type=int, help="number of inverted lists")
+    parser.add_argument("--m", default=8, type=int, help="number of sub quantizers")
+    parser.add_argument("--nprobe", default=8, type=int, help="number of lists to visit per question")
+    parser.add_argument("--top", default=10, type=int, help="number of contexts to retrieve per question")
+    args = parser.parse_args()
+
+    c_vec = np.load(args.contexts).astype(np.float32)
+    q_vec = np.load(args.questions).astype(np.float32)
+
+    if args.index and os.path.isfile(args.index):
+        printlog("load index from", args.index)
+        index = IVFPQIndex.load(args.index)
+    else:
+        start_time = timeit.default_timer()
+        index = IVFPQIndex(args.nlist, args.m, nprobe=args.nprobe).train(c_vec).add(c_vec)
+        printlog("index is built in {:.1f}s".format(timeit.default_timer() - start_time))
+        if args.index:
+            index.save(args.index)
+            printlog("index is saved to", args.index)
+
+    for n, v in benchmark(index, q_vec, c_vec, args.top, args.nprobe).items():
+        printlog(n, v)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,21 +11,26 @@
  limitations under the License.
 """
 
+import argparse
+import functools
+import json
+import time
 import unicodedata
 import string
+
+# remove mark and control chars
+def clean_word(w):
+    wo = ""  # accumulator for output word
+    for c in unicodedata.normalize("NFD", w):
+        c_cat = unicodedata.category(c)
+        # remove mark nonspacing code and controls
+        if c_cat != "Mn" and c_cat[0] != "C":
+            wo += c
+    return wo
+
 # split word by vocab items and get tok codes
 # iterativly return codes
 def encode_by_voc(w,vocab):
-    # remove mark and control chars
-    def clean_word(w):
-        wo = ""  # accumulator for output word
-        for c in unicodedata.normalize("NFD", w):
-            c_cat = unicodedata.category(c)
-            # remove mark nonspacing code and controls
-            if c_cat != "Mn" and c_cat[0] != "C":
-                wo += c
-        return wo
-
     w = clean_word(w)
 
     res = []
@@ -61,12 +66,70 @@ def split_to_words(text):
             yield i, i+1
         prev_is_sep = cur_is_sep
 
+# greedy longest-match-first WordPiece encoder with the same output as encode_by_voc
+# vocab items are stored in char tries and encoded words are cached
+class WordPieceEncoder:
+    def __init__(self, vocab, cache_size=2**16):
+        self.vocab = vocab
+        self.unk = vocab['[UNK]']
+        # separate tries for word start pieces and for ## continuation pieces
+        self.trie_start = {}
+        self.trie_cont = {}
+        for token, token_id in vocab.items():
+            if token.startswith("##"):
+                self._add(self.trie_cont, token[2:], token_id)
+            else:
+                self._add(self.trie_start, token, token_id)
+        self.encode_word = functools.lru_cache(maxsize=cache_size)(self._encode_word)
+
+    @staticmethod
+    def _add(trie, token, token_id):
+        node = trie
+        for c in token:
+            node = node.setdefault(c, {})
+        node[None] = token_id
+
+    #return id and end of the longest vocab item that starts from s position of w
+    @staticmethod
+    def _longest(trie, w, s, e0):
+        node = trie
+        best_id, best_e = None, s
+        for i in range(s, e0):
+            node = node.get(w[i])
+            if node is None:
+                break
+            token_id = node.get(None)
+            if token_id is not None:
+                best_id, best_e = token_id, i + 1
+        return best_id, best_e
+
+    def _encode_word(self, w):
+        # ascii printable word has no marks and control chars to remove
+        if not (w.isascii() and w.isprintable()):
+            w = clean_word(w)
+
+        res = []
+        for s0, e0 in split_to_words(w):
+            s, trie = s0, self.trie_start
+            tokens = []
+            while s < e0:
+                token_id, s = self._longest(trie, w, s, e0)
+                if token_id is None:
+                    tokens = [self.unk]
+                    break
+                tokens.append(token_id)
+                trie = self.trie_cont
+            res.extend(tokens)
+        return tuple(res)
+
 # get big text and return list of token id and start-end positions for each id in original texts
 def text_to_tokens(text, vocab_or_tokenizer):
     tokens_id = []
     tokens_se = []
     for s, e in split_to_words(text):
-        if hasattr(vocab_or_tokenizer, 'encode'):
+        if isinstance(vocab_or_tokenizer, WordPieceEncoder):
+            toks = vocab_or_tokenizer.encode_word(text[s:e])
+        elif hasattr(vocab_or_tokenizer, 'encode'):
             #vocab_or_tokenizer is tokenizer
             toks = vocab_or_tokenizer.encode(text[s:e], add_special_tokens=False)
         else:
@@ -78,3 +141,48 @@ def text_to_tokens(text, vocab_or_tokenizer):
             tokens_se.append( (s, e) )
 
     return tokens_id, tokens_se
+
+
+#compare WordPieceEncoder with encode_by_voc on SQuAD texts
+def benchmark(texts, vocab):
+    t0 = time.perf_counter()
+    ref = [text_to_tokens(t, vocab) for t in texts]
+    t1 = time.perf_counter()
+    encoder = WordPieceEncoder(vocab)
+    t2 = time.perf_counter()
+    res = [text_to_tokens(t, encoder) for t in texts]
+    t3 = time.perf_counter()
+    return {
+        "texts": len(texts),
+        "encode_by_voc_sec": t1 - t0,
+        "wordpiece_encoder_build_sec": t2 - t1,
+        "wordpiece_encoder_sec": t3 - t2,
+        "speedup": (t1 - t0) / (t3 - t2),
+        "equal": ref == res
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--squad_data", type=str, required=True, help="SQuAD json. E.g., dev-v1.1.json")
+    parser.add_argument("--vocab", type=str, required=True, help="BERT vocab.txt file")
+    parser.add_argument("--do_lower_case", action='store_true', help="lower case texts before encoding")
+    args = parser.parse_args()
+
+    with open(args.vocab, 'rt', encoding='utf-8') as inp:
+        vocab = {l.rstrip('\n'): i for i, l in enumerate(inp)}
+    with open(args.squad_data, 'rt') as inp:
+        squad = json.load(inp)
+
+    texts = []
+    for article in squad['data']:
+        for par in article['paragraphs']:
+            texts.append(par['context'])
+            texts.extend(qa['question'] for qa in par['qas'])
+    if args.do_lower_case:
+        texts = [t.lower() for t in texts]
+
+    for n, v in benchmark(texts, vocab).items():
+        print(n, v)
+
+if __name__ == "__main__":
+    main()
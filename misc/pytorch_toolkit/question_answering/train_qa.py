@@ -359,6 +359,29 @@ def evaluate(args, model, dataset_qa):
         args.squad_eval_script
     )
 
+# find the best start-end pair inside context for each sample of batch
+# context is tokens between the first and the second [SEP] tokens
+# return start, end relative to context start and score = score_s[start] * score_e[end]
+def find_best_spans(score_s, score_e, tokens, sep, max_answer_length):
+    B, L = score_s.shape
+    is_sep = tokens == sep
+    c_mask = (is_sep.cumsum(1) == 1) & ~is_sep
+    c_start = is_sep.float().argmax(1) + 1
+
+    # reset candidates outside of context
+    ss = score_s * c_mask
+    se = score_e * c_mask
+
+    # [B,L,max_answer_length] scores for all ends e in [s, s + max_answer_length) for each start s
+    se = torch.nn.functional.pad(se, (0, max_answer_length - 1))
+    score_mat = ss.unsqueeze(2) * se.unfold(1, max_answer_length, 1)
+
+    # find the best start-end pair
+    score, pos = score_mat.reshape(B, -1).max(1)
+    max_s = pos // max_answer_length
+    max_e = max_s + pos % max_answer_length
+    return max_s - c_start, max_e - c_start, score
+
 def evaluate_qa(model, squad_dataset, eval_batch_size, squad_eval_script ):
     max_answer_length = 30
 
@@ -381,36 +404,20 @@ def evaluate_qa(model, squad_dataset, eval_batch_size, squad_eval_script ):
 
         with torch.no_grad():
             res = model(**inputs)
-            score_s = torch.nn.functional.softmax(res[0], dim=-1).cpu().numpy()
-            score_e = torch.nn.functional.softmax(res[1], dim=-1).cpu().numpy()
-
-        for i in range(score_s.shape[0]):
-            tokens, sample_i = batch[0][i], batch[3][i]
-            ss, se = score_s[i], score_e[i]
+            score_s = torch.nn.functional.softmax(res[0], dim=-1)
+            score_e = torch.nn.functional.softmax(res[1], dim=-1)
             sep = squad_dataset.get_vocab()['[SEP]']
+            spans = find_best_spans(score_s, score_e, inputs['input_ids'], sep, max_answer_length)
+            score_cls = (score_s[:, 0] * score_e[:, 0]).cpu().numpy()
+            spans = [t.cpu().numpy() for t in spans]
 
-            # find product of all start-end combinations to find the best one
-            sep_pos = [i for i,t in enumerate(tokens) if t == sep]
-            c_slice = slice(sep_pos[0]+1, sep_pos[1])
-            score_mat = np.matmul(
-                ss[c_slice][:,None],
-                se[c_slice][None,:]
-            )
-            # reset candidates with end before start
-            score_mat = np.triu(score_mat)
-            # reset long candidates (>max_answer_token_num)
-            score_mat = np.tril(score_mat, max_answer_length - 1)
-            # find the best start-end pair
-            max_s, max_e = divmod(score_mat.flatten().argmax(), score_mat.shape[1])
-
-            score = score_mat[max_s, max_e]
-            pred, qid = squad_dataset.get_text_and_qid(sample_i, max_s, max_e)
-
+        for i, (max_s, max_e, score) in enumerate(zip(*spans)):
+            pred, qid = squad_dataset.get_text_and_qid(batch[3][i], max_s, max_e)
 
             if qid not in answers or score > answers_score[qid]:
                 answers[qid] = pred
                 answers_score[qid] = score
-                no_answers_score[qid] = (se[0] * ss[0]) / score
+                no_answers_score[qid] = score_cls[i] / score
 
     dataset = squad_dataset.get_squad()['data']
     dataset_ver = squad_dataset.get_squad()['version']
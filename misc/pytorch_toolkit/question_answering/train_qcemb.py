@@ -19,6 +19,7 @@ import os
 import timeit
 import time
 import utils
+import retrieval
 import numpy as np
 
 
@@ -561,20 +562,14 @@ def evaluate_embeddings(model, dataset_qc, eval_batch_size):
     count_top =  collections.OrderedDict([(k,0) for k in [1,5,10,100,200]])
     top_max = max(count_top.keys())
 
-    for q_index, q_sample in enumerate(dataset_qc.q_dataset):
-        context_ids_pos = q_sample[3]
-        qv = q_vec[q_index]
+    #find top contexts for batches of questions by one matmul per batch
+    _, index = retrieval.exact_topk(q_vec, c_vec, top_max, batch_size=eval_batch_size)
 
-        d = c_vec - qv.unsqueeze(0)
-        p = -d.norm(2,dim=1)
-
-        val, index = torch.topk(p,top_max,sorted=True)
-
-        #count hits for each topN
-        index = index.cpu()
-        for top in count_top.keys():
-            if context_ids_pos in index[0:top]:
-                count_top[top] += 1
+    #count hits for each topN
+    context_ids_pos = dataset_qc.q_dataset.tensors[3].to(index.device)
+    hits = index == context_ids_pos.unsqueeze(1)
+    for top in count_top.keys():
+        count_top[top] = hits[:, :top].any(1).sum().item()
 
     result = collections.OrderedDict(
         [("top{}_neg{}".format(top, len(dataset_qc.c_dataset)-1), count_top[top] / len(dataset_qc.q_dataset)) for top in count_top.keys() ]
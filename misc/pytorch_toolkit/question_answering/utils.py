@@ -54,11 +54,11 @@ def sync_grads(rank, named_params, report_no_grad_params=True):
         torch.distributed.all_reduce(p.grad.data, op=torch.distributed.ReduceOp.SUM)
         p.grad.data /= float(world_size)
 
-def encode_squad_article(article, vocab, do_lower_case):
+def encode_squad_article(article, vocab_or_encoder, do_lower_case):
     def encode_txt(txt):
         if do_lower_case:
             txt = txt.lower()
-        return tokens_bert.text_to_tokens(txt, vocab)
+        return tokens_bert.text_to_tokens(txt, vocab_or_encoder)
 
     for par in article['paragraphs']:
         par['context_enc'], par['context_enc_pos'] = encode_txt(par['context'])
@@ -68,6 +68,15 @@ def encode_squad_article(article, vocab, do_lower_case):
     return article
 
 
+#WordPiece encoder is created once per pool process instead of sending vocab with each article
+_encoder = None
+def init_encoder(vocab):
+    global _encoder
+    _encoder = tokens_bert.WordPieceEncoder(vocab)
+
+def encode_squad_article_task(article, do_lower_case):
+    return encode_squad_article(article, _encoder, do_lower_case)
+
 def squad_read_and_encode(rank, device, squad_file, tokenizer):
     if rank in [-1, 0]:
         #read and encode squad
@@ -78,10 +87,10 @@ def squad_read_and_encode(rank, device, squad_file, tokenizer):
 
         t0 = time.time()
         printlog("Encode Squad {} articles from {} file ...".format(N, squad_file))
-        with multiprocessing.Pool() as pool:
+        with multiprocessing.Pool(initializer=init_encoder, initargs=(tokenizer.vocab,)) as pool:
             squad['data'] = pool.starmap(
-                encode_squad_article,
-                zip(squad['data'], [tokenizer.vocab] * N, [tokenizer.basic_tokenizer.do_lower_case]*N)
+                encode_squad_article_task,
+                zip(squad['data'], [tokenizer.basic_tokenizer.do_lower_case]*N)
             )
         t1 = time.time()
         printlog("Encoded Squad {} articles by {} sec".format(N, t1-t0))
@@ -12,11 +12,10 @@
 # See the License for the specific language governing permissions
 # and limitations under the License.
 
+import json
 import os
 import random
-from datetime import datetime
 import numpy as np
-from scipy.ndimage import affine_transform
 from scipy.ndimage.filters import gaussian_filter
 from scipy.ndimage.interpolation import map_coordinates
 import torch
@@ -25,40 +24,65 @@ import torch.utils.data as data
 from segthor import loader_helper
 
 
-#https://gist.github.com/chsasank/4d8f68caf01f041a6453e67fb30f8f5a
-def elastic_transform(image, alpha, sigma, order=3, random_state=None):
-    """Elastic deformation of images as described in [Simard2003]_.
-    .. [Simard2003] Simard, Steinkraus and Platt, "Best Practices for
-       Convolutional Neural Networks applied to Visual Document Analysis", in
-       Proc. of the International Conference on Document Analysis and
-       Recognition, 2003.
+def coarse_displacement(shape, sigma, random_state, step=None):
     """
-    assert len(image.shape) == 3
-
-    if random_state is None:
-        random_state = np.random.RandomState(None)
-
-    shape = image.shape
+    Smooth random displacement field with the statistics of gaussian_filter(uniform noise, sigma),
+    generated on a grid `step` times coarser and linearly upsampled to `shape`
+    """
+    step = max(1, int(sigma // 4)) if step is None else step
+    coarse_shape = [int(np.ceil((s - 1) / step)) + 1 for s in shape]
+    noise = random_state.rand(*coarse_shape).astype(np.float32) * 2 - 1
+    # smoothing of coarser noise keeps step**3 times more variance
+    field = gaussian_filter(noise, sigma / step, mode="constant", cval=0) * step ** -1.5
+    # separable linear upsampling, coarse node i lands exactly on voxel i * step
+    weights = [linear_upsampling_matrix(size, c, step) for size, c in zip(shape, coarse_shape)]
+    return np.einsum('xi,yj,zk,ijk->xyz', *weights, field, optimize=True)
 
-    dx = gaussian_filter((random_state.rand(*shape) * 2 - 1), sigma, mode="constant", cval=0) * alpha
-    dy = gaussian_filter((random_state.rand(*shape) * 2 - 1), sigma, mode="constant", cval=0) * alpha
-    dz = gaussian_filter((random_state.rand(*shape) * 2 - 1), sigma, mode="constant", cval=0) * (alpha/2.5)
 
-    x, y, z = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), np.arange(shape[2]), indexing='ij')
+def linear_upsampling_matrix(size, coarse_size, step):
+    position = np.arange(size, dtype=np.float32)[:, None] / step
+    return np.maximum(1 - np.abs(position - np.arange(coarse_size, dtype=np.float32)[None]), 0)
 
-    indices = np.reshape(x + dx, (-1, 1)), np.reshape(y + dy, (-1, 1)), np.reshape(z + dz, (-1, 1))
 
-    return map_coordinates(image, indices, order=order, mode='reflect').reshape(shape)
+def augmentation_coordinates(shape, center, scale, alpha, sigma, flip, random_state):
+    """
+    Sampling coordinates of a patch centered at `center`: scaling about the center, elastic deformation and flips
+    are merged into one coordinate map shared by image and label
+    """
+    coordinates = []
+    for axis, size in enumerate(shape):
+        # flipped patch samples the axis in reverse order
+        grid = np.arange(size, dtype=np.float32)[::-1] if flip[axis] else np.arange(size, dtype=np.float32)
+        grid = grid - (size - 1) / 2.0
+        view = [1, 1, 1]
+        view[axis] = size
+        displacement = coarse_displacement(shape, sigma, random_state) * (alpha if axis < 2 else alpha / 2.5)
+        coordinates.append(center[axis] + scale[axis] * (grid.reshape(view) + displacement))
+    return np.stack(coordinates)
+
+
+def save_atomic(filename, array):
+    # write to a temporary file first, so a crash never leaves a truncated cache file
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_filename, filename)
 
 
 # pylint: disable=R0914,R0915
 class SimpleReader(data.Dataset):
-    def __init__(self, path, patch_size, series=None, multiplier=1, patches_from_single_image=1):
+    """
+    Random augmented patches of the training volumes.
+
+    Volumes are normalized once and cached as .npy files that every data loader worker maps into memory,
+    next to the source NIfTI files unless cache_path is given
+    """
+    def __init__(self, path, patch_size, series=None, multiplier=1, cache_path=None):
         super(SimpleReader, self).__init__()
         self.path = path
+        self.cache_path = path if cache_path is None else cache_path
         self.patch_size = patch_size
         self.multiplier = multiplier
-        self.patches_from_single_image = patches_from_single_image
 
         if series is None:
             self.series = [f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))]
@@ -72,10 +96,8 @@ class SimpleReader(data.Dataset):
         self.__cache()
         self.real_length = len(self.series)
 
-        self.patches_from_current_image = self.patches_from_single_image
-        self.current_image_index = 0
-
-        self.__load(self.current_image_index)
+        self.images = None
+        self.labels = None
 
     @staticmethod
     def get_data_filename(path, series):
@@ -85,10 +107,47 @@ class SimpleReader(data.Dataset):
     def get_label_filename(path, series):
         return os.path.join(path, series, 'GT.nii.gz')
 
+    @staticmethod
+    def get_cache_filenames(path, series):
+        return os.path.join(path, series, 'image.f32.npy'), os.path.join(path, series, 'label.u8.npy')
+
+    @staticmethod
+    def get_cache_info_filename(path, series):
+        return os.path.join(path, series, 'cache.json')
+
+    def __is_cached(self, series, normalization):
+        # cache is valid if it is newer than both NIfTI files and normalized with the same constants
+        info_filename = self.get_cache_info_filename(self.cache_path, series)
+        if not os.path.exists(info_filename):
+            return False
+        sources = [self.get_data_filename(self.path, series), self.get_label_filename(self.path, series)]
+        if os.path.getmtime(info_filename) < max(os.path.getmtime(f) for f in sources):
+            return False
+        with open(info_filename) as f:
+            return json.load(f) == normalization
+
     def __cache(self):
-        # cache locations of the labels (bounding boxes) inside the images
+        # convert volumes to float32/uint8 arrays once and cache locations of the labels
+        # (bounding boxes) inside the images
+        std = np.sqrt(loader_helper.mean2 - loader_helper.mean * loader_helper.mean)
+        normalization = {'mean': float(loader_helper.mean), 'std': float(std)}
         for f in self.series:
-            label = loader_helper.read_nii(self.get_label_filename(self.path, f))
+            filename = self.get_data_filename(self.path, f)
+            image_cache, label_cache = self.get_cache_filenames(self.cache_path, f)
+
+            if not self.__is_cached(f, normalization):
+                os.makedirs(os.path.dirname(label_cache), exist_ok=True)
+                image = (loader_helper.read_nii(filename).astype(np.float32) - loader_helper.mean) / std
+                label = loader_helper.read_nii(self.get_label_filename(self.path, f)).astype(np.uint8)
+                save_atomic(image_cache, image.astype(np.float32))
+                save_atomic(label_cache, label)
+                # normalization constants are written last and mark the cache as complete
+                info_filename = self.get_cache_info_filename(self.cache_path, f)
+                with open(info_filename + '.tmp', 'w') as info:
+                    json.dump(normalization, info)
+                os.replace(info_filename + '.tmp', info_filename)
+
+            label = np.load(label_cache, mmap_mode='r')
 
             bbox = loader_helper.bbox3(label > 0)
 
@@ -101,68 +160,55 @@ class SimpleReader(data.Dataset):
 
             self.labels_location.append(bbox)
 
+    def __open(self):
+        # memory maps are opened in each worker, the pages are shared through the OS cache
+        files = [self.get_cache_filenames(self.cache_path, f) for f in self.series]
+        self.images = [np.load(image, mmap_mode='r') for image, _ in files]
+        self.labels = [np.load(label, mmap_mode='r') for _, label in files]
 
-    def __load(self, index):
-        if self.patches_from_current_image > self.patches_from_single_image:
-            self.patches_from_current_image = 0
-            self.current_image_index = index
-            filename = self.get_data_filename(self.path, self.series[index])
-            labelname = self.get_label_filename(self.path, self.series[index])
-            self.image = loader_helper.read_nii(filename)
-            self.label = loader_helper.read_nii(labelname)
-
-            std = np.sqrt(loader_helper.mean2 - loader_helper.mean * loader_helper.mean)
-
-            self.image = (self.image - loader_helper.mean) / std
-
-        self.patches_from_current_image += 1
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['images'] = None
+        state['labels'] = None
+        return state
 
     def __getitem__(self, index):
+        if self.images is None:
+            self.__open()
         index = index % self.real_length
-        self.__load(index)
-        center = np.random.rand(3)
+        image, label = self.images[index], self.labels[index]
 
-        bbox = self.labels_location[self.current_image_index]
+        bbox = self.labels_location[index]
+        center = np.random.rand(3) * (bbox[1] - bbox[0]) + bbox[0]
 
-        center = center * (bbox[1] - bbox[0]) + bbox[0]
-        left_bottom = center - np.array(self.patch_size) / 2.0
-        left_bottom = left_bottom.astype(np.int32)
-
-        data_out = self.image[left_bottom[0]:left_bottom[0] + self.patch_size[0],
-                              left_bottom[1]:left_bottom[1] + self.patch_size[1],
-                              left_bottom[2]:left_bottom[2] + self.patch_size[2]]
-
-        label_out = self.label[left_bottom[0]:left_bottom[0] + self.patch_size[0],
-                               left_bottom[1]:left_bottom[1] + self.patch_size[1],
-                               left_bottom[2]:left_bottom[2] + self.patch_size[2]]
-
-        seed = datetime.now().microsecond
         sigma = random.random()*20 + 10
         alpha = random.random()*4000 + 200
 
         x_scale = 0.7 + random.random()*0.6
         y_scale = 0.7 + random.random()*0.6
+        flip = (random.random() > 0.5, random.random() > 0.5, False)
 
-        data_out = affine_transform(data_out, (x_scale, y_scale, 1), order=1)
-        data_out = elastic_transform(data_out, alpha, sigma, 1, np.random.RandomState(seed))[None]
-
-        label_out = affine_transform(label_out, (x_scale, y_scale, 1), order=0)
-        label_out = elastic_transform(label_out, alpha, sigma, 0, np.random.RandomState(seed))
-        label_out = np.eye(5)[label_out.astype(np.int32)].transpose((3, 0, 1, 2))
-
-        if random.random() > 0.5:
-            data_out = data_out[:, ::-1, :, :].copy()
-            label_out = label_out[:, ::-1, :, :].copy()
+        coordinates = augmentation_coordinates(self.patch_size, center, (x_scale, y_scale, 1), alpha, sigma, flip,
+                                               np.random)
 
+        # read only the part of the volume the patch is sampled from
+        low = np.maximum(np.floor(coordinates.reshape(3, -1).min(axis=1)).astype(np.int64), 0)
+        high = np.minimum(np.ceil(coordinates.reshape(3, -1).max(axis=1)).astype(np.int64) + 1, image.shape)
+        low = np.minimum(low, high - 1)
+        region = tuple(slice(l, h) for l, h in zip(low, high))
+        coordinates -= low.reshape(3, 1, 1, 1).astype(np.float32)
 
-        if random.random() > 0.5:
-            data_out = data_out[:, :, ::-1, :].copy()
-            label_out = label_out[:, :, ::-1, :].copy()
+        data_out = map_coordinates(np.asarray(image[region]), coordinates, order=1, mode='nearest')[None]
+        # nearest neighbour for labels is a plain gather at rounded coordinates
+        label = np.asarray(label[region])
+        nearest = [np.clip(np.rint(c), 0, size - 1).astype(np.intp) for c, size in zip(coordinates, label.shape)]
+        label_out = label[tuple(nearest)]
 
         data_out = data_out * (0.6+random.random()*0.8)
         data_out = data_out + 1.2*(random.random() - 0.5)
 
-        labels_torch = torch.from_numpy(label_out[1:].copy()).float()
+        # one hot for classes 1..4, background is not used by the loss
+        labels_torch = torch.from_numpy(label_out[None] == np.arange(1, 5, dtype=np.uint8).reshape(4, 1, 1, 1)).float()
 
         return [torch.from_numpy(data_out).float(), ], \
                [labels_torch, ]
@@ -12,10 +12,85 @@
 # See the License for the specific language governing permissions
 # and limitations under the License.
 
+import atexit
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from scipy import ndimage
 import SimpleITK as sitk
 import torch
 
+# Distance reported when a class is missing in the prediction or in the ground truth
+MISSING_DISTANCE = 1e+6
+
+# Process pool shared by all Hausdorff metrics, created on first use and shut down at exit
+_POOL = None
+
+
+def get_pool(workers):
+    global _POOL  #pylint: disable=W0603
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(workers)
+        atexit.register(_POOL.shutdown)
+    return _POOL
+
+
+def to_labels(tensor):
+    """ Label map from [N, C-1, ...] class probabilities, 0 is the background. """
+    values, indices = torch.max(tensor, dim=1)
+    return (indices + 1) * (values > 0.5).long()
+
+
+def confusion_matrix(pred, gr, classes):
+    """ [N, classes, classes] confusion matrices of label maps, rows are predicted classes. """
+    n = pred.shape[0]
+    offsets = torch.arange(n, device=pred.device).view(n, 1) * classes * classes
+    index = offsets + pred.reshape(n, -1) * classes + gr.reshape(n, -1)
+    return torch.bincount(index.view(-1), minlength=n * classes * classes).view(n, classes, classes)
+
+
+def dice_from_confusion(cm):
+    """ [N, classes-1] Dice of foreground classes. """
+    cm = cm.double()
+    inter = torch.diagonal(cm, dim1=1, dim2=2)
+    return (2 * inter / (cm.sum(dim=2) + cm.sum(dim=1) + 1e-6))[:, 1:]
+
+
+def class_boxes(pred, gr, classes):
+    """ Bounding box of each foreground class over both label maps, None if the class is missing in one of them. """
+    boxes = []
+    for p, g in zip(ndimage.find_objects(pred, classes - 1), ndimage.find_objects(gr, classes - 1)):
+        if p is None or g is None:
+            boxes.append(None)
+        else:
+            boxes.append(tuple(slice(min(a.start, b.start), max(a.stop, b.stop)) for a, b in zip(p, g)))
+    return boxes
+
+
+def surface(mask):
+    return mask & ~ndimage.binary_erosion(mask)
+
+
+def surface_distances(p, g, spacing=None):
+    """ Distances from surface voxels of p to the surface of g and from surface voxels of g to the surface of p.
+
+    Masks may be cropped to the bounding box of p | g: voxels on the crop border are surface voxels
+    either way and all nearest surface voxels lie inside the box.
+    """
+    p_surface, g_surface = surface(p), surface(g)
+    to_g = ndimage.distance_transform_edt(~g_surface, sampling=spacing)[p_surface]
+    to_p = ndimage.distance_transform_edt(~p_surface, sampling=spacing)[g_surface]
+    return to_g, to_p
+
+
+def hausdorff(p, g, percentile=100, spacing=None):
+    """ Symmetric Hausdorff distance between surfaces of boolean masks, or its percentile (95 for HD95). """
+    if not p.any() or not g.any():
+        return MISSING_DISTANCE
+    to_g, to_p = surface_distances(p, g, spacing)
+    if percentile == 100:
+        return max(to_g.max(), to_p.max())
+    return np.percentile(np.concatenate([to_g, to_p]), percentile)
+
 
 class Metrics():
     def __init__(self, name):
@@ -47,18 +122,52 @@ class Dice(Metrics):
 
         assert gr.shape == pred.shape
 
-        pred = ((torch.argmax(pred, dim=1) + 1) * (torch.max(pred, dim=1)[0] > 0.5).long()).long()
-        gr = ((torch.argmax(gr, dim=1) + 1) * (torch.max(gr, dim=1)[0] > 0.5).long()).long()
+        cm = confusion_matrix(to_labels(pred), to_labels(gr), self.classes)
+        result = dice_from_confusion(cm).cpu().numpy()
 
-        result = np.zeros(shape=(pred.shape[0], self.classes-1))
+        self.accumulator = self.accumulator + result.mean(axis=0)
+
+        self.samples += 1
+
+
+class Hausdorff(Metrics):
+    """ Hausdorff distance between class surfaces in voxels, or its percentile (95 for HD95).
+
+    Each class of each sample is cropped to its bounding box and measured with distance transforms
+    in a process pool shared by all instances, `workers` sets its size when it is created.
+    With workers=0 everything runs in the calling process.
+    """
+    def __init__(self, name='Hausdorff', input_index=0, target_index=0, classes=5, percentile=100, workers=4):
+        super(Hausdorff, self).__init__(name)
+        self.input_index = input_index
+        self.target_index = target_index
+        self.classes = classes
+        self.percentile = percentile
+        self.workers = workers
+
+    def submit(self, p, g):
+        if self.workers == 0:
+            return hausdorff(p, g, self.percentile)
+        return get_pool(self.workers).submit(hausdorff, p, g, self.percentile)
+
+    def update(self, ground, predict):
+        pred = predict[self.input_index].detach()
+        gr = ground[self.target_index].detach()
+
+        assert gr.shape == pred.shape
+
+        pred = to_labels(pred).cpu().numpy()
+        gr = to_labels(gr).cpu().numpy()
+
+        result = np.full(shape=(pred.shape[0], self.classes-1), fill_value=MISSING_DISTANCE)
+        jobs = []
+        for n in range(pred.shape[0]):
+            for i, box in enumerate(class_boxes(pred[n], gr[n], self.classes)):
+                if box is not None:
+                    jobs.append((n, i, self.submit(pred[n][box] == i + 1, gr[n][box] == i + 1)))
 
-        for i in range(1, self.classes):
-            p = (pred == i).float()
-            g = (gr == i).float()
-            #print(p.max(), g.max())
-            r = 2 * (p * g).sum(dim=(1, 2, 3))/((p+g).sum(dim=(1, 2, 3))+1e-6)
-            #print(r.shape)
-            result[:, i-1] = r.cpu().numpy()
+        for n, i, job in jobs:
+            result[n, i] = job if self.workers == 0 else job.result()
 
         self.accumulator = self.accumulator + result.mean(axis=0)
 
@@ -79,8 +188,8 @@ class Hausdorff_ITK(Metrics):
 
         assert gr.shape == pred.shape
 
-        pred = ((torch.argmax(pred, dim=1) + 1) * (torch.max(pred, dim=1)[0] > 0.5).long()).long().cpu().numpy()
-        gr = ((torch.argmax(gr, dim=1) + 1) * (torch.max(gr, dim=1)[0] > 0.5).long()).long().cpu().numpy()
+        pred = to_labels(pred).cpu().numpy()
+        gr = to_labels(gr).cpu().numpy()
 
         result = np.zeros(shape=(pred.shape[0], self.classes-1))
 
@@ -90,7 +199,7 @@ class Hausdorff_ITK(Metrics):
                 g = (gr[n] == i).astype(np.uint8)
 
 
-                r = 1e+6
+                r = MISSING_DISTANCE
                 try:
                     self.hausdorff_distance_filter.Execute(sitk.GetImageFromArray(g), sitk.GetImageFromArray(p))
                     r = self.hausdorff_distance_filter.GetHausdorffDistance()
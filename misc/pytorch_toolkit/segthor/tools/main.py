@@ -43,6 +43,8 @@ def parse_args():
     parser.add_argument("--nEpochs", type=int, default=500, help="Number of epochs to train for")
     parser.add_argument("--threads", type=int, default=0, help="Number of threads for data loader to use")
     parser.add_argument("--train_path", default="./data", type=str, help="Path to train data", required=True)
+    parser.add_argument("--cache_path", default=None, type=str,
+                        help="Path to cache of normalized train volumes, train data folder by default")
     parser.add_argument("--name", default="test", type=str, help="Experiment name")
     parser.add_argument("--models_path", default="./models", type=str, help="Path to models folder")
     parser.add_argument("--splits", default=5, type=int, help="Number of splits in CV")
@@ -114,7 +116,7 @@ def main():
                                             patch_size=(16*13, 16*8, 16*5),
                                             series=series_train,
                                             multiplier=500,
-                                            patches_from_single_image=1)
+                                            cache_path=opt.cache_path)
 
         val_set = dataloader.FullReader(path=opt.train_path, series=series_val)
 
@@ -152,7 +154,8 @@ def main():
                       ],
                       val_metrics=[
                           metrics.Dice(name='Dice', input_index=0, target_index=0),
-                          metrics.Hausdorff_ITK(name='Hausdorff_ITK', input_index=0, target_index=0)
+                          metrics.Hausdorff(name='Hausdorff', input_index=0, target_index=0),
+                          metrics.Hausdorff(name='HD95', input_index=0, target_index=0, percentile=95)
                       ],
                       track_metric='Dice',
                       epoches=opt.nEpochs,
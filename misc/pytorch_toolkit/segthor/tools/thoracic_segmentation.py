@@ -15,18 +15,20 @@
 # and limitations under the License.
 
 import os
+import json
 import logging
+import time
 from sys import stdout
 
-from datetime import datetime
 from argparse import ArgumentParser, SUPPRESS
+from concurrent.futures import ProcessPoolExecutor
 from scipy.ndimage import zoom
 from scipy.ndimage.filters import median_filter
 from skimage import measure, morphology
 
 import numpy as np
 import nibabel as nii
-from openvino.inference_engine import IENetwork, IEPlugin
+from openvino.inference_engine import IECore
 
 logging.basicConfig(format="[ %(levelname)s ] %(message)s", level=logging.DEBUG, stream=stdout)
 logger = logging.getLogger('thoracic_segmentation_demo')
@@ -53,6 +55,11 @@ def parse_arguments():
     args.add_argument('-c', '--path_to_cldnn_config', type=str, required=False,
                       help="Required for GPU custom kernels. "
                            "Absolute path to an .xml file with the kernels description.")
+    args.add_argument('-p', '--pipelined', action='store_true',
+                      help="Optional. Preprocess the next volume and postprocess the previous one in worker processes "
+                           "while the current volume is inferred.")
+    args.add_argument('-w', '--number_workers', type=int, required=False, default=2,
+                      help="Optional. Number of worker processes for the pipelined mode.")
     return parser.parse_args()
 
 
@@ -118,43 +125,120 @@ def closest_to_k(n, k=8):
     return ((n // k) + 1)*k
 
 
-def leave_biggest_region(connectivity):
-    unique, counts = np.unique(connectivity, return_counts=True)
-    counts_idx = np.argsort(-counts)
-    unique = unique[counts_idx]
+def clean_components(label, esophagus_ratio=0.2):
+    """
+    leave the biggest connected component of heart, trachea and aorta and components of esophagus
+    that are not smaller than `esophagus_ratio` of all esophagus voxels, in one labelling pass over all classes
+    """
+    # neighbouring voxels of different classes never join one component
+    components = measure.label(label, background=0)
+    sizes = np.bincount(components.ravel())
+    classes = np.zeros(sizes.shape[0], dtype=label.dtype)
+    classes[components] = label
 
-    resulting_conectivity = np.zeros_like(connectivity)
+    keep = np.zeros(sizes.shape[0], dtype=np.bool_)
+    for c in range(1, 5):
+        index = np.nonzero(classes == c)[0]
+        index = index[index > 0]
+        if index.shape[0] == 0:
+            continue
+        if c == 1:
+            keep[index] = sizes[index] >= esophagus_ratio * sizes[index].sum()
+        else:
+            keep[index[np.argmax(sizes[index])]] = True
 
-    resulting_conectivity[connectivity == unique[1]] = 1
+    return np.where(keep[components], label, 0).astype(label.dtype)
 
-    return resulting_conectivity
 
+class Timer:
+    def __init__(self):
+        self.stages = {}
+        self.start = time.perf_counter()
 
-def reject_small_regions(connectivity, ratio=0.25):
-    resulting_connectivity = connectivity.copy()
-    unique, counts = np.unique(connectivity, return_counts=True)
+    def tick(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.start
+        self.start = now
 
-    all_nonzero_clusters = np.prod(connectivity.shape) - np.max(counts)
 
-    for i in range(unique.shape[0]):
-        if counts[i] < ratio * all_nonzero_clusters:
-            resulting_connectivity[resulting_connectivity == unique[i]] = 0
+def preprocess(path, input_shape):
+    timer = Timer()
+    header = read_nii_header(path)
+    image = np.array(header.get_data()).astype(np.float32)
+    original_shape = image.shape
+    timer.tick('read')
 
-    return resulting_connectivity
+    image = median_filter(image, 3)
 
+    bbox = lung_bbox(image)
 
-# pylint: disable=R0914,R0915
-def main():
-    args = parse_arguments()
+    image_crop = image[bbox[0, 0]:bbox[1, 0], bbox[0, 1]:bbox[1, 1], bbox[0, 2]:bbox[1, 2]]
+
+    diff = np.array(input_shape) - np.array(image_crop.shape)
+    pad_left = diff // 2
+    pad_right = diff - pad_left
+
+    image_crop_pad = np.pad(image_crop, pad_width=tuple([(pad_left[i], pad_right[i]) for i in range(3)]),
+                            mode='reflect')
+
+    # dataset statistics
+    mean = -303.0502877950004
+    mean2 = 289439.0029958802
+    std = np.sqrt(mean2 - mean * mean)
+
+    image_crop_pad = ((image_crop_pad - mean) / std).astype(np.float32)[None, None]
+    timer.tick('preprocess')
+
+    return {
+        'input': image_crop_pad,
+        'affine': header.affine,
+        'original_shape': original_shape,
+        'shape': image.shape,
+        'bbox': bbox,
+        'pad_left': pad_left,
+        'pad_right': pad_right,
+        'timing': timer.stages
+    }
+
+
+def postprocess(result, volume, output_path):
+    timer = Timer()
+    pad_left, pad_right, bbox = volume['pad_left'], volume['pad_right'], volume['bbox']
+    output_crop = result[0, :, pad_left[0]:-pad_right[0] or None, pad_left[1]:-pad_right[1] or None,
+                         pad_left[2]:-pad_right[2] or None]
 
-    # --------------------------------- 1. Load Plugin for inference engine ---------------------------------
-    logger.info("Loading plugin")
-    plugin = IEPlugin(args.target_device)
+    new_label = np.zeros(shape=(4,) + volume['shape'], dtype=np.float32)
+    new_label[:, bbox[0, 0]:bbox[1, 0], bbox[0, 1]:bbox[1, 1], bbox[0, 2]:bbox[1, 2]] = output_crop
+
+    scale_factor = np.array(volume['original_shape']) / np.array(volume['shape'])
+    if np.any(scale_factor != 1):
+        new_label = np.stack([zoom(new_label[i], scale_factor, order=1, mode='constant', cval=0) for i in range(4)])
+
+    old_label = ((np.argmax(new_label, axis=0) + 1) * np.any(new_label > 0.5, axis=0)).astype(np.int32)
+    old_label = clean_components(old_label)
+    timer.tick('postprocess')
+
+    output_header = nii.Nifti1Image(old_label, volume['affine'])
+    nii.save(output_header, output_path)
+    timer.tick('save')
+    return timer.stages
+
+
+def write_timing(output_path, name, timing):
+    logger.info("%s: %s", name, ", ".join("{} {:.3f}s".format(k, v) for k, v in timing.items()))
+    with open(os.path.join(output_path, name + '_timing.json'), 'w') as f:
+        json.dump(timing, f, indent=4)
+
+
+def load_network(args):
+    # --------------------------------- 1. Load Inference Engine ---------------------------------
+    logger.info("Loading Inference Engine")
+    ie = IECore()
 
     config = dict()
     if 'CPU' in args.target_device:
         if args.path_to_extension:
-            plugin.add_cpu_extension(args.path_to_extension)
+            ie.add_extension(args.path_to_extension, 'CPU')
         if args.number_threads is not None:
             config.update({'CPU_THREADS_NUM': str(args.number_threads)})
     else:
@@ -162,22 +246,22 @@ def main():
 
     if 'GPU' in args.target_device:
         if args.path_to_cldnn_config:
-            config.update({'CONFIG_FILE': args.path_to_cldnn_config})
+            ie.set_config({'CONFIG_FILE': args.path_to_cldnn_config}, 'GPU')
             logger.info("GPU extensions is loaded %s", args.path_to_cldnn_config)
 
-    plugin.set_config(config)
+    if config:
+        ie.set_config(config, 'CPU')
 
-    logger.info("Device is %s ", plugin.device)
-    logger.info("Plugin version is %s", plugin.version)
+    logger.info("Device is %s ", args.target_device)
 
     # --------------------- 2. Read IR Generated by ModelOptimizer (.xml and .bin files) ---------------------
 
     xml_filename = os.path.abspath(args.path_to_model)
     bin_filename = os.path.abspath(os.path.splitext(xml_filename)[0] + '.bin')
 
-    ie_network = IENetwork(xml_filename, bin_filename)
+    ie_network = ie.read_network(model=xml_filename, weights=bin_filename)
 
-    input_info = ie_network.inputs
+    input_info = ie_network.input_info
     if not input_info:
         raise AttributeError("No inputs info is provided")
     if len(input_info) != 1:
@@ -185,110 +269,88 @@ def main():
 
     input_name = next(iter(input_info))
     out_name = next(iter(ie_network.outputs))
-    print(input_name, out_name)
-
-    # ---------------------------------------- 4. Preparing input data ----------------------------------------
-    logger.info("Preparing inputs")
-
-    if len(input_info[input_name].shape) != 5:
-        raise AttributeError("Incorrect shape {} for 3d convolution network".format(args.shape))
+    input_shape = input_info[input_name].input_data.shape
 
-    n, _, d, h, w = input_info[input_name].shape
-    ie_network.batch_size = n
+    if len(input_shape) != 5:
+        raise AttributeError("Incorrect shape {} for 3d convolution network".format(input_shape))
 
-    # ------------------------------------- 4. Loading model to the plugin -------------------------------------
-    # logger.info("Reshape of network from {} to {}".format(input_info[input_name].shape, image_crop_pad.shape))
-    #ie_network.reshape({input_name: image_crop_pad.shape})
-    #input_info = ie_network.inputs
-
-    # logger.info("Loading model to the plugin")
-    executable_network = plugin.load(network=ie_network)
+    # ------------------------------------- 3. Loading model to the device -------------------------------------
+    executable_network = ie.load_network(network=ie_network, device_name=args.target_device, num_requests=1)
     del ie_network
 
-    files = os.listdir(args.path_to_input_data)
-    files = [f for f in files if (f.startswith('Patient') and os.path.isfile(os.path.join(args.path_to_input_data, f)))]
-    files.sort()
-
-    for f in files:
-        header = read_nii_header(os.path.join(args.path_to_input_data, f))
-        image = np.array(header.get_data()).astype(np.float32)
-        original_shape = image.shape
-
-        start_time = datetime.now()
-
-        image = median_filter(image, 3)
-
-        bbox = lung_bbox(image)
-
-        image_crop = image[bbox[0, 0]:bbox[1, 0], bbox[0, 1]:bbox[1, 1], bbox[0, 2]:bbox[1, 2]]
-
-        new_shape_pad = (d, h, w)
-        diff = np.array(new_shape_pad) - np.array(image_crop.shape)
-        pad_left = diff // 2
-        pad_right = diff - pad_left
-
-        image_crop_pad = np.pad(image_crop, pad_width=tuple([(pad_left[i], pad_right[i]) for i in range(3)]),
-                                mode='reflect')
-
-        # dataset statistics
-        mean = -303.0502877950004
-        mean2 = 289439.0029958802
-        std = np.sqrt(mean2 - mean * mean)
-
-        image_crop_pad = (image_crop_pad - mean) / std
-
-        image_crop_pad = image_crop_pad[None, None]
-
-        preprocess_time = datetime.now() - start_time
+    return executable_network, input_name, out_name, tuple(input_shape[2:])
 
-        test_im = {input_name: image_crop_pad}
 
-        # ---------------------------------------------- 5. Do inference --------------------------------------------
-        start_time = datetime.now()
-        res = executable_network.infer(test_im)
-        infer_time = datetime.now() - start_time
+def infer(executable_network, input_name, out_name, volume):
+    request = executable_network.requests[0]
+    request.async_infer({input_name: volume['input']})
+    request.wait()
+    return request.output_blobs[out_name].buffer.copy()
 
-        # ---------------------------- 6. Processing of the received inference results ------------------------------
-        result = res[out_name]
 
-        start_time = datetime.now()
-
-        output_crop = result[0, :, pad_left[0]:-pad_right[0] or None, pad_left[1]:-pad_right[1] or None,
-                             pad_left[2]:-pad_right[2] or None]
-
-        new_label = np.zeros(shape=(4,) + image.shape)
-        new_label[:, bbox[0, 0]:bbox[1, 0], bbox[0, 1]:bbox[1, 1], bbox[0, 2]:bbox[1, 2]] = output_crop
-
-        scale_factor = np.array(original_shape) / np.array(image.shape)
-        old_labels = [zoom(new_label[i], scale_factor, order=1, mode='constant', cval=0)[None] for i in range(4)]
-
-        old_label = np.concatenate(tuple(old_labels), axis=0)
-        old_label = ((np.argmax(old_label, axis=0) + 1) *
-                     np.max((old_label > np.array([0.5, 0.5, 0.5, 0.5]).reshape((-1, 1, 1, 1))).astype(np.int32),
-                            axis=0)).astype(np.int32)
-
-        eso_connectivity = morphology.label(old_label == 1)
-        heart_connectivity = morphology.label(old_label == 2)
-        trachea_connectivity = morphology.label(old_label == 3)
-        aorta_connectivity = morphology.label(old_label == 4)
-        eso_connectivity = reject_small_regions(eso_connectivity, ratio=0.2)
-        heart_connectivity = leave_biggest_region(heart_connectivity)
-        trachea_connectivity = leave_biggest_region(trachea_connectivity)
-        aorta_connectivity = leave_biggest_region(aorta_connectivity)
+# pylint: disable=R0914,R0915
+def main():
+    args = parse_arguments()
 
-        old_label[np.logical_and(old_label == 1, eso_connectivity == 0)] = 0
-        old_label[np.logical_and(old_label == 2, heart_connectivity == 0)] = 0
-        old_label[np.logical_and(old_label == 3, trachea_connectivity == 0)] = 0
-        old_label[np.logical_and(old_label == 4, aorta_connectivity == 0)] = 0
+    executable_network, input_name, out_name, input_shape = load_network(args)
 
-        postprocess_time = datetime.now() - start_time
+    files = os.listdir(args.path_to_input_data)
+    files = [f for f in files if (f.startswith('Patient') and os.path.isfile(os.path.join(args.path_to_input_data, f)))]
+    files.sort()
 
-        logger.info("Pre-processing time is %s; Inference time is %s; Post-processing time is %s",
-                    preprocess_time, infer_time, postprocess_time)
+    def input_path(f):
+        return os.path.join(args.path_to_input_data, f)
+
+    def output_path(f):
+        return os.path.join(args.path_to_output, f[:-7]+'.nii')
+
+    if not args.pipelined:
+        for f in files:
+            volume = preprocess(input_path(f), input_shape)
+            timing = dict(volume['timing'])
+            start_time = time.perf_counter()
+            result = infer(executable_network, input_name, out_name, volume)
+            timing['infer'] = time.perf_counter() - start_time
+            timing.update(postprocess(result, volume, output_path(f)))
+            write_timing(args.path_to_output, f[:-7], timing)
+        return
+
+    # volume N is inferred while volume N+1 is preprocessed and volume N-1 is postprocessed in workers
+    with ProcessPoolExecutor(args.number_workers) as pool:
+        # one worker is left for postprocessing
+        prefetch = max(args.number_workers - 1, 1)
+        preprocessing = [pool.submit(preprocess, input_path(f), input_shape) for f in files[:prefetch]]
+        postprocessing = []
+        request = executable_network.requests[0]
+        for i, f in enumerate(files):
+            start_time = time.perf_counter()
+            volume = preprocessing.pop(0).result()
+            wait_time = time.perf_counter() - start_time
+            if i + prefetch < len(files):
+                preprocessing.append(pool.submit(preprocess, input_path(files[i + prefetch]), input_shape))
+
+            start_time = time.perf_counter()
+            request.async_infer({input_name: volume['input']})
+            # the input is not needed anymore and is not sent to postprocessing
+            del volume['input']
+            # report of the previous volume is written while the request runs
+            while postprocessing and postprocessing[0][1].done():
+                write_timing(args.path_to_output, *finish(postprocessing.pop(0)))
+            request.wait()
+            result = request.output_blobs[out_name].buffer.copy()
+            timing = dict(volume['timing'], wait_preprocess=wait_time, infer=time.perf_counter() - start_time)
+
+            postprocessing.append((f[:-7], pool.submit(postprocess, result, volume, output_path(f)), timing))
+
+        for item in postprocessing:
+            write_timing(args.path_to_output, *finish(item))
+
+
+def finish(item):
+    name, future, timing = item
+    timing.update(future.result())
+    return name, timing
 
-        # --------------------------------------------- 7. Save output -----------------------------------------------
-        output_header = nii.Nifti1Image(old_label, header.affine)
-        nii.save(output_header, os.path.join(args.path_to_output, f[:-7]+'.nii'))
 
 if __name__ == "__main__":
     main()
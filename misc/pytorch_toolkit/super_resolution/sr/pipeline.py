@@ -0,0 +1,144 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from sr.tiling import float_to_img
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def list_images(path):
+    """ Image paths from a file, a directory or stdin if path is '-'. """
+    if path == '-':
+        return (line.strip() for line in sys.stdin if line.strip())
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [path]
+
+
+def output_path(input_path, output_dir):
+    output_dir = output_dir if output_dir else os.path.dirname(input_path)
+    return os.path.join(output_dir, 'sr_' + os.path.basename(input_path))
+
+
+class StageTimer:
+    """ Thread safe sum of time spent in each stage. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = defaultdict(float)
+
+    def add(self, stage, start):
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.total[stage] += elapsed
+
+
+class FolderPipeline:
+    """ Upscales a stream of images with overlapped reading, inference and writing.
+
+    Images are decoded by a pool of readers, their tile batches are started on the backend
+    with up to `backend.num_requests` requests in flight, possibly from different images,
+    and finished images are encoded by a pool of writers. Images which can not be read are
+    reported and skipped.
+    """
+    def __init__(self, upscaler, num_readers=4, num_writers=4, prefetch=8):
+        self.upscaler = upscaler
+        self.backend = upscaler.backend
+        self.num_readers = num_readers
+        self.num_writers = num_writers
+        self.prefetch = prefetch
+        self.timer = StageTimer()
+
+    def read(self, path):
+        start = time.perf_counter()
+        image = cv2.imread(path)
+        self.timer.add('read', start)
+        if image is None:
+            print('[WARNING] Can not read image: {}'.format(path))
+        return image
+
+    def write(self, path, job):
+        start = time.perf_counter()
+        cv2.imwrite(path, float_to_img(job.result()))
+        self.timer.add('write', start)
+        return path
+
+    def run(self, paths, output_dir=None):
+        paths = iter(paths)
+        reads, in_flight, writes = deque(), deque(), []
+        num_skipped = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.num_readers) as readers, ThreadPoolExecutor(self.num_writers) as writers:
+            def fill_reads():
+                while len(reads) < self.prefetch:
+                    path = next(paths, None)
+                    if path is None:
+                        return
+                    reads.append((path, readers.submit(self.read, path)))
+
+            def finish_oldest():
+                handle, job, tiles, path = in_flight.popleft()
+                t = time.perf_counter()
+                result = self.backend.wait(handle)
+                self.timer.add('infer', t)
+                t = time.perf_counter()
+                job.add(tiles, result)
+                self.timer.add('blend', t)
+                if job.done():
+                    writes.append(writers.submit(self.write, output_path(path, output_dir), job))
+
+            fill_reads()
+            while reads:
+                path, image = reads.popleft()
+                image = image.result()
+                fill_reads()
+                if image is None:
+                    num_skipped += 1
+                    continue
+
+                t = time.perf_counter()
+                job = self.upscaler.prepare(image)
+                batches = job.batches()
+                self.timer.add('prepare', t)
+                while True:
+                    t = time.perf_counter()
+                    batch = next(batches, None)
+                    self.timer.add('prepare', t)
+                    if batch is None:
+                        break
+                    if len(in_flight) == self.backend.num_requests:
+                        finish_oldest()
+                    tiles, lr, cubic = batch
+                    t = time.perf_counter()
+                    in_flight.append((self.backend.start(lr, cubic), job, tiles, path))
+                    self.timer.add('infer', t)
+            while in_flight:
+                finish_oldest()
+            saved = [w.result() for w in writes]
+        return saved, self.stats(len(saved), num_skipped, time.perf_counter() - start)
+
+    def stats(self, num_images, num_skipped, total_time):
+        stats = {'images': num_images, 'skipped': num_skipped, 'total_s': total_time,
+                 'images_per_s': num_images / total_time if total_time > 0 else 0.0}
+        # read and write run in parallel pools, so their sums may exceed the total time
+        for stage in ('read', 'prepare', 'infer', 'blend', 'write'):
+            stats[stage + '_s'] = self.timer.total[stage]
+        return stats
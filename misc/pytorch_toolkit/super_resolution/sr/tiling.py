@@ -0,0 +1,187 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+
+import warnings
+import cv2
+import skimage
+import numpy as np
+import torch
+
+# Bicubic interpolation reads 2 source pixels on each side
+CUBIC_MARGIN = 2
+
+
+def tile_starts(size, tile, overlap):
+    """ Start positions of tiles covering [0, size). The last tile is aligned to the end. """
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile, tile - overlap))
+    starts.append(size - tile)
+    return starts
+
+
+def blend_window(length, ramp, left, right):
+    """ 1D weights of a tile, linearly rising over `ramp` pixels on sides shared with other tiles. """
+    window = np.ones(length, dtype=np.float32)
+    ramp = min(ramp, length // 2)
+    if ramp > 0:
+        rise = (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+        if left:
+            window[:ramp] = np.minimum(window[:ramp], rise)
+        if right:
+            window[-ramp:] = np.minimum(window[-ramp:], rise[::-1])
+    return window
+
+
+def estimate_tile_bytes(tile_h, tile_w, scale, channels=32):
+    """ Rough memory needed to run one tile: `channels` float feature maps at LR and HR resolution. """
+    return 4 * tile_h * tile_w * (1 + scale * scale) * channels
+
+
+def float_to_img(image):
+    image = np.clip(image, 0.0, 1.0)
+
+    # Suppression skimage warning:
+    #    UserWarning: Possible precision loss when converting from float32 to uint8
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        image = skimage.img_as_ubyte(image)
+    return image
+
+
+class TorchBackend:
+    """ Runs batches of uint8 NHWC tiles through PyTorch model and returns float NHWC output. """
+    tile_size = None
+    batch_size = None
+
+    def __init__(self, model, device='cuda'):
+        self.model = model.to(device).eval()
+        self.device = device
+
+    def __call__(self, lr, cubic):
+        with torch.no_grad():
+            blobs = [torch.from_numpy(b).to(self.device).permute(0, 3, 1, 2).float().div_(255) for b in (lr, cubic)]
+            result = self.model(blobs)[0]
+        return result.permute(0, 2, 3, 1).cpu().numpy()
+
+    # synchronous implementation of async interface used by the folder pipeline
+    num_requests = 1
+
+    def start(self, lr, cubic):
+        return self(lr, cubic)
+
+    def wait(self, handle):
+        return handle
+
+
+class TiledSR:
+    """ Upscales images of any size by overlapping tiles blended with weighted windows.
+
+    Backend is a callable (lr, cubic) -> sr over NHWC batches. It may fix the tile size and
+    the batch size by `tile_size` and `batch_size` attributes, like an IR with static shapes does.
+    Otherwise the batch size is chosen to fit `memory_budget` megabytes.
+    """
+    def __init__(self, backend, scale, tile_size=(256, 256), overlap=16, memory_budget=1024):
+        self.backend = backend
+        self.scale = scale
+        self.tile_size = tuple(backend.tile_size or tile_size)
+        self.overlap = overlap
+        self.memory_budget = memory_budget
+        assert overlap < min(self.tile_size), 'Overlap must be less than tile size'
+
+    def get_batch_size(self, tile_h, tile_w):
+        if self.backend.batch_size:
+            return self.backend.batch_size
+        return max(1, int(self.memory_budget * 2**20 // estimate_tile_bytes(tile_h, tile_w, self.scale)))
+
+    def __call__(self, image):
+        job = self.prepare(image)
+        for tiles, lr, cubic in job.batches():
+            job.add(tiles, self.backend(lr, cubic))
+        return job.result()
+
+    def prepare(self, image):
+        """ Returns job which yields batches of tiles of the image and blends results added back to it. """
+        h, w = image.shape[:2]
+        th, tw = self.tile_size
+        if self.backend.tile_size is not None:
+            # static input shape can't shrink, so small images are padded up to the tile
+            pad_h, pad_w = max(th - h, 0), max(tw - w, 0)
+            image = cv2.copyMakeBorder(image, 0, pad_h, 0, pad_w, cv2.BORDER_REPLICATE)
+        else:
+            th, tw = min(th, h), min(tw, w)
+        return TiledImage(self, image, (h, w), (th, tw))
+
+    def cubic_tile(self, image, y, x, th, tw):
+        """ Bicubic upscale of the tile, equal to the crop of the upscaled whole image. """
+        h, w = image.shape[:2]
+        y0, x0 = max(y - CUBIC_MARGIN, 0), max(x - CUBIC_MARGIN, 0)
+        y1, x1 = min(y + th + CUBIC_MARGIN, h), min(x + tw + CUBIC_MARGIN, w)
+        crop = image[y0:y1, x0:x1]
+        s = self.scale
+        cubic = cv2.resize(crop, ((x1 - x0) * s, (y1 - y0) * s), interpolation=cv2.INTER_CUBIC)
+        return cubic[(y - y0) * s:(y - y0 + th) * s, (x - x0) * s:(x - x0 + tw) * s]
+
+
+class TiledImage:
+    """ Accumulates blended output of one image while its tile batches are inferred. """
+    def __init__(self, upscaler, image, size, tile_size):
+        self.upscaler = upscaler
+        self.image = image
+        self.size = size
+        self.tile_size = tile_size
+        self.scale = s = upscaler.scale
+        ph, pw = image.shape[:2]
+        th, tw = tile_size
+        self.output = np.zeros((ph * s, pw * s, 3), dtype=np.float32)
+        self.weights = np.zeros((ph * s, pw * s, 1), dtype=np.float32)
+        overlap = upscaler.overlap
+        self.tiles = [(y, x) for y in tile_starts(ph, th, overlap) for x in tile_starts(pw, tw, overlap)]
+        self.batch_size = upscaler.get_batch_size(th, tw)
+        self.pending = len(self.tiles)
+
+    def batches(self):
+        th, tw = self.tile_size
+        fixed = self.upscaler.backend.batch_size is not None
+        for i in range(0, len(self.tiles), self.batch_size):
+            tiles = self.tiles[i:i + self.batch_size]
+            lr = np.stack([self.image[y:y + th, x:x + tw] for y, x in tiles])
+            cubic = np.stack([self.upscaler.cubic_tile(self.image, y, x, th, tw) for y, x in tiles])
+            if fixed and len(tiles) < self.batch_size:
+                pad = self.batch_size - len(tiles)
+                lr = np.concatenate([lr, np.zeros((pad,) + lr.shape[1:], lr.dtype)])
+                cubic = np.concatenate([cubic, np.zeros((pad,) + cubic.shape[1:], cubic.dtype)])
+            yield tiles, lr, cubic
+
+    def add(self, tiles, result):
+        s = self.scale
+        th, tw = self.tile_size
+        ph, pw = self.image.shape[:2]
+        ramp = self.upscaler.overlap * s
+        for (y, x), sr in zip(tiles, result):
+            window = np.outer(
+                blend_window(th * s, ramp, y > 0, y + th < ph),
+                blend_window(tw * s, ramp, x > 0, x + tw < pw)
+            )[..., None]
+            self.output[y * s:(y + th) * s, x * s:(x + tw) * s] += sr * window
+            self.weights[y * s:(y + th) * s, x * s:(x + tw) * s] += window
+        self.pending -= len(tiles)
+
+    def done(self):
+        return self.pending == 0
+
+    def result(self):
+        h, w = self.size
+        s = self.scale
+        return self.output[:h * s, :w * s] / self.weights[:h * s, :w * s]
@@ -15,13 +15,9 @@
 # and limitations under the License.
 
 from argparse import ArgumentParser
-import os
-import warnings
-import cv2
-import skimage
-import numpy as np
 import torch
-from torch.autograd import Variable
+from sr.tiling import TiledSR, TorchBackend
+from sr.pipeline import FolderPipeline, list_images
 
 
 def parse_args():
@@ -29,57 +25,31 @@ def parse_args():
     parser.add_argument('--model', help='Path to checkpoint', required=True, type=str)
     parser.add_argument('--scale', type=int, default=4, help='Upsampling factor for SR')
     parser.add_argument('--output_dir', default=None, help='Output debugirectory')
-    parser.add_argument('input_image', help='Image with license plate')
+    parser.add_argument('--device', default='cuda', choices=['cuda', 'cpu'], help='Device to infer on')
+    parser.add_argument('--tile_size', type=int, nargs=2, default=(256, 256),
+                        help='Height and width of tiles images are split into')
+    parser.add_argument('--tile_overlap', type=int, default=16, help='Overlap of neighbouring tiles')
+    parser.add_argument('--memory_budget', type=int, default=1024, help='Memory for a batch of tiles, MB')
+    parser.add_argument('--num_readers', type=int, default=4, help='Number of threads decoding images')
+    parser.add_argument('--num_writers', type=int, default=4, help='Number of threads encoding images')
+    parser.add_argument('input', help='Image, directory with images or - to read image paths from stdin')
     return parser.parse_args()
 
 
-def image_to_blob(image):
-    blob = image.copy()
-    blob = blob.transpose((2, 0, 1))  # Change data layout from HWC to CHW
-    blob = skimage.img_as_float32(blob)
-    blob = np.array([blob])
-    return torch.from_numpy(blob).float().cuda()
-
-
-def blob_to_img(blob):
-    blob = blob.cpu().detach().numpy()
-    blob = np.clip(blob, 0.0, 1.0)
-    blob = blob.transpose((1, 2, 0))  # Change data layout from CHW to HWC
-
-    # Suppression skimage warning:
-    #    UserWarning: Possible precision loss when converting from float32 to uint8
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        blob = skimage.img_as_ubyte(blob)
-    return blob
-
-
 def main():
     args = parse_args()
 
     # Load model
-    model = torch.load(args.model)['model']
-    model.eval()
-
-    # Prepare input blobs
-    image = cv2.imread(args.input_image)
-
-    ih, iw = image.shape[:2]
-    cubic = cv2.resize(image, (iw*args.scale, ih*args.scale), interpolation=cv2.INTER_CUBIC)
-
-    blob1 = image_to_blob(image)
-    blob2 = image_to_blob(cubic)
+    model = torch.load(args.model, map_location=args.device)['model']
+    upscaler = TiledSR(TorchBackend(model, args.device), args.scale, args.tile_size, args.tile_overlap,
+                       args.memory_budget)
 
     # Inference
-    result = model([Variable(blob1), Variable(blob2)])
-
-    # Postprocessing
-    out_img = blob_to_img(result[0][0])
-
-    outpur_dir = args.output_dir if args.output_dir else os.path.dirname(args.input_image)
-    out_path = os.path.join(outpur_dir, 'sr_' + os.path.basename(args.input_image))
-    cv2.imwrite(out_path, out_img)
-    print('Saved: ', out_path)
+    pipeline = FolderPipeline(upscaler, args.num_readers, args.num_writers)
+    saved, stats = pipeline.run(list_images(args.input), args.output_dir)
+    for out_path in saved:
+        print('Saved: ', out_path)
+    print(', '.join('{}: {:.3f}'.format(k, v) for k, v in stats.items()))
 
 if __name__ == '__main__':
     main()
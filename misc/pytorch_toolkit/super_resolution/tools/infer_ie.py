@@ -16,11 +16,10 @@
 
 from argparse import ArgumentParser
 import os
-import warnings
-import cv2
-import skimage
-import numpy as np
+from collections import deque
 from openvino.inference_engine import IENetwork, IEPlugin
+from sr.tiling import TiledSR
+from sr.pipeline import FolderPipeline, list_images
 
 
 def build_argparser():
@@ -29,17 +28,21 @@ def build_argparser():
     parser.add_argument('--device', help='Specify the target device to infer on. (default: %(default)s)',
                         choices=['CPU', 'GPU', 'MYRIAD'], default='CPU')
     parser.add_argument('--output_dir', default=None, help='Output debugirectory')
-    parser.add_argument('input_image', help='Image')
+    parser.add_argument('--tile_overlap', type=int, default=16, help='Overlap of neighbouring tiles')
+    parser.add_argument('--num_requests', type=int, default=4, help='Number of infer requests in flight')
+    parser.add_argument('--num_readers', type=int, default=4, help='Number of threads decoding images')
+    parser.add_argument('--num_writers', type=int, default=4, help='Number of threads encoding images')
+    parser.add_argument('input', help='Image, directory with images or - to read image paths from stdin')
     return parser.parse_args()
 
 
-def load_ir_model(model_xml, device):
+def load_ir_model(model_xml, device, num_requests=1):
     model_bin = os.path.splitext(model_xml)[0] + '.bin'
 
     # initialize plugin and read IR
     plugin = IEPlugin(device=device)
     net = IENetwork(model=model_xml, weights=model_bin)
-    exec_net = plugin.load(network=net)
+    exec_net = plugin.load(network=net, num_requests=num_requests)
 
     input_blobs = net.inputs.keys()
     inputs = [(b, net.inputs[b].shape) for b in input_blobs]
@@ -50,50 +53,54 @@ def load_ir_model(model_xml, device):
     return exec_net, inputs, out_blob
 
 
-def image_to_blob(image, shape):
-    blob = image.copy()
-    blob = blob.transpose((2, 0, 1))  # from HWC to CHW
-    blob = blob.reshape(shape)
-    return blob
+class IEBackend:
+    """ Runs uint8 NHWC tiles of the IR input shape, IR scales them to [0, 1] itself. """
+    def __init__(self, exec_net, inputs, out_blob, num_requests=1):
+        self.exec_net = exec_net
+        self.num_requests = num_requests
+        self.free_requests = deque(range(num_requests))
+        self.inputs = inputs
+        self.out_blob = out_blob
+        self.batch_size = inputs[0][1][0]
+        self.tile_size = tuple(inputs[0][1][2:])
+        self.scale = inputs[1][1][2] // inputs[0][1][2]
+
+    def get_inputs(self, lr, cubic):
+        return {
+            self.inputs[0][0]: lr.transpose((0, 3, 1, 2)),  # from NHWC to NCHW
+            self.inputs[1][0]: cubic.transpose((0, 3, 1, 2))
+        }
+
+    def __call__(self, lr, cubic):
+        result = self.exec_net.infer(inputs=self.get_inputs(lr, cubic))
+        return result[self.out_blob].transpose((0, 2, 3, 1))
+
+    def start(self, lr, cubic):
+        request_id = self.free_requests.popleft()
+        self.exec_net.start_async(request_id=request_id, inputs=self.get_inputs(lr, cubic))
+        return request_id
+
+    def wait(self, request_id):
+        request = self.exec_net.requests[request_id]
+        request.wait(-1)
+        # output buffer is reused by the next start of the request
+        result = request.outputs[self.out_blob].transpose((0, 2, 3, 1)).copy()
+        self.free_requests.append(request_id)
+        return result
 
 
-def blob_to_img(blob):
-    blob = blob.transpose((1, 2, 0))   # from CHW to HWC
-    blob = np.clip(blob, 0.0, 1.0)
-
-    # Suppression skimage warning:
-    #    UserWarning: Possible precision loss when converting from float32 to uint8
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        blob = skimage.img_as_ubyte(blob)
-    return blob
-
 def main():
     args = build_argparser()
-    exec_net, inputs, out_blob = load_ir_model(args.model, args.device)
-
-    # Prepare input blobs
-    ih, iw = inputs[0][1][2:]
-    image = cv2.imread(args.input_image)
-    if image.shape[0] != ih or image.shape[1] != iw:
-        image = image[0:ih, 0:iw]
-
-    cubic = cv2.resize(image, (inputs[1][1][3], inputs[1][1][2]), interpolation=cv2.INTER_CUBIC)
-
-    blob1 = image_to_blob(image, (inputs[0][1]))
-    blob2 = image_to_blob(cubic, (inputs[1][1]))
-
-    # inference
-    result = exec_net.infer(inputs={inputs[0][0]: blob1, inputs[1][0]: blob2})
-
-    # Postprocessing
-    out_img = blob_to_img(result[out_blob][0])
-
-    # Save image
-    outpur_dir = args.output_dir if args.output_dir else os.path.dirname(args.input_image)
-    out_path = os.path.join(outpur_dir, 'sr_' + os.path.basename(args.input_image))
-    cv2.imwrite(out_path, out_img)
-    print('Saved: ', out_path)
+    backend = IEBackend(*load_ir_model(args.model, args.device, args.num_requests), args.num_requests)
+    upscaler = TiledSR(backend, backend.scale, overlap=args.tile_overlap)
+
+    # Images larger than IR input are split into tiles of the input size,
+    # tiles of consecutive images share the infer requests
+    pipeline = FolderPipeline(upscaler, args.num_readers, args.num_writers)
+    saved, stats = pipeline.run(list_images(args.input), args.output_dir)
+    for out_path in saved:
+        print('Saved: ', out_path)
+    print(', '.join('{}: {:.3f}'.format(k, v) for k, v in stats.items()))
 
 if __name__ == '__main__':
     main()
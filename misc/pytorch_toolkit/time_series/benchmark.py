@@ -0,0 +1,63 @@
+import argparse
+import time
+import torch
+from core.utils import load_config, get_dtype, autocast
+from core.models.temporal_fusion_transformer import TemporalFusionTransformer
+from core.loss import QuantileLoss
+
+
+def random_inputs(cfg, batch_size, time_steps):
+    regular = torch.randn(batch_size, time_steps, cfg.num_regular_variables)
+    categorical = torch.stack([
+        torch.randint(0, n, (batch_size, 1)).expand(batch_size, time_steps) for n in cfg.category_counts
+    ], dim=-1).to(regular.dtype)
+    return torch.cat([regular, categorical], dim=-1)
+
+
+def measure(model, criterion, inputs, precision, iters, train):
+    dtype = get_dtype(precision)
+    model = model.to(dtype).train(train)
+    inputs = inputs.to(dtype)
+    outputs = inputs[:, model.cfg.num_encoder_steps:, 0]
+    opt = torch.optim.Adam(model.parameters(), lr=1e-4) if train else None
+
+    def step():
+        with torch.set_grad_enabled(train):
+            with autocast(precision):
+                preds = model(inputs)
+            loss = criterion(preds.to(dtype), outputs)
+        if train:
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+
+    # warm up
+    step()
+    start = time.perf_counter()
+    for _ in range(iters):
+        step()
+    return iters * inputs.shape[0] / (time.perf_counter() - start)
+
+
+def main(args):
+    cfg = load_config(args.cfg)
+    torch.manual_seed(0)
+    model = TemporalFusionTransformer(cfg.model)
+    criterion = QuantileLoss(cfg.model.quantiles)
+    inputs = random_inputs(cfg.model, args.batch_size, args.time_steps)
+    for precision in args.precisions:
+        for train in [True, False]:
+            throughput = measure(model, criterion, inputs, precision, args.iters, train)
+            print(f"{precision} {'train' if train else 'infer'}: {throughput:.1f} samples/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cfg", type=str, help="path to config file")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--time-steps", type=int, default=8 * 24, help="number of input and output timestamps")
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--precisions", type=str, nargs="+", default=["fp64", "fp32", "bf16"],
+                        choices=("fp64", "fp32", "bf16"))
+    args = parser.parse_args()
+    main(args)
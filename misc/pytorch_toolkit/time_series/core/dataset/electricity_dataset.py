@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 from torch.utils.data import Dataset
@@ -5,81 +6,131 @@ from .electricity_utils import *
 from .utils import *
 
 
+CACHE_VERSION = "v1"
+SPLITS = ["train", "val", "test"]
+
+
 class ElectricityDataset(Dataset):
     @staticmethod
-    def get_split(data_folder, num_encoder_steps=7 * 24):
-        data_path = os.path.join(data_folder, 'LD2011_2014.txt')
-        if not os.path.isfile(data_path):
-            ElectricityDataset.download(data_path)
-        formatter = ElectricityFormatter()
-        train, val, test = formatter.split_data(
-            ElectricityDataset.aggregating_to_hourly_data(
-                pd.read_csv(data_path, index_col=0, sep=';', decimal=',')
+    def get_split(data_folder, num_encoder_steps=7 * 24, use_cache=True):
+        cache_path = os.path.join(data_folder, 'electricity.{}.npz'.format(CACHE_VERSION))
+        if use_cache and os.path.isfile(cache_path):
+            print('Loading processed splits from {}'.format(cache_path))
+            splits = ElectricityDataset.load_splits(cache_path)
+        else:
+            data_path = os.path.join(data_folder, 'LD2011_2014.txt')
+            if not os.path.isfile(data_path):
+                ElectricityDataset.download(data_path)
+            formatter = ElectricityFormatter()
+            train, val, test = formatter.split_data(
+                ElectricityDataset.aggregating_to_hourly_data(
+                    pd.read_csv(data_path, index_col=0, sep=';', decimal=',')
+                )
             )
-        )
-        return [ElectricityDataset(data, formatter, num_encoder_steps) for data in [train, val, test]]
+            splits = [ElectricityDataset.to_arrays(data, formatter) for data in [train, val, test]]
+            if use_cache:
+                ElectricityDataset.save_splits(cache_path, splits)
+        lookback = ElectricityFormatter().get_time_steps()
+        return [ElectricityDataset(split, num_encoder_steps, lookback) for split in splits]
 
-    def __init__(self, data, formatter, num_encoder_steps):
+    def __init__(self, split, num_encoder_steps, lookback):
         super().__init__()
-        self.formatter = formatter
         self.num_encoder_steps = num_encoder_steps
-        self.data = data.reset_index(drop=True)
-        self.data_index, self.col_mappings = self.build_data_index(self.data)
+        self.lookback = lookback
+        # rows of all series are stored one after another, series i is values[offsets[i]:offsets[i + 1]]
+        self.values = np.ascontiguousarray(split["values"], dtype=np.float32)
+        self.offsets = split["offsets"]
+        self.mean = split["mean"].astype(np.float32)
+        self.scale = split["scale"].astype(np.float32)
+        self.ids = split["ids"]
+        self.target_idx = int(split["target_idx"])
+        self.starts, self.series = self.build_data_index(self.offsets, lookback)
+        self.windows = None
 
     def __len__(self):
-        return self.data_index.shape[0]
+        return self.starts.shape[0]
 
     def __getitem__(self, idx):
-        _data_index = self.data.iloc[self.data_index.init_abs.iloc[idx]:self.data_index.end_abs.iloc[idx]]
-
-        data_map = {}
-        for k in self.col_mappings:
-            cols = self.col_mappings[k]
-
-            if k not in data_map:
-                data_map[k] = [_data_index[cols].values]
-            else:
-                data_map[k].append(_data_index[cols].values)
-
-        for k in data_map:
-            data_map[k] = np.concatenate(data_map[k], axis=0)
-
-        scaler = self.formatter._target_scaler[data_map["identifier"][0][0]]
-        outputs = data_map['outputs'][self.num_encoder_steps:, 0]
-        return data_map['inputs'], outputs, scaler.mean_, scaler.scale_
-
-    def build_data_index(self, data):
-        column_definition = self.formatter._column_definition
-        col_mappings = {
-            'identifier': [get_single_col_by_input_type(InputTypes.ID, column_definition)],
-            'time': [get_single_col_by_input_type(InputTypes.TIME, column_definition)],
-            'outputs': [get_single_col_by_input_type(InputTypes.TARGET, column_definition)],
-            'inputs': [tup[0] for tup in column_definition if tup[2] not in {InputTypes.ID, InputTypes.TIME}]
+        if self.windows is None:
+            self.windows = self.get_windows(self.values, self.lookback)
+        # idx can be an array of indexes to gather the whole batch at once,
+        # take copies the windows out of the read-only view in both cases
+        inputs = np.take(self.windows, self.starts[idx], axis=0)
+        outputs = inputs[..., self.num_encoder_steps:, self.target_idx]
+        s = self.series[idx]
+        return inputs, outputs, self.mean[s, None], self.scale[s, None]
+
+    def get_batch(self, indexes):
+        return self[np.asarray(indexes, dtype=np.int64)]
+
+    def __getstate__(self):
+        # windows is a strided view and would be copied into a full array by pickle
+        state = self.__dict__.copy()
+        state["windows"] = None
+        return state
+
+    @staticmethod
+    def get_windows(values, lookback):
+        # [N - lookback + 1, lookback, n_features] read-only zero-copy view, window i starts at row i
+        if values.shape[0] < lookback:
+            return np.empty((0, lookback, values.shape[1]), dtype=values.dtype)
+        windows = np.lib.stride_tricks.sliding_window_view(values, lookback, axis=0)
+        return windows.transpose(0, 2, 1)
+
+    @staticmethod
+    def build_data_index(offsets, lookback):
+        # window has to end before the last row of its series
+        counts = np.maximum(np.diff(offsets) - lookback, 0)
+        series = np.repeat(np.arange(counts.shape[0]), counts)
+        starts = np.arange(series.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts) + offsets[series]
+        return starts.astype(np.int64), series.astype(np.int64)
+
+    @staticmethod
+    def to_arrays(data, formatter):
+        column_definition = formatter._column_definition
+        id_col = get_single_col_by_input_type(InputTypes.ID, column_definition)
+        target_col = get_single_col_by_input_type(InputTypes.TARGET, column_definition)
+        input_cols = [tup[0] for tup in column_definition if tup[2] not in {InputTypes.ID, InputTypes.TIME}]
+
+        values, lengths, mean, scale, ids = [], [], [], [], []
+        for identifier, sliced in data.groupby(id_col, sort=False):
+            values.append(sliced[input_cols].values.astype(np.float32))
+            lengths.append(len(sliced))
+            scaler = formatter._target_scaler[identifier]
+            mean.append(scaler.mean_[0])
+            scale.append(scaler.scale_[0])
+            ids.append(identifier)
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return {
+            "values": np.concatenate(values, axis=0),
+            "offsets": offsets,
+            "mean": np.array(mean, dtype=np.float64),
+            "scale": np.array(scale, dtype=np.float64),
+            "ids": np.array(ids, dtype=str),
+            "target_idx": np.array(input_cols.index(target_col))
         }
-        lookback = self.formatter.get_time_steps()
-        data_index = self.get_index_filtering(data, col_mappings["identifier"], col_mappings["outputs"], lookback)
-        group_size = data.groupby(col_mappings["identifier"]).apply(lambda x: x.shape[0]).mean()
-        data_index = data_index[data_index.end_rel < group_size].reset_index()
-        return data_index, col_mappings
-
-    def get_index_filtering(self, data, id_col, target_col, lookback):
-        g = data.groupby(id_col)
-
-        df_index_abs = g[target_col].transform(lambda x: x.index+lookback) \
-                        .reset_index() \
-                        .rename(columns={'index': 'init_abs', target_col[0]: 'end_abs'})
-        df_index_rel_init = g[target_col].transform(lambda x: x.reset_index(drop=True).index) \
-                        .rename(columns={target_col[0]: 'init_rel'})
-        df_index_rel_end = g[target_col].transform(lambda x: x.reset_index(drop=True).index+lookback) \
-                        .rename(columns={target_col[0]: 'end_rel'})
-        df_total_count = g[target_col].transform(lambda x: x.shape[0] - lookback + 1) \
-                        .rename(columns = {target_col[0]: 'group_count'})
-
-        return pd.concat([df_index_abs,
-                          df_index_rel_init,
-                          df_index_rel_end,
-                          data[id_col],
-                          df_total_count], axis = 1).reset_index(drop = True)
+
+    @staticmethod
+    def save_splits(cache_path, splits):
+        arrays = {}
+        for name, split in zip(SPLITS, splits):
+            for k, v in split.items():
+                arrays["{}_{}".format(name, k)] = v
+        # write to temporary file first to not leave broken cache if interrupted
+        tmp_path = cache_path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, cache_path)
+        print('Processed splits are saved to {}'.format(cache_path))
+
+    @staticmethod
+    def load_splits(cache_path):
+        with np.load(cache_path) as data:
+            return [
+                {k[len(name) + 1:]: data[k] for k in data.files if k.startswith(name + "_")}
+                for name in SPLITS
+            ]
 
     @staticmethod
     def aggregating_to_hourly_data(df):
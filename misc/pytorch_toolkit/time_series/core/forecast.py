@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+from torch.utils.data.dataloader import default_collate
+from tqdm import tqdm
+from core.utils import get_dtype, autocast
+from core.loss import NormalizedQuantileLoss
+
+
+def get_batch(dataset, indexes):
+    if hasattr(dataset, "get_batch"):
+        return [torch.as_tensor(np.ascontiguousarray(x)) for x in dataset.get_batch(indexes)]
+    return default_collate([dataset[i] for i in indexes])
+
+
+@torch.no_grad()
+def rolling_forecast(model, dataset, batch_size=2048, stride=1, precision="fp32", device="cpu", is_tqdm=True):
+    """ Forecasts every rolling origin of every series in dataset.
+
+    Origins are dataset samples, `stride` keeps every stride-th of them.
+    Returns denormalized predictions [N, output_timestamps, n_quantiles] and ground truth [N, output_timestamps].
+    """
+    dtype = get_dtype(precision)
+    model = model.to(device).eval()
+    indexes = np.arange(0, len(dataset), stride)
+    preds, gt = [], []
+    iterator = range(0, len(indexes), batch_size)
+    for i in tqdm(iterator) if is_tqdm else iterator:
+        inputs, outputs, mean, scale = get_batch(dataset, indexes[i:i + batch_size])
+        inputs = inputs.to(device=device, dtype=dtype)
+        with autocast(precision, torch.device(device).type):
+            p = model(inputs)
+        mean, scale = mean.to(device=device, dtype=dtype), scale.to(device=device, dtype=dtype)
+        preds.append((p.to(dtype) * scale.view(-1, 1, 1) + mean.view(-1, 1, 1)).cpu())
+        gt.append((outputs.to(device=device, dtype=dtype) * scale + mean).cpu())
+    return torch.cat(preds), torch.cat(gt)
+
+
+def score_forecast(preds, gt, quantiles):
+    criterion = NormalizedQuantileLoss()
+    return {q: criterion(preds[:, :, i], gt, q).item() for i, q in enumerate(quantiles)}
@@ -6,7 +6,9 @@ import torch.nn.functional as F
 class QuantileLoss(nn.Module):
     def __init__(self, quantiles):
         super().__init__()
+        assert all(q > 0.0 and q < 1.0 for q in quantiles)
         self.quantiles = quantiles
+        self.register_buffer("q", torch.tensor(quantiles, dtype=torch.float64), persistent=False)
 
     def loss(self, pred, gt, quantile):
         assert quantile > 0.0 and quantile < 1.0
@@ -15,13 +17,13 @@ class QuantileLoss(nn.Module):
         return loss.unsqueeze(1)
 
     def forward(self, pred, gt):
-        loss = []
-        for i, q in enumerate(self.quantiles):
-            loss.append(
-                self.loss(pred[:, :, i], gt[:, :, i], q)
-            )
-        loss = torch.mean(torch.sum(torch.cat(loss, axis=1), axis=1))
-        return loss
+        # pred [B, T, Q], gt [B, T, Q] or [B, T] shared by all quantiles
+        if gt.dim() == pred.dim() - 1:
+            gt = gt.unsqueeze(-1)
+        delta = gt - pred
+        q = self.q.to(delta.dtype)
+        loss = q * F.relu(delta) + (1.0 - q) * F.relu(-delta)
+        return torch.mean(torch.sum(loss, axis=-1))
 
 
 class NormalizedQuantileLoss(nn.Module):
@@ -24,7 +24,7 @@ class TemporalSelfAttention(nn.Module):
         return out
 
     def _get_attn_mask(self, var):
-        b, l = var.shape[:2]
-        eye = torch.eye(l).to(var.device)
-        mask = torch.cumsum(eye, 0).repeat(b, 1, 1).to(torch.float32).data
+        # [1, L, L] causal mask is broadcast over batch instead of repeating it for every sample
+        l = var.shape[1]
+        mask = torch.cumsum(torch.eye(l, device=var.device), 0).unsqueeze(0)
         return mask
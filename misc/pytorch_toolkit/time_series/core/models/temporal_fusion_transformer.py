@@ -10,7 +10,8 @@ class TemporalFusionTransformer(nn.Module):
         self._init_model()
 
     def forward(self, inputs):
-        regular_inputs = inputs[:, :, :self.cfg.num_regular_variables].to(torch.float)
+        # regular inputs follow the dtype of weights, categorical ones are kept in input dtype till cast to long
+        regular_inputs = inputs[:, :, :self.cfg.num_regular_variables].to(self.predictor.weight.dtype)
         categorical_inputs = inputs[:, :, self.cfg.num_regular_variables:].to(torch.long)
         unknown_inputs, known_combined_layer, obs_inputs, static_inputs = self.embedding(
             regular_inputs, categorical_inputs
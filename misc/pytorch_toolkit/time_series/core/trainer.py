@@ -9,6 +9,9 @@ from torch.utils.data import DataLoader
 from core.models.temporal_fusion_transformer import TemporalFusionTransformer
 # loss
 from core.loss import QuantileLoss, NormalizedQuantileLoss
+# precision
+from core.utils import get_dtype, autocast
+from core.forecast import rolling_forecast, score_forecast
 
 
 class TimeSeriesTrainer(pl.LightningModule):
@@ -19,20 +22,27 @@ class TimeSeriesTrainer(pl.LightningModule):
         self.model = TemporalFusionTransformer(cfg.model)
         self.train_criterion = QuantileLoss(cfg.model.quantiles)
         self.test_criterion = NormalizedQuantileLoss()
+        # fp64 | fp32 | bf16 (autocast), precision and dtype are owned by lightning
+        self.precision_mode = self.cfg.get("precision", "fp32")
+        self.compute_dtype = get_dtype(self.precision_mode)
+        self.model.to(self.compute_dtype)
+
+    def _forward(self, inputs):
+        with autocast(self.precision_mode, inputs.device.type):
+            preds = self.model(inputs.to(self.compute_dtype))
+        return preds.to(self.compute_dtype)
 
     def training_step(self, batch, batch_idx):
         inputs, outputs, mean, scale = batch
-        inputs, outputs = inputs.to(float), outputs.to(float)
-        preds = self.model(inputs)
-        loss = self.train_criterion(preds, torch.stack([outputs, outputs, outputs], dim=-1))
+        preds = self._forward(inputs)
+        loss = self.train_criterion(preds, outputs.to(self.compute_dtype))
         self.log("loss", loss, on_step=False, on_epoch=True, prog_bar=True, logger=True)
         return {"loss": loss.unsqueeze(0)}
 
     def validation_step(self, batch, batch_idx):
         inputs, outputs, mean, scale = batch
-        inputs, outputs = inputs.to(float), outputs.to(float)
-        preds = self.model(inputs)
-        loss = self.train_criterion(preds, torch.stack([outputs, outputs, outputs], dim=-1))
+        preds = self._forward(inputs)
+        loss = self.train_criterion(preds, outputs.to(self.compute_dtype))
         self.log("loss_val", loss, on_step=False, on_epoch=True, prog_bar=True, logger=True)
         return {"loss_val": loss.unsqueeze(0)}
 
@@ -44,10 +54,10 @@ class TimeSeriesTrainer(pl.LightningModule):
 
     def eval_step(self, batch, batch_idx):
         inputs, outputs, mean, scale = batch
-        inputs, outputs = inputs.to(float), outputs.to(float)
-        preds = self.model(inputs)
+        mean, scale = mean.to(self.compute_dtype), scale.to(self.compute_dtype)
+        preds = self._forward(inputs)
         preds = preds * scale.view(-1, 1, 1) + mean.view(-1, 1, 1)
-        outputs = outputs * scale + mean
+        outputs = outputs.to(self.compute_dtype) * scale + mean
         return {"outputs": outputs, "preds": preds}
 
     def eval_epoch_end(self, outputs, mode):
@@ -85,6 +95,10 @@ class TimeSeriesTrainer(pl.LightningModule):
             shuffle=False
         )
 
+    def rolling_forecast(self, batch_size=2048, stride=1, device="cpu"):
+        preds, gt = rolling_forecast(self.model, self.testset, batch_size, stride, self.precision_mode, device)
+        return score_forecast(preds, gt, self.model.cfg.quantiles)
+
     def configure_optimizers(self):
         # optimizer
         opt = torch.optim.Adam(self.model.parameters(), lr=self.cfg.lr)
@@ -100,7 +114,7 @@ class TimeSeriesTrainer(pl.LightningModule):
         inputs = inputs[0].unsqueeze(0).repeat(batch_size, 1, 1)
         torch.onnx.export(
             self.model,
-            (inputs.float(),),
+            (inputs.to(self.compute_dtype),),
             onnx_path,
             input_names=["timestamps"],
             output_names=["quantiles"],
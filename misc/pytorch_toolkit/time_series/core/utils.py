@@ -1,6 +1,29 @@
+import contextlib
 import json
+import torch
 from addict import Dict
 
 def load_config(cfg_path):
     cfg = Dict(json.load(open(cfg_path)))
     return cfg
+
+
+# bf16 keeps fp32 inputs and weights and runs the model under autocast
+PRECISIONS = {
+    "fp64": torch.float64,
+    "fp32": torch.float32,
+    "bf16": torch.float32
+}
+
+
+def get_dtype(precision):
+    assert precision in PRECISIONS, "unknown precision {}".format(precision)
+    return PRECISIONS[precision]
+
+
+def autocast(precision, device_type="cpu"):
+    if precision != "bf16":
+        return contextlib.nullcontext()
+    if not hasattr(torch, "autocast"):
+        raise RuntimeError("bf16 precision requires torch>=1.10")
+    return torch.autocast(device_type, dtype=torch.bfloat16)
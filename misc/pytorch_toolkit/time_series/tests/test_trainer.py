@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pytorch_lightning as pl
+import torch
+from addict import Dict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core.dataset import DATASETS, ElectricityDataset
+from core.trainer import TimeSeriesTrainer
+
+NUM_ENCODER_STEPS = 8
+LOOKBACK = 12
+
+
+class SyntheticDataset(ElectricityDataset):
+    @staticmethod
+    def get_split(num_series=3, length=40):
+        rng = np.random.RandomState(0)
+        values = rng.rand(num_series * length, 5).astype(np.float32)
+        # last column is the static id of the series
+        values[:, 4] = np.repeat(np.arange(num_series), length)
+        split = {
+            "values": values,
+            "offsets": np.arange(num_series + 1) * length,
+            "mean": rng.rand(num_series),
+            "scale": rng.rand(num_series) + 0.5,
+            "ids": np.arange(num_series).astype(str),
+            "target_idx": np.array(0)
+        }
+        return [SyntheticDataset(split, NUM_ENCODER_STEPS, LOOKBACK) for _ in range(3)]
+
+
+DATASETS["synthetic"] = SyntheticDataset
+
+
+def get_config(precision):
+    return Dict({
+        "dataset": {"name": "synthetic", "params": {}},
+        "pipeline": {
+            "batch_size": 16,
+            "num_workers": 0,
+            "lr": 0.001,
+            "milestones": [50],
+            "epochs": 1,
+            "precision": precision
+        },
+        "model": {
+            "num_categorical_variables": 1,
+            "num_regular_variables": 4,
+            "category_counts": [3],
+            "hidden_size": 8,
+            "dropout": 0.1,
+            "num_heads": 2,
+            "output_size": 1,
+            "quantiles": [0.1, 0.5, 0.9],
+            "num_encoder_steps": NUM_ENCODER_STEPS,
+            "input_obs_idx": [0],
+            "static_input_idx": [4],
+            "known_categorical_input_idx": [0],
+            "known_regular_input_idx": [1, 2, 3]
+        }
+    })
+
+
+class TestTrainer(unittest.TestCase):
+    def run_step(self, precision, compute_dtype):
+        model = TimeSeriesTrainer(get_config(precision))
+        self.assertEqual(model.compute_dtype, torch.float32)
+        # dtype of the predictor output shows whether autocast is enabled
+        predictor_dtypes = []
+        model.model.predictor.register_forward_hook(lambda m, i, o: predictor_dtypes.append(o.dtype))
+
+        with tempfile.TemporaryDirectory() as root:
+            trainer = pl.Trainer(
+                max_epochs=1,
+                limit_train_batches=1,
+                limit_val_batches=1,
+                limit_test_batches=1,
+                logger=False,
+                checkpoint_callback=False,
+                default_root_dir=root
+            )
+            trainer.fit(model)
+            trainer.test(model)
+
+        self.assertEqual(model.precision_mode, precision)
+        self.assertTrue(predictor_dtypes)
+        self.assertTrue(all(dtype == compute_dtype for dtype in predictor_dtypes))
+        self.assertTrue(all(p.dtype == torch.float32 for p in model.model.parameters()))
+
+        scores = model.rolling_forecast(batch_size=32)
+        self.assertEqual(set(scores), {0.1, 0.5, 0.9})
+        self.assertTrue(all(np.isfinite(v) for v in scores.values()))
+
+    def test_fp32_step(self):
+        self.run_step("fp32", torch.float32)
+
+    def test_bf16_step(self):
+        self.run_step("bf16", torch.bfloat16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -38,6 +38,10 @@ def main(args):
     )
     if args.test:
         trainer.test(pipeline)
+    elif args.forecast:
+        device = "cuda" if args.gpus > 0 else "cpu"
+        for q, loss in pipeline.rolling_forecast(args.forecast_batch_size, args.forecast_stride, device).items():
+            print(f"loss_forecast_{q}: {loss:.4f}")
     elif args.to_onnx is not None:
         pipeline.to_onnx(args.to_onnx, args.onnx_batch_size)
     else:
@@ -58,6 +62,10 @@ if __name__ == "__main__":
     parser.add_argument("--output-dir", type=str, default="checkpoints/", help="path to store checkpoints")
     # test mode
     parser.add_argument("--test", action="store_true")
+    # rolling forecast on test split
+    parser.add_argument("--forecast", action="store_true")
+    parser.add_argument("--forecast-batch-size", type=int, default=2048)
+    parser.add_argument("--forecast-stride", type=int, default=1, help="use every n-th forecast origin")
     # ckpt
     parser.add_argument("--ckpt", type=str, default=None)
     # onnx export
@@ -14,7 +14,6 @@
  limitations under the License.
 """
 
-import collections
 import json
 import random
 
@@ -23,6 +22,7 @@ import numpy as np
 import tensorflow as tf
 
 from image_retrieval.common import preproces_image, depreprocess_image, fit_to_max_size, from_list
+from image_retrieval.image_store import ImageStore
 
 
 def blur(image):
@@ -119,18 +119,22 @@ class Dataset:
         self.params = params
         self.return_original = return_original
 
-        self.loaded_images = []
+        self.store = None
         self.labels = Dataset.reassign_labels(labels)
         self.is_real = is_real
+        # samples are images or their tiled copies, tiling 1 means the image itself
+        self.sources = list(range(len(self.labels)))
+        self.tilings = [1] * len(self.labels)
 
         if self.params['preload']:
             self.preload()
             if self.params['pretile']:
                 self.pretile()
 
-        self.images_indexes_per_class = collections.defaultdict(list)
-        for index, label in enumerate(self.labels):
-            self.images_indexes_per_class[label].append(index)
+        labels = np.array(self.labels, dtype=np.int64)
+        self.class_sizes = np.bincount(labels)
+        self.class_starts = np.cumsum(self.class_sizes) - self.class_sizes
+        self.class_members = np.argsort(labels, kind='stable')
 
         if self.params['weighted_sampling']:
             self.calc_sampling_probs()
@@ -140,39 +144,24 @@ class Dataset:
             distribution of images classes becomes uniform.
         '''
 
-        frequency = {l: self.labels.count(l) for l in set(self.labels)}
-
-        probs = np.empty((len(self.labels)), dtype=np.float32)
-        for idx, l in enumerate(self.labels):
-            probs[idx] = 1.0 / frequency[l]
+        probs = 1.0 / self.class_sizes[self.labels].astype(np.float32)
         self.probs = probs / np.sum(probs)
 
     def preload(self):
-        ''' Pre-loads images in RAM. '''
+        ''' Pre-loads images to memory mapped store, `preload_dir` param sets its folder. '''
 
-        for image_path in self.images_paths:
-            self.loaded_images.append(cv2.imread(image_path))
+        self.store = ImageStore(self.images_paths, self.params.get('preload_dir'))
 
     def pretile(self):
-        ''' Pre-tiles images in RAM. Makes training faster but requires huge amount of RAM. '''
-
-        tiled_labels = []
-        tiled_is_real = []
-        tiled_loaded_images = []
+        ''' Adds tiled copies of images as samples, they are tiled on reading. '''
 
-        for read_image, label, real in zip(self.loaded_images, self.labels, self.is_real):
-            if not real:
+        for index in range(len(self.labels)):
+            if not self.is_real[index]:
                 for n in range(2, self.params['max_tiling'] + 1):
-                    image = self.tile(read_image, n)
-
-                    tiled_labels.append(label)
-                    tiled_is_real.append(real)
-                    tiled_loaded_images.append(image)
-
-        self.labels.extend(tiled_labels)
-        self.is_real.extend(tiled_is_real)
-        self.loaded_images.extend(tiled_loaded_images)
-
+                    self.labels.append(self.labels[index])
+                    self.is_real.append(self.is_real[index])
+                    self.sources.append(index)
+                    self.tilings.append(n)
 
     def tile(self, image, n):
         ''' Tiles images taking their aspect ratios into account. '''
@@ -196,37 +185,40 @@ class Dataset:
     def sample_index(self):
         ''' Samples indexes. '''
 
-        choices = list(range(len(self.labels)))
+        num_samples = len(self.labels)
         if self.params['weighted_sampling']:
-            choices = np.random.choice(choices, len(self.labels), p=self.probs)
+            choices = np.random.choice(num_samples, num_samples, p=self.probs)
         elif self.params['shuffle']:
-            np.random.shuffle(choices)
+            choices = np.random.permutation(num_samples)
+        else:
+            choices = np.arange(num_samples)
 
         # duplication is required for triplet loss at least.
-        duplicated_choices = []
-        for choice in choices:
-            for _ in range(self.params['duplicate_n_times']):
-                duplicated_choices.append(int(
-                    np.random.choice(
-                        self.images_indexes_per_class[self.labels[choice]],
-                        1)))
+        choices = np.repeat(choices, self.params['duplicate_n_times'])
+        classes = np.array(self.labels, dtype=np.int64)[choices]
+        members = self.class_starts[classes] + np.random.randint(0, self.class_sizes[classes])
+        duplicated_choices = self.class_members[members]
 
         for choice in duplicated_choices:
-            yield [choice]
+            yield [int(choice)]
 
     def read(self, index):
         ''' Reads an image from RAM or disk and returns it with corresponding class label. '''
 
-        if self.params['preload']:
-            image = self.loaded_images[index[0]].astype(np.float32)
+        sample = index[0]
+        if self.store is not None:
+            image = self.store[self.sources[sample]]
+            if self.tilings[sample] > 1:
+                image = self.tile(image, self.tilings[sample])
+            image = image.astype(np.float32)
         else:
-            image = cv2.imread(self.images_paths[index[0]]).astype(np.float32)
+            image = cv2.imread(self.images_paths[self.sources[sample]]).astype(np.float32)
 
-        if not self.params['pretile'] and not self.is_real[index[0]]:
+        if not self.params['pretile'] and not self.is_real[sample]:
             n = random.randint(1, self.params['max_tiling'])
             image = self.tile(image, n)
 
-        return image, self.labels[index[0]]
+        return image, self.labels[sample]
 
     def cv2_rotate(self, image):
         ''' Rotates images on random angle using opencv. '''
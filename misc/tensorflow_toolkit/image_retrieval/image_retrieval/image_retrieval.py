@@ -14,12 +14,16 @@
  limitations under the License.
 """
 
+import glob
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from tqdm import tqdm
 
 import numpy as np
 
 import cv2
-from sklearn.metrics.pairwise import cosine_distances
 
 from image_retrieval.common import from_list, preproces_image
 
@@ -27,16 +31,91 @@ def nothing(image):
     return image
 
 
+def file_sha1(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as opened_file:
+        for chunk in iter(lambda: opened_file.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def model_key(model_paths, *params):
+    """ Key of the model for the embeddings index: hash of its files and parameters. """
+
+    sha1 = hashlib.sha1(repr(params).encode())
+    for path in sorted(model_paths):
+        sha1.update(file_sha1(path).encode())
+    return sha1.hexdigest()
+
+
+def checkpoint_files(model_path):
+    """ Files of the weights: the file itself or the index and data shards of a checkpoint prefix. """
+
+    if os.path.isfile(model_path):
+        return [model_path]
+    prefix = glob.escape(model_path)
+    return glob.glob(prefix + '.index') + glob.glob(prefix + '.data-*')
+
+
+def normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class EmbeddingsIndex:
+    """ Embeddings of images stored on disk by SHA1 of the image file, one file per model. """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        self.embeddings = None
+        if os.path.exists(path):
+            with np.load(path) as index:
+                self.rows = {key: row for row, key in enumerate(index['keys'])}
+                self.embeddings = index['embeddings']
+
+    def get(self, key):
+        row = self.rows.get(key)
+        return None if row is None else self.embeddings[row]
+
+    def update(self, keys, embeddings):
+        new_rows = {}
+        for i, key in enumerate(keys):
+            if key not in self.rows and key not in new_rows:
+                new_rows[key] = i
+        if not new_rows:
+            return
+        embeddings = embeddings[list(new_rows.values())]
+        self.embeddings = embeddings if self.embeddings is None else np.concatenate(
+            [self.embeddings, embeddings])
+        self.rows.update({key: len(self.rows) + i for i, key in enumerate(new_rows)})
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, keys=np.array(sorted(self.rows, key=self.rows.get)),
+                 embeddings=self.embeddings)
+        os.replace(tmp_path, self.path)
+
+
 class ImageRetrieval:
+    """ Searches images in the gallery by cosine distance between embeddings.
+
+    Gallery images are decoded by `num_workers` threads and embedded in batches of `batch_size`.
+    If `index_dir` is set, gallery embeddings are kept there by image file hash and model, so only
+    new images are embedded on the next start.
+    """
 
     def __init__(self, model_path, model_backend, model, gallery_path, input_size, cpu_extensions,
-                 multiple_images_per_label=False):
+                 multiple_images_per_label=False, batch_size=32, num_workers=4, index_dir=None):
         self.impaths, self.gallery_classes, _, self.text_label_to_class_id = from_list(
             gallery_path, multiple_images_per_label)
 
         self.input_size = input_size
+        self.batch_size = batch_size
+        self.num_workers = num_workers
 
         self.preprocess = preproces_image
+        model_files = []
 
         if model is None or isinstance(model, str):
             if model_backend == 'tf':
@@ -52,6 +131,7 @@ class ImageRetrieval:
                         tf.keras.layers.Input(shape=(input_size, input_size, 3)))
 
                 self.model.load_weights(model_path)
+                model_files = checkpoint_files(model_path)
             else:
                 from openvino.inference_engine import IENetwork, IECore
                 class IEModel():
@@ -62,6 +142,7 @@ class ImageRetrieval:
                             ie.add_extension(cpu_extensions, 'CPU')
 
                         path = '.'.join(model_path.split('.')[:-1])
+                        self.files = [path + '.xml', path + '.bin']
                         self.net = IENetwork(model=path + '.xml', weights=path + '.bin')
                         self.exec_net = ie.load_network(network=self.net, device_name='CPU')
 
@@ -69,47 +150,104 @@ class ImageRetrieval:
                         assert len(image.shape) == 4
 
                         image = np.transpose(image, (0, 3, 1, 2))
-                        out = self.exec_net.infer(inputs={'Placeholder': image})[
-                            'model/tf_op_layer_mul/mul/Normalize']
+                        # the network is loaded with its own batch size
+                        out = [self.exec_net.infer(inputs={'Placeholder': image[i:i + 1]})[
+                            'model/tf_op_layer_mul/mul/Normalize'] for i in range(len(image))]
 
-                        return out
+                        return np.concatenate(out)
 
                 self.model = IEModel(model_path)
                 self.preprocess = nothing
+                model_files = self.model.files
         else:
             self.model = model
 
+        self.index = None
+        if index_dir and model_files:
+            key = model_key(model_files, model_backend, model, input_size)
+            self.index = EmbeddingsIndex(os.path.join(index_dir, key + '.npz'))
+
         self.embeddings = self.compute_gallery_embeddings()
+        self.normed_embeddings = normalize(self.embeddings)
 
-    def compute_embedding(self, image):
+    def prepare(self, image):
         image = cv2.resize(image, (self.input_size, self.input_size))
-        image = self.preprocess(image)
-        image = np.expand_dims(image, axis=0)
+        return self.preprocess(image)
+
+    def compute_embedding(self, image):
+        image = np.expand_dims(self.prepare(image), axis=0)
         embedding = self.model.predict(image)
         return embedding
 
-    def search_in_gallery(self, embedding):
-        distances = cosine_distances(embedding, self.embeddings).reshape([-1])
-        sorted_indexes = np.argsort(distances)
-        return sorted_indexes, distances
+    def compute_embeddings(self, images):
+        """ Embeddings of a list of images computed in batches. """
 
-    def compute_gallery_embeddings(self):
-        images = []
+        embeddings = [self.model.predict(np.stack([self.prepare(image) for image in
+                                                   images[start:start + self.batch_size]]))
+                      for start in range(0, len(images), self.batch_size)]
+        return np.concatenate(embeddings).reshape([len(images), -1]).astype(np.float32)
 
-        for full_path in tqdm(self.impaths, desc='Reading gallery images.'):
-            image = cv2.imread(full_path)
-            if image is None:
-                print("ERROR: cannot find image, full_path =", full_path)
-            image = cv2.resize(image, (self.input_size, self.input_size))
-            image = self.preprocess(image)
-            image = np.expand_dims(image, axis=0)
-            images.append(image)
+    def search_in_gallery(self, embedding, top_k=None):
+        """ Returns gallery indexes sorted by distance to the embedding and all distances.
 
-        embeddings = [None for _ in self.impaths]
+        If `top_k` is set, only the indexes of the `top_k` nearest images are returned.
+        """
 
-        index = 0
-        for image in tqdm(images, desc='Computing embeddings of gallery images.'):
-            embeddings[index] = self.model.predict(image).reshape([-1])
-            index += 1
+        sorted_indexes, distances = self.search_batch(np.reshape(embedding, [1, -1]), top_k)
+        return sorted_indexes[0], distances[0]
 
-        return embeddings
+    def search_batch(self, embeddings, top_k=None):
+        """ Returns sorted gallery indexes ([N, top_k] if `top_k` is set) and [N, gallery size]
+            distances for N embeddings.
+        """
+
+        distances = self.distances(embeddings)
+        if top_k is None or top_k >= distances.shape[1]:
+            return np.argsort(distances, axis=1), distances
+        nearest = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        return np.take_along_axis(nearest, order, axis=1), distances
+
+    def distances(self, embeddings):
+        """ Cosine distances between embeddings and all gallery images. """
+
+        similarities = normalize(np.asarray(embeddings, np.float32)).dot(self.normed_embeddings.T)
+        return np.clip(1.0 - similarities, 0.0, 2.0)
+
+    def read_gallery_image(self, full_path):
+        with open(full_path, 'rb') as opened_file:
+            data = opened_file.read()
+        key = hashlib.sha1(data).hexdigest()
+        if self.index is not None and self.index.get(key) is not None:
+            return key, None
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise IOError("Cannot read image: {}".format(full_path))
+        return key, self.prepare(image)
+
+    def compute_gallery_embeddings(self):
+        embeddings = [None for _ in self.impaths]
+        keys = [None for _ in self.impaths]
+
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            for start in tqdm(range(0, len(self.impaths), self.batch_size),
+                              desc='Computing embeddings of gallery images.'):
+                batch = list(pool.map(self.read_gallery_image,
+                                      self.impaths[start:start + self.batch_size]))
+                indexes = [start + i for i, (_, image) in enumerate(batch) if image is not None]
+                if indexes:
+                    batch_embeddings = self.model.predict(
+                        np.stack([batch[index - start][1] for index in indexes]))
+                    for index, embedding in zip(indexes, batch_embeddings):
+                        embeddings[index] = np.reshape(embedding, [-1])
+                for i, (key, _) in enumerate(batch):
+                    keys[start + i] = key
+
+        if self.index is not None:
+            new = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+            if new:
+                self.index.update([keys[i] for i in new], np.stack([embeddings[i] for i in new]))
+            embeddings = [self.index.get(key) if embedding is None else embedding
+                          for key, embedding in zip(keys, embeddings)]
+
+        return np.stack(embeddings).astype(np.float32)
@@ -0,0 +1,113 @@
+"""
+ Copyright (c) 2019 Intel Corporation
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+PIXELS = 'pixels.u8'
+INDEX = 'index.json'
+
+
+def default_store_dir(images_paths):
+    ''' Folder in the temporary directory which is the same for the same list of images. '''
+
+    key = hashlib.sha1('\n'.join(images_paths).encode()).hexdigest()
+    return os.path.join(tempfile.gettempdir(), 'image_retrieval_store_' + key)
+
+
+def files_state(images_paths):
+    ''' Sizes and modification times of images, the store is rebuilt if they change. '''
+
+    return [[path, os.path.getsize(path), os.path.getmtime(path)] for path in images_paths]
+
+
+class ImageStore:
+    ''' Decoded uint8 images kept in one memory mapped file.
+
+        Images are decoded once by `num_workers` threads and read as views of the file, so the
+        page cache is shared by all processes reading the same store.
+    '''
+
+    def __init__(self, images_paths, store_dir=None, num_workers=8):
+        self.store_dir = store_dir if store_dir else default_store_dir(images_paths)
+        index_path = os.path.join(self.store_dir, INDEX)
+        state = files_state(images_paths)
+
+        index = None
+        if os.path.exists(index_path):
+            with open(index_path) as opened_file:
+                index = json.load(opened_file)
+        if index is None or index['files'] != state:
+            index = self.write(images_paths, state, num_workers)
+
+        self.offsets = np.array(index['offsets'], dtype=np.int64)
+        self.shapes = np.array(index['shapes'], dtype=np.int64).reshape([-1, 3])
+        self.pixels = None
+
+    def write(self, images_paths, state, num_workers):
+        os.makedirs(self.store_dir, exist_ok=True)
+        offsets, shapes = [], []
+        position = 0
+        pixels_path = os.path.join(self.store_dir, PIXELS)
+        index_path = os.path.join(self.store_dir, INDEX)
+        # every writer has its own temporary files, so runs writing the same store do not mix them
+        suffix = '.{}.tmp'.format(uuid.uuid4().hex)
+        try:
+            with open(pixels_path + suffix, 'wb') as pixels, \
+                    ThreadPoolExecutor(num_workers) as pool:
+                for image_path, image in zip(images_paths, pool.map(cv2.imread, images_paths)):
+                    if image is None:
+                        raise IOError('Cannot read image: {}'.format(image_path))
+                    offsets.append(position)
+                    shapes.append(image.shape)
+                    pixels.write(np.ascontiguousarray(image).tobytes())
+                    position += image.size
+
+            index = {'files': state, 'offsets': offsets, 'shapes': shapes}
+            with open(index_path + suffix, 'w') as opened_file:
+                json.dump(index, opened_file)
+            # pixels are moved into place first, the index marks the store as complete
+            os.replace(pixels_path + suffix, pixels_path)
+            os.replace(index_path + suffix, index_path)
+        finally:
+            for path in (pixels_path + suffix, index_path + suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+        return index
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pixels'] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        ''' Read-only view of the image. '''
+
+        if self.pixels is None:
+            self.pixels = np.memmap(os.path.join(self.store_dir, PIXELS), dtype=np.uint8, mode='r')
+        height, width, channels = self.shapes[index]
+        start = self.offsets[index]
+        return self.pixels[start:start + height * width * channels].reshape(height, width, channels)
@@ -22,10 +22,25 @@ from image_retrieval.frames_provider import FramesProvider
 from image_retrieval.image_retrieval import ImageRetrieval
 
 
+def probe_positions(distances, gallery_classes, probe_classes):
+    """ Position of the nearest gallery image of the probe class in the gallery sorted by distance
+        to the probe, for every row of [probes, gallery] distances.
+    """
+
+    gallery_classes = np.asarray(gallery_classes)
+    same_class = gallery_classes[np.newaxis] == np.asarray(probe_classes)[:, np.newaxis]
+    missing = ~np.any(same_class, axis=1)
+    if np.any(missing):
+        raise ValueError('Probe classes are not in the gallery: {}'.format(
+            sorted(set(np.asarray(probe_classes)[missing].tolist()))))
+    class_distances = np.min(np.where(same_class, distances, np.inf), axis=1)
+    return np.sum(distances < class_distances[:, np.newaxis], axis=1)
+
+
 def test_model(model_path, model_backend, model, gallery_path, test_images, input_size,
-               cpu_extension=None):
+               cpu_extension=None, index_dir=None):
     img_retrieval = ImageRetrieval(model_path, model_backend, model, gallery_path, input_size,
-                                   cpu_extension)
+                                   cpu_extension, index_dir=index_dir)
     frames = FramesProvider(test_images)
 
     top1_counters = []
@@ -33,17 +48,23 @@ def test_model(model_path, model_backend, model, gallery_path, test_images, inpu
     top10_counters = []
     mean_positions = []
 
-    results = collections.defaultdict(list)
-
+    images, embeddings, probe_classes = [], [], []
     for image, probe_class in frames:
         if image is not None:
-            probe_embedding = img_retrieval.compute_embedding(image)
-
-            sorted_indexes, _ = img_retrieval.search_in_gallery(probe_embedding)
+            images.append(image)
+            probe_classes.append(probe_class)
+            if len(images) == img_retrieval.batch_size:
+                embeddings.append(img_retrieval.compute_embeddings(images))
+                images = []
+    if images:
+        embeddings.append(img_retrieval.compute_embeddings(images))
 
-            sorted_classes = [img_retrieval.gallery_classes[i] for i in sorted_indexes]
-            position = sorted_classes.index(probe_class)
-            results[probe_class].append(position)
+    results = collections.defaultdict(list)
+    if embeddings:
+        distances = img_retrieval.distances(np.concatenate(embeddings))
+        positions = probe_positions(distances, img_retrieval.gallery_classes, probe_classes)
+        for probe_class, position in zip(probe_classes, positions):
+            results[probe_class].append(int(position))
 
     global_top1 = 0
     global_counter = 0
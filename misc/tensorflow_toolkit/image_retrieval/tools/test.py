@@ -29,6 +29,9 @@ def parse_args():
     args.add_argument('--model', choices=['resnet50', 'mobilenet_v2'], default='mobilenet_v2')
     args.add_argument('--ie', choices=['tf', 'ie'], required=True)
     args.add_argument('--cpu_extension', help='Path to lib cpu extensions.')
+    args.add_argument('--index_dir',
+                      help='Folder to keep gallery embeddings, they are recomputed only for new '
+                           'images or another model.')
 
     return args.parse_args()
 
@@ -46,7 +49,8 @@ def main():
                gallery_path=args.gallery,
                test_images=args.test_images,
                input_size=args.input_size,
-               cpu_extension=args.cpu_extension)
+               cpu_extension=args.cpu_extension,
+               index_dir=args.index_dir)
 
 
 if __name__ == '__main__':
@@ -13,7 +13,6 @@
 # and limitations under the License.
 
 import re
-import cv2
 import numpy as np
 import tensorflow as tf
 import tensorflow.contrib.slim as slim
@@ -24,17 +23,22 @@ from spatial_transformer import transformer
 class InputData:
   # pylint: disable=too-many-arguments
   def __init__(self, batch_size, input_shape, file_list_path,
-               apply_basic_aug=False, apply_stn_aug=True, apply_blur_aug=False):
+               apply_basic_aug=False, apply_stn_aug=True, apply_blur_aug=False, vocab=None,
+               num_parallel_calls=8):
     self.batch_size = batch_size
     self.input_shape = input_shape
     self.file_list_path = file_list_path
     self.apply_basic_aug = apply_basic_aug
     self.apply_stn_aug = apply_stn_aug
     self.apply_blur_aug = apply_blur_aug
+    self.vocab = vocab
+    self.num_parallel_calls = num_parallel_calls
 
   def input_fn(self):
-    file_src = tf.train.string_input_producer([self.file_list_path])
-    image, label = read_data(self.batch_size, self.input_shape, file_src)
+    """Returns batches of images, labels and labels encoded by encode_labels"""
+    image, label, encoded_label = read_data(self.batch_size, self.input_shape, self.file_list_path,
+                                            self.vocab if self.vocab else CTCUtils.vocab,
+                                            self.num_parallel_calls)
 
     if self.apply_basic_aug:
       image = augment(image)
@@ -44,31 +48,61 @@ class InputData:
 
     # blur/sharpen augmentation
     if self.apply_blur_aug:
-      data, = tf.py_func(random_blur, [image], [tf.float32])
-      data.set_shape([self.batch_size] + list(self.input_shape))  # [batch_size, height, width, channels_num]
+      data = random_blur(image)
     else:
       data = image
 
-    return data, label
+    return data, label, encoded_label
 
 
-def read_data(batch_size, input_shape, file_src):
-  reader = tf.TextLineReader()
-  _, value = reader.read(file_src)
-  filename, label = tf.decode_csv(value, [[''], ['']], ' ')
-  image_file = tf.read_file(filename)
+def read_file_list(file_list_path):
+  filenames, labels = [], []
+  with open(file_list_path, 'r') as file_:
+    for line in file_:
+      if line.strip():
+        filename, label = line.strip().split(' ')
+        filenames.append(filename)
+        labels.append(label)
+  return filenames, labels
+
+
+# Function for encoding labels once, sequences are padded with -1
+def encode_labels(labels, vocab):
+  encoded = [encode(label, vocab) for label in labels]
+  result = np.full([len(encoded), max(len(e) for e in encoded)], -1, dtype=np.int32)
+  for i, encoded_label in enumerate(encoded):
+    result[i, :len(encoded_label)] = encoded_label
+  return result
+
 
+def load_image(filename, input_shape):
   height, width, channels_num = input_shape
+  image_file = tf.read_file(filename)
   rgb_image = tf.image.decode_png(image_file, channels=channels_num)
   rgb_image_float = tf.image.convert_image_dtype(rgb_image, tf.float32)
-  resized_images = tf.image.resize_images(rgb_image_float, [height, width])
-  resized_images.set_shape(input_shape)
+  resized_image = tf.image.resize_images(rgb_image_float, [height, width])
+  resized_image.set_shape(input_shape)
+  return resized_image
 
-  min_after_dequeue = 30000
-  capacity = min_after_dequeue + 3 * batch_size
-  image_batch, label_batch = tf.train.shuffle_batch([resized_images, label], batch_size=batch_size, capacity=capacity,
-                                                    min_after_dequeue=min_after_dequeue)
-  return image_batch, label_batch
+
+def read_data(batch_size, input_shape, file_list_path, vocab, num_parallel_calls=8):
+  filenames, labels = read_file_list(file_list_path)
+  encoded_labels = encode_labels(labels, vocab)
+
+  # the list is fed by a generator to keep it out of the graph and checkpoints
+  def samples():
+    while True:
+      for i in np.random.permutation(len(filenames)):
+        yield filenames[i], labels[i], encoded_labels[i]
+
+  dataset = tf.data.Dataset.from_generator(samples, (tf.string, tf.string, tf.int32),
+                                           ([], [], [encoded_labels.shape[1]]))
+  dataset = dataset.map(lambda filename, label, encoded_label:
+                        (load_image(filename, input_shape), label, encoded_label),
+                        num_parallel_calls=num_parallel_calls)
+  dataset = dataset.batch(batch_size, drop_remainder=True)
+  dataset = dataset.prefetch(2)
+  return dataset.make_one_shot_iterator().get_next()
 
 
 # Function for basic image augmentation - photometric distortions
@@ -104,13 +138,16 @@ def apply_stn(images, transform_params):
   return warped
 
 
+# Filters every image with kernel [[0, s, 0], [s, 1 - 4s, s], [0, s, 0]], s ~ N(0, 1),
+# borders are reflected as in cv2.filter2D
 def random_blur(images):
-  result = []
-  for k in range(images.shape[0]):
-    samples = np.random.normal(scale=1.)
-    kernel = np.array([[0., samples, 0.], [samples, 1. - 4. * samples, samples], [0., samples, 0.]])
-    result.append(cv2.filter2D(images[k], -1, kernel).astype(np.float32))
-  return np.array(result)
+  channels_num = images.get_shape()[3].value
+  laplacian = tf.constant([[0., 1., 0.], [1., -4., 1.], [0., 1., 0.]])
+  laplacian = tf.tile(tf.reshape(laplacian, [3, 3, 1, 1]), [1, 1, channels_num, 1])
+  padded = tf.pad(images, [[0, 0], [1, 1], [1, 1], [0, 0]], mode='REFLECT')
+  edges = tf.nn.depthwise_conv2d(padded, laplacian, [1, 1, 1, 1], 'VALID')
+  samples = tf.random_normal([tf.shape(images)[0], 1, 1, 1])
+  return images + samples * edges
 
 
 # Function for construction whole network
@@ -157,6 +194,14 @@ class CTCUtils:
 
     return [np.array(x_ix), np.array(x_val), np.array(x_shape)]
 
+  # Generate CTC from labels encoded by encode_labels in graph
+  @staticmethod
+  def sparse_labels(encoded_labels):
+    indices = tf.where(tf.not_equal(encoded_labels, -1))
+    values = tf.gather_nd(encoded_labels, indices)
+    dense_shape = tf.stack([tf.shape(encoded_labels, out_type=tf.int64)[0], tf.reduce_max(indices[:, 1]) + 1])
+    return tf.SparseTensor(indices, values, dense_shape)
+
   # Function for computing simple accuracy metric
   @staticmethod
   def accuracy(gt_labels, values):
@@ -47,22 +47,24 @@ def edit_distance(string1, string2):
 
 def accuracy(label, val, vocab, r_vocab, lpr_patterns):
   pred = decode_beams(val, r_vocab)
-  label_len = len(label)
+  return accuracy_of_predictions([l.decode('utf-8') for l in label], pred, vocab, lpr_patterns)
+
+
+def accuracy_of_predictions(labels, pred, vocab, lpr_patterns):
   acc, acc1 = 0, 0
   num = 0
-  for i in range(label_len):
-    if not lpr_pattern_check(label[i].decode('utf-8'), lpr_patterns):  # GT label fails
-      print('GT label fails: ' + label[i].decode('utf-8'))
+  for label, best in zip(labels, pred):
+    if not lpr_pattern_check(label, lpr_patterns):  # GT label fails
+      print('GT label fails: ' + label)
       continue
-    best = pred[i]
-    edd = edit_distance(encode(label[i].decode('utf-8'), vocab), encode(best, vocab))
+    edd = edit_distance(encode(label, vocab), encode(best, vocab))
     if edd <= 1:
       acc1 += 1
-    if label[i].decode('utf-8') == best:
+    if label == best:
       acc += 1
     else:
-      if label[i].decode('utf-8') not in pred[i]:
-        print('Check GT label: ' + label[i].decode('utf-8'))
-      print(label[i].decode('utf-8') + ' -- ' + best + ' Edit Distance: ' + str(edd))
+      if label not in best:
+        print('Check GT label: ' + label)
+      print(label + ' -- ' + best + ' Edit Distance: ' + str(edd))
     num += 1
   return float(acc), float(acc1), num
@@ -23,8 +23,8 @@ import time
 import numpy as np
 import tensorflow as tf
 import tensorflow.contrib.slim as slim
-from lpr.trainer import inference
-from lpr.utils import accuracy, dataset_size
+from lpr.trainer import inference, load_image
+from lpr.utils import accuracy
 from tfutils.helpers import load_module
 
 
@@ -34,25 +34,19 @@ def parse_args():
   return parser.parse_args()
 
 
-def read_data(height, width, channels_num, list_file_name, batch_size=10):
-  reader = tf.TextLineReader()
-  _, value = reader.read(list_file_name)
-  filename, label = tf.decode_csv(value, [[''], ['']], ' ')
+def data_input(height, width, channels_num, filename, batch_size=1, num_parallel_calls=8):
+  """Returns initializer of iterator over the whole list and its batches of images and labels"""
+  def parse(line):
+    image_filename, label = tf.decode_csv(line, [[''], ['']], ' ')
+    return load_image(image_filename, (height, width, channels_num)), label
 
-  image_file = tf.read_file(filename)
-  rgb_image = tf.image.decode_png(image_file, channels=channels_num)
-  rgb_image_float = tf.image.convert_image_dtype(rgb_image, tf.float32)
-  resized_image = tf.image.resize_images(rgb_image_float, [height, width])
-  resized_image.set_shape([height, width, channels_num])
-
-  image_batch, label_batch, file_batch = tf.train.batch([resized_image, label, image_file], batch_size=batch_size)
-  return image_batch, label_batch, file_batch
-
-
-def data_input(height, width, channels_num, filename, batch_size=1):
-  files_string_producer = tf.train.string_input_producer([filename])
-  image, label, filename = read_data(height, width, channels_num, files_string_producer, batch_size)
-  return image, label, filename
+  dataset = tf.data.TextLineDataset(filename)
+  dataset = dataset.map(parse, num_parallel_calls=num_parallel_calls)
+  dataset = dataset.batch(batch_size)
+  dataset = dataset.prefetch(2)
+  iterator = dataset.make_initializable_iterator()
+  image, label = iterator.get_next()
+  return iterator.initializer, image, label
 
 # pylint: disable=too-many-branches, too-many-statements, too-many-locals
 def validate(config):
@@ -71,8 +65,8 @@ def validate(config):
   graph = tf.Graph()
   with graph.as_default():
     with slim.arg_scope([slim.batch_norm, slim.dropout], is_training=False):
-      inp_data, label_val, file_names = data_input(height, width, channels_num,
-                                                   config.eval.file_list_path, batch_size=config.eval.batch_size)
+      data_init, inp_data, label_val = data_input(height, width, channels_num,
+                                                  config.eval.file_list_path, batch_size=config.eval.batch_size)
 
       prob = inference(rnn_cells_num, inp_data, config.num_classes)
       prob = tf.transpose(prob, (1, 0, 2))  # prepare for CTC
@@ -97,8 +91,6 @@ def validate(config):
     conf.gpu_options.allow_growth = config.train.execution.allow_growth
 
   sess = tf.Session(graph=graph, config=conf)
-  coord = tf.train.Coordinator()
-  threads = tf.train.start_queue_runners(sess=sess, coord=coord)
 
   sess.run(init)
 
@@ -122,19 +114,23 @@ def validate(config):
       saver.restore(sess, latest_checkpoint)
       current_step = tf.train.load_variable(latest_checkpoint, 'global_step')
 
-      test_size = dataset_size(config.eval.file_list_path)
+      sess.run(data_init)
       time_start = time.time()
 
       mean_accuracy, mean_accuracy_minus_1 = 0.0, 0.0
 
-      steps = int(test_size / config.eval.batch_size) if int(test_size / config.eval.batch_size) else 1
-      num = 0
-      for _ in range(steps):
-        val, slabel, _ = sess.run([d_predictions, label_val, file_names])
+      num, num_plates = 0, 0
+      while True:
+        try:
+          val, slabel = sess.run([d_predictions, label_val])
+        except tf.errors.OutOfRangeError:
+          break
         acc, acc1, num_ = accuracy(slabel, val, config.vocab, config.r_vocab, config.lpr_patterns)
         mean_accuracy += acc
         mean_accuracy_minus_1 += acc1
         num += num_
+        num_plates += len(slabel)
+      elapsed = time.time() - time_start
 
       writer.add_summary(
         tf.Summary(value=[tf.Summary.Value(tag='evaluation/acc', simple_value=float(mean_accuracy / num)),
@@ -142,7 +138,7 @@ def validate(config):
         current_step)
       print('Test acc: {}'.format(mean_accuracy / num))
       print('Test acc-1: {}'.format(mean_accuracy_minus_1 / num))
-      print('Time per step: {} for test size {}'.format(time.time() - time_start / steps, test_size))
+      print('Plates per second: {:.1f} for test size {}'.format(num_plates / elapsed, num_plates))
     else:
       if wait_iters % 12 == 0:
         sys.stdout.write('\r')
@@ -160,8 +156,6 @@ def validate(config):
       break
 
 
-  coord.request_stop()
-  coord.join(threads)
   sess.close()
 
 def main(_):
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+
+from __future__ import print_function
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging as log
+import sys
+import time
+import cv2
+import numpy as np
+from infer_ie import load_ir_model
+from lpr.trainer import decode_ie_output, read_file_list
+from lpr.utils import accuracy_of_predictions
+from tfutils.helpers import load_module
+
+
+def build_argparser():
+  parser = ArgumentParser(description='Evaluate an IR model on the validation list from the config')
+  parser.add_argument("--model", help="Path to an .xml file with a trained model.", required=True, type=str)
+  parser.add_argument("--cpu_extension",
+                      help="MKLDNN (CPU)-targeted custom layers. "
+                           "Absolute path to a shared library with the kernels implementation", type=str, default=None)
+  parser.add_argument("--device",
+                      help="Specify the target device to infer on; CPU, GPU, FPGA or MYRIAD is acceptable. Sample "
+                           "will look for a suitable plugin for device specified (CPU by default)", default="CPU",
+                      type=str)
+  parser.add_argument('--config', help='Path to a config.py', required=True)
+  parser.add_argument('--batch_size', help='Number of plates in an inference request', type=int, default=16)
+  parser.add_argument('--num_requests', help='Number of inference requests in flight', type=int, default=2)
+  parser.add_argument('--num_workers', help='Number of threads reading images', type=int, default=4)
+  return parser
+
+
+def read_batch(filenames, shape):
+  n_batch, channels, height, width = shape
+  batch = np.zeros((n_batch, channels, height, width), dtype=np.float32)
+  for i, filename in enumerate(filenames):
+    image = cv2.imread(filename)
+    if image is None:
+      raise IOError('Cannot read image: {}'.format(filename))
+    batch[i] = cv2.resize(image, (width, height)).transpose((2, 0, 1))  # Change data layout from HWC to CHW
+  return batch
+
+
+# pylint: disable=too-many-locals
+def evaluate(exec_net, input_blob, out_blob, shape, filenames, r_vocab, num_requests, num_workers):
+  """Returns predicted numbers of all images, batches are read by a thread pool and inferred
+     by up to `num_requests` asynchronous requests, the last batch is padded with zeros.
+  """
+  n_batch = shape[0]
+  starts = iter(range(0, len(filenames), n_batch))
+  predictions = [None] * len(filenames)
+  reads, in_flight = deque(), deque()
+  free_requests = list(range(num_requests))
+
+  def finish_oldest():
+    request_id, start, count = in_flight.popleft()
+    exec_net.requests[request_id].wait(-1)
+    result = exec_net.requests[request_id].outputs[out_blob]
+    for i in range(count):
+      predictions[start + i] = decode_ie_output(result[i], r_vocab)
+    free_requests.append(request_id)
+
+  with ThreadPoolExecutor(num_workers) as pool:
+    def fill_reads():
+      while len(reads) < num_requests + num_workers:
+        start = next(starts, None)
+        if start is None:
+          return
+        batch_filenames = filenames[start:start + n_batch]
+        reads.append((start, len(batch_filenames), pool.submit(read_batch, batch_filenames, shape)))
+
+    fill_reads()
+    while reads:
+      start, count, batch = reads.popleft()
+      batch = batch.result()
+      fill_reads()
+      if not free_requests:
+        finish_oldest()
+      request_id = free_requests.pop()
+      exec_net.start_async(request_id=request_id, inputs={input_blob: batch})
+      in_flight.append((request_id, start, count))
+    while in_flight:
+      finish_oldest()
+
+  return predictions
+
+
+def main():
+  log.basicConfig(format="[ %(levelname)s ] %(message)s", level=log.INFO, stream=sys.stdout)
+  args = build_argparser().parse_args()
+  cfg = load_module(args.config)
+  filenames, labels = read_file_list(cfg.eval.file_list_path)
+  exec_net, ie, input_blob, out_blob, shape = load_ir_model(args.model, args.device, args.cpu_extension,
+                                                            args.batch_size, args.num_requests)
+
+  time_start = time.time()
+  predictions = evaluate(exec_net, input_blob, out_blob, shape, filenames, cfg.r_vocab,
+                         args.num_requests, args.num_workers)
+  elapsed = time.time() - time_start
+
+  acc, acc1, num = accuracy_of_predictions(labels, predictions, cfg.vocab, cfg.lpr_patterns)
+  print('Test acc: {}'.format(acc / num))
+  print('Test acc-1: {}'.format(acc1 / num))
+  print('Plates per second: {:.1f} for test size {}'.format(len(filenames) / elapsed, len(filenames)))
+
+  del exec_net
+  del ie
+
+
+if __name__ == '__main__':
+  sys.exit(main() or 0)
@@ -20,7 +20,7 @@ import logging as log
 import sys
 import os
 import cv2
-from openvino.inference_engine import IENetwork, IEPlugin
+from openvino.inference_engine import IENetwork, IECore
 from lpr.trainer import decode_ie_output
 from tfutils.helpers import load_module
 
@@ -31,7 +31,6 @@ def build_argparser():
   parser.add_argument("--cpu_extension",
                       help="MKLDNN (CPU)-targeted custom layers. "
                            "Absolute path to a shared library with the kernels implementation", type=str, default=None)
-  parser.add_argument("--plugin_dir", help="Path to a plugin folder", type=str, default=None)
   parser.add_argument("--device",
                       help="Specify the target device to infer on; CPU, GPU, FPGA or MYRIAD is acceptable. Sample "
                            "will look for a suitable plugin for device specified (CPU by default)", default="CPU",
@@ -55,21 +54,21 @@ def display_license_plate(number, license_plate_img):
 
   return license_plate_img
 
-def load_ir_model(model_xml, device, plugin_dir, cpu_extension):
+def load_ir_model(model_xml, device, cpu_extension, batch_size=1, num_requests=1):
   model_bin = os.path.splitext(model_xml)[0] + ".bin"
 
-  # initialize plugin
-  log.info("Initializing plugin for %s device...", device)
-  plugin = IEPlugin(device=device, plugin_dirs=plugin_dir)
+  # initialize inference engine
+  log.info("Initializing Inference Engine for %s device...", device)
+  ie = IECore()
   if cpu_extension and 'CPU' in device:
-    plugin.add_cpu_extension(cpu_extension)
+    ie.add_extension(cpu_extension, 'CPU')
 
   # read IR
   log.info("Reading IR...")
   net = IENetwork(model=model_xml, weights=model_bin)
 
   if "CPU" in device:
-    supported_layers = plugin.get_supported_layers(net)
+    supported_layers = ie.query_network(net, device)
     not_supported_layers = [l for l in net.layers.keys() if l not in supported_layers]
     if not_supported_layers:
       log.error("Following layers are not supported by the plugin for specified device %s:\n %s",
@@ -84,20 +83,20 @@ def load_ir_model(model_xml, device, plugin_dir, cpu_extension):
 
   input_blob = next(iter(net.inputs))
   out_blob = next(iter(net.outputs))
+  net.batch_size = batch_size
   log.info("Loading IR to the plugin...")
-  exec_net = plugin.load(network=net)
+  exec_net = ie.load_network(network=net, device_name=device, num_requests=num_requests)
   shape = net.inputs[input_blob].shape # pylint: disable=E1136
   del net
 
-  return exec_net, plugin, input_blob, out_blob, shape
+  return exec_net, ie, input_blob, out_blob, shape
 
 
 def main():
   log.basicConfig(format="[ %(levelname)s ] %(message)s", level=log.INFO, stream=sys.stdout)
   args = build_argparser().parse_args()
   cfg = load_module(args.config)
-  exec_net, plugin, input_blob, out_blob, shape = load_ir_model(args.model, args.device,
-                                                                args.plugin_dir, args.cpu_extension)
+  exec_net, ie, input_blob, out_blob, shape = load_ir_model(args.model, args.device, args.cpu_extension)
   n_batch, channels, height, width = shape
 
 
@@ -119,7 +118,7 @@ def main():
     cv2.waitKey(0)
 
   del exec_net
-  del plugin
+  del ie
 
 
 if __name__ == '__main__':
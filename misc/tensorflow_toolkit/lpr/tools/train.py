@@ -48,20 +48,20 @@ def train(config, init_checkpoint):
                                file_list_path=config.train.file_list_path,
                                apply_basic_aug=config.train.apply_basic_aug,
                                apply_stn_aug=config.train.apply_stn_aug,
-                               apply_blur_aug=config.train.apply_blur_aug)
+                               apply_blur_aug=config.train.apply_blur_aug,
+                               vocab=config.vocab)
 
 
   graph = tf.Graph()
   with graph.as_default():
     global_step = tf.Variable(0, name='global_step', trainable=False)
-    input_data, input_labels = input_train_data.input_fn()
+    input_data, _, encoded_labels = input_train_data.input_fn()
 
     prob = inference(config.rnn_cells_num, input_data, config.num_classes)
     prob = tf.transpose(prob, (1, 0, 2))  # prepare for CTC
 
     data_length = tf.fill([tf.shape(prob)[1]], tf.shape(prob)[0])  # input seq length, batch size
-    ctc = tf.py_func(CTCUtils.compute_ctc_from_labels, [input_labels], [tf.int64, tf.int64, tf.int64])
-    ctc_labels = tf.to_int32(tf.SparseTensor(ctc[0], ctc[1], ctc[2]))
+    ctc_labels = CTCUtils.sparse_labels(encoded_labels)
 
     predictions = tf.to_int32(
       tf.nn.ctc_beam_search_decoder(prob, data_length, merge_repeated=False, beam_width=10)[0][0])
@@ -87,8 +87,6 @@ def train(config, init_checkpoint):
     conf.gpu_options.allow_growth = config.train.execution.allow_growth
 
   session = tf.Session(graph=graph, config=conf)
-  coordinator = tf.train.Coordinator()
-  threads = tf.train.start_queue_runners(sess=session, coord=coordinator)
 
   session.run('init')
 
@@ -130,8 +128,6 @@ def train(config, init_checkpoint):
         and config.train.need_to_save_weights):
       saver.save(session, config.model_dir + '/model.ckpt-{:d}.ckpt'.format(curr_step))
 
-  coordinator.request_stop()
-  coordinator.join(threads)
   session.close()
 
 
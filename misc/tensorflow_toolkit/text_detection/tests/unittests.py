@@ -19,16 +19,18 @@
 import os
 import unittest
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
 import tensorflow as tf
 
 from text_detection.annotation import TextDetectionDataset, write_to_tfrecords
-from text_detection.dataset import  TFRecordDataset
+from text_detection.dataset import  TFRecordDataset, prepare_groundtruth_for_image
 from text_detection.loss import ClassificationLoss, LinkageLoss
 from text_detection.model import pixel_link_model
-from text_detection.metrics import test
+from text_detection.metrics import test, decode_image, decode_batch
+from text_detection.evaluation import eval, evaluate
 
 
 class TestCreateAnnotaion(unittest.TestCase):
@@ -165,6 +167,117 @@ class TestCreateTFRecordDataset(unittest.TestCase):
         self.assertEqual(counter, 21)
 
 
+class TestGroundtruth(unittest.TestCase):
+    """ Tests set for segmentation and link targets. """
+
+    def test_boxes_after_background_box(self):
+        """ Test for checking that a background box does not shift labels of following boxes. """
+
+        config = {'score_map_shape': [8, 16], 'num_neighbours': 8,
+                  'background_label': 0, 'ignore_label': -1, 'text_label': 1}
+        # four disjoint 2x2 boxes in the pixel coordinates 1-2, 5-6, 9-10 and 13-14
+        x_coords = np.array([[x, x + 1, x + 1, x] for x in [1, 5, 9, 13]], np.float32) / 16
+        y_coords = np.array([[2, 2, 3, 3]] * 4, np.float32) / 8
+        labels = np.array([-1, 1, 0, 1], np.int32)
+
+        segm_labels, segm_weights, link_labels, _ = \
+            prepare_groundtruth_for_image(x_coords, y_coords, labels, config)
+
+        np.testing.assert_array_equal(segm_labels[2, [1, 5, 9, 13]], [-1, 1, 0, 1])
+        np.testing.assert_array_equal(segm_labels[3, [2, 6, 10, 14]], [-1, 1, 0, 1])
+        self.assertEqual(np.sum(segm_labels == 1), 8)
+        self.assertAlmostEqual(np.sum(segm_weights), 8.0, places=5)
+        self.assertEqual(link_labels[2, 13, 4], 1)
+        self.assertEqual(link_labels[2, 14, 4], 0)
+
+
+class TestDecode(unittest.TestCase):
+    """ Tests set for decoding of segmentation and link scores. """
+
+    def test_groups_are_numbered_in_raster_order(self):
+        """ Test for checking that groups are numbered by their first pixel. """
+
+        segm_scores = np.array([[0, 0, 1],
+                                [1, 0, 1],
+                                [1, 0, 0]], np.float32)
+        link_scores = np.zeros([3, 3, 8], np.float32)
+        link_scores[0, 2, 6] = 1  # (2, 0) -> (2, 1)
+        link_scores[2, 0, 1] = 1  # (0, 2) -> (0, 1)
+
+        mask = decode_image(segm_scores, link_scores, 0.5, 0.5)
+        np.testing.assert_array_equal(mask, [[0, 0, 1],
+                                             [2, 0, 1],
+                                             [2, 0, 0]])
+
+    def test_links_to_negative_pixels_are_ignored(self):
+        """ Test for checking that links join only positive pixels. """
+
+        segm_scores = np.array([[1, 0, 1]], np.float32)
+        link_scores = np.ones([1, 3, 8], np.float32)
+
+        mask = decode_image(segm_scores, link_scores, 0.5, 0.5)
+        np.testing.assert_array_equal(mask, [[1, 0, 2]])
+
+    def test_batch_in_executor(self):
+        """ Test for checking that parallel batch decoding gives the same masks. """
+
+        config = {'segm_conf_thr': 0.8, 'link_conf_thr': 0.8}
+        random = np.random.RandomState(0)
+        segm_scores = random.rand(3, 32, 48) ** 0.3
+        link_scores = random.rand(3, 32, 48, 8) ** 0.5
+
+        expected = decode_batch(segm_scores, link_scores, config)
+        with ProcessPoolExecutor(2) as executor:
+            masks = decode_batch(segm_scores, link_scores, config, executor)
+        np.testing.assert_array_equal(masks, expected)
+
+
+class TestEvaluation(unittest.TestCase):
+    """ Tests set for matching of detected and groundtruth boxes. """
+
+    def setUp(self):
+        """ setUp method for tests. """
+
+        random = np.random.RandomState(0)
+
+        def random_points(center_x, center_y):
+            width, height = random.uniform(5, 200), random.uniform(5, 60)
+            angle = random.uniform(-0.5, 0.5)
+            rotation = np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+            corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * [width / 2, height / 2]
+            points = corners.dot(rotation) + [center_x, center_y]
+            return points.reshape([-1]).astype(np.int32)
+
+        self.gt_annotations, self.pr_annotations = [], []
+        for _ in range(10):
+            gt_annotation = [{'points': random_points(*random.uniform(0, 1000, 2)).tolist(),
+                              'transcription': '###' if random.rand() < 0.2 else 'GOOD_WORD'}
+                             for _ in range(random.randint(0, 20))]
+            pr_annotation = []
+            for gt_object in gt_annotation:
+                noise = random.normal(0, random.uniform(0, 10), 8)
+                points = (np.array(gt_object['points']) + noise).astype(np.int32)
+                pr_annotation.append({'points': points, 'confidence': random.rand()})
+            for _ in range(random.randint(0, 5)):
+                pr_annotation.append({'points': random_points(*random.uniform(0, 1000, 2)),
+                                      'confidence': random.rand()})
+            self.gt_annotations.append(gt_annotation)
+            self.pr_annotations.append(pr_annotation)
+
+    def test_evaluate_is_same_as_eval(self):
+        """ Test for checking that prefiltered matching gives the same metrics. """
+
+        self.assertEqual(evaluate(self.pr_annotations, self.gt_annotations),
+                         eval(self.pr_annotations, self.gt_annotations))
+
+    def test_evaluate_in_executor(self):
+        """ Test for checking that parallel matching gives the same metrics. """
+
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(evaluate(self.pr_annotations, self.gt_annotations, executor),
+                             eval(self.pr_annotations, self.gt_annotations))
+
+
 class TestTraining(unittest.TestCase):
     """ Tests set for training. """
 
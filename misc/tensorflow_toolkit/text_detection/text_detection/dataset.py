@@ -28,12 +28,6 @@ def points_to_contour(points):
     return np.asarray([[list(point)] for point in points], dtype=np.int32)
 
 
-def points_to_contours(points):
-    """ Converts points to contours. """
-
-    return np.asarray([points_to_contour(points)])
-
-
 def get_neighbours(x_coord, y_coord):
     """ Returns 8-point neighbourhood of given point. """
 
@@ -42,12 +36,6 @@ def get_neighbours(x_coord, y_coord):
             (x_coord - 1, y_coord + 1), (x_coord, y_coord + 1), (x_coord + 1, y_coord + 1)]
 
 
-def is_valid_coord(x_coord, y_coord, width, height):
-    """ Returns true if given point inside image frame. """
-
-    return 0 <= x_coord < width and 0 <= y_coord < height
-
-
 def tf_min_area_rect(x_coords, y_coords):
     """ Returns rotated rectangles for given set of points. """
 
@@ -153,93 +141,105 @@ def bboxes_resize(bbox_ref, bboxes, x_coords, y_coords):
     return bboxes, x_coords, y_coords
 
 
-def tf_prepare_groundtruth_for_image(x_coords, y_coords, labels, config):
-    """ Generate groundtruth data for given image. """
-
-    height, width = config['score_map_shape']
-    num_neighbours = config['num_neighbours']
-
-    def prepare_groundtruth_for_image(normed_xs, normed_ys, labels):
-
-
-        num_positive_bboxes = np.sum(np.asarray(labels) == config['text_label'])
-        x_coords = normed_xs * width
-        y_coords = normed_ys * height
+# (dx, dy) of the 8 neighbours in the order of get_neighbours
+NEIGHBOUR_SHIFTS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
 
-        mask = np.zeros([height, width], np.int32)
-        segm_labels = np.ones([height, width], np.int32) * config['background_label']
-        segm_weights = np.zeros([height, width], np.float32)
 
-        link_labels = np.zeros([height, width, num_neighbours], np.int32)
-        link_weights = np.ones([height, width, num_neighbours], np.float32)
+def rasterize_bboxes(x_coords, y_coords, labels, config, height, width):
+    """ Fills all boxes into per-pixel counts of covering boxes.
 
-        bbox_masks = []
-        pos_mask = mask.copy()
-        for bbox_idx, (bbox_xs, bbox_ys) in enumerate(zip(x_coords, y_coords)):
-            if labels[bbox_idx] == config['background_label']:
-                continue
+    Returns count of all not background boxes, count of text boxes, mask of ignored boxes
+    and 1-based index of the box covering each pixel (meaningful where one box covers it).
+    """
 
-            bbox_mask = mask.copy()
-            bbox_contours = points_to_contours(zip(bbox_xs, bbox_ys))
-            cv2.drawContours(bbox_mask, bbox_contours, -1, 1, -1)
+    all_count = np.zeros([height, width], np.int32)
+    text_count = np.zeros([height, width], np.int32)
+    ignore_mask = np.zeros([height, width], bool)
+    bbox_ids = np.zeros([height, width], np.int32)
+    for bbox_idx, (bbox_xs, bbox_ys) in enumerate(zip(x_coords, y_coords)):
+        label = labels[bbox_idx]
+        if label == config['background_label']:
+            continue
 
-            bbox_masks.append(bbox_mask)
+        contour = points_to_contour(zip(bbox_xs, bbox_ys))
+        # fill only the part of the image covered by the box
+        x_min, y_min = np.maximum(contour.min(axis=(0, 1)), 0)
+        x_max, y_max = np.minimum(contour.max(axis=(0, 1)) + 1, [width, height])
+        if x_min >= x_max or y_min >= y_max:
+            continue
+        bbox_mask = np.zeros([y_max - y_min, x_max - x_min], np.uint8)
+        cv2.drawContours(bbox_mask, [contour - [x_min, y_min]], -1, 1, -1)
+        bbox_mask = bbox_mask.astype(bool)
 
-            if labels[bbox_idx] == config['text_label']:
-                pos_mask += bbox_mask
+        region = np.s_[y_min:y_max, x_min:x_max]
+        all_count[region] += bbox_mask
+        if label == config['text_label']:
+            text_count[region] += bbox_mask
+            bbox_ids[region][bbox_mask] = bbox_idx + 1
+        elif label == config['ignore_label']:
+            ignore_mask[region] |= bbox_mask
 
-        pos_mask = np.asarray(pos_mask == 1, dtype=np.int32)
-        num_positive_pixels = np.sum(pos_mask)
+    return all_count, text_count, ignore_mask, bbox_ids
 
-        sum_mask = np.sum(bbox_masks, axis=0)
-        not_overlapped_mask = sum_mask == 1
 
-        for bbox_idx, bbox_mask in enumerate(bbox_masks):
-            bbox_label = labels[bbox_idx]
-            if bbox_label == config['ignore_label']:
-                segm_labels += bbox_mask * not_overlapped_mask * config['ignore_label']
-                continue
+def link_labels_from_ids(bbox_ids, num_neighbours):
+    """ Link to a neighbour is positive if both pixels belong to the same box. """
 
-            if labels[bbox_idx] == config['background_label']:
-                continue
+    height, width = bbox_ids.shape
+    padded = np.pad(bbox_ids, 1, mode='constant')
+    link_labels = np.empty([height, width, num_neighbours], np.int32)
+    for n_idx, (d_x, d_y) in enumerate(NEIGHBOUR_SHIFTS[:num_neighbours]):
+        neighbours = padded[1 + d_y:1 + d_y + height, 1 + d_x:1 + d_x + width]
+        link_labels[:, :, n_idx] = (bbox_ids > 0) & (neighbours == bbox_ids)
+    return link_labels
 
-            text_boxes_mask = bbox_mask * pos_mask
-            segm_labels += text_boxes_mask * bbox_label
 
-            num_bbox_pixels = np.sum(text_boxes_mask)
-            if num_bbox_pixels > 0:
-                per_bbox_weight = num_positive_pixels * 1.0 / num_positive_bboxes
-                per_pixel_weight = per_bbox_weight / num_bbox_pixels
-                segm_weights += text_boxes_mask * per_pixel_weight
+def prepare_groundtruth_for_image(normed_xs, normed_ys, labels, config):
+    """ Generates segmentation and link targets from boxes with normalized coordinates.
 
-            bbox_point_cords = np.where(text_boxes_mask)
-            link_labels[bbox_point_cords] = 1
+    Text pixels are pixels covered by exactly one text box, ignored pixels are covered only by
+    an ignored box. Every text box gets the same total weight spread over its pixels.
+    """
 
-            new_bbox_contours = cv2.findContours(text_boxes_mask.astype(np.uint8), cv2.RETR_CCOMP,
-                                                 cv2.CHAIN_APPROX_SIMPLE)[-2]
-
-            text_boxes_border_mask = mask.copy()
-            cv2.drawContours(text_boxes_border_mask, new_bbox_contours, -1, 1, 3)
-            text_boxes_border_mask *= text_boxes_mask
-
-            border_points = zip(*np.where(text_boxes_border_mask))
+    height, width = config['score_map_shape']
+    labels = np.asarray(labels)
+    x_coords = normed_xs * width
+    y_coords = normed_ys * height
+
+    all_count, text_count, ignore_mask, bbox_ids = rasterize_bboxes(x_coords, y_coords, labels,
+                                                                    config, height, width)
+    pos_mask = text_count == 1
+    bbox_ids = np.where(pos_mask, bbox_ids, 0)
+
+    segm_labels = np.full([height, width], config['background_label'], np.int32)
+    segm_labels += (ignore_mask & (all_count == 1)) * np.int32(config['ignore_label'])
+    segm_labels += pos_mask * np.int32(config['text_label'])
+
+    num_positive_pixels = np.sum(pos_mask)
+    num_positive_bboxes = np.sum(labels == config['text_label'])
+    num_bbox_pixels = np.bincount(bbox_ids.ravel(), minlength=len(labels) + 1)
+    per_pixel_weight = np.zeros(len(num_bbox_pixels), np.float64)
+    nonempty = num_bbox_pixels > 0
+    nonempty[0] = False
+    if num_positive_bboxes > 0:
+        per_pixel_weight[nonempty] = \
+            num_positive_pixels * 1.0 / num_positive_bboxes / num_bbox_pixels[nonempty]
+    segm_weights = per_pixel_weight[bbox_ids].astype(np.float32)
+
+    link_labels = link_labels_from_ids(bbox_ids, config['num_neighbours'])
+    link_weights = np.repeat(segm_weights[:, :, np.newaxis], config['num_neighbours'], axis=2)
 
-            def in_bbox(neighbour_x, neighbour_y):
-                return text_boxes_mask[neighbour_y, neighbour_x]
+    return segm_labels, segm_weights, link_labels, link_weights
 
-            for y_coord, x_coord in border_points:
-                neighbours = get_neighbours(x_coord, y_coord)
-                for n_idx, (neighbour_x, neighbour_y) in enumerate(neighbours):
-                    if not is_valid_coord(neighbour_x, neighbour_y, width, height) \
-                            or not in_bbox(neighbour_x, neighbour_y):
-                        link_labels[y_coord, x_coord, n_idx] = 0
 
-        link_weights *= np.expand_dims(segm_weights, axis=-1)
+def tf_prepare_groundtruth_for_image(x_coords, y_coords, labels, config):
+    """ Generate groundtruth data for given image. """
 
-        return segm_labels, segm_weights, link_labels, link_weights
+    height, width = config['score_map_shape']
+    num_neighbours = config['num_neighbours']
 
     segm_labels, segm_weights, link_labels, link_weights = \
-        tf.numpy_function(prepare_groundtruth_for_image,
+        tf.numpy_function(lambda xs, ys, labels: prepare_groundtruth_for_image(xs, ys, labels, config),
                           [x_coords, y_coords, labels],
                           [tf.int32, tf.float32, tf.int32, tf.float32]
                           )
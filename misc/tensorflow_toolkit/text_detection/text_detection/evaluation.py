@@ -105,6 +105,20 @@ def compute_ap(conf_list, match_list, num_gt_care):
     return average_precision
 
 
+def method_metrics(matched_sum, num_global_care_gt, num_global_care_pr,
+                   arr_global_confidences, arr_global_matches):
+    """ Returns recall, precision, hmean and average precision. """
+
+    method_recall = 0 if num_global_care_gt == 0 else float(matched_sum) / num_global_care_gt
+    method_precision = 0 if num_global_care_pr == 0 else float(matched_sum) / num_global_care_pr
+    denominator = method_precision + method_recall
+    method_hmean = 0 if denominator == 0 else 2.0 * method_precision * method_recall / denominator
+
+    average_precision = compute_ap(arr_global_confidences, arr_global_matches, num_global_care_gt)
+
+    return method_recall, method_precision, method_hmean, average_precision
+
+
 def parse_gt_objects(gt_annotation):
     """ Parses groundtruth objects from annotation. """
 
@@ -234,11 +248,104 @@ def eval(pr_annotations, gt_annotations, images=None, imshow_delay=1):
             if k == 27:
                 return -1, -1, -1
 
-    method_recall = 0 if num_global_care_gt == 0 else float(matched_sum) / num_global_care_gt
-    method_precision = 0 if num_global_care_pr == 0 else float(matched_sum) / num_global_care_pr
-    denominator = method_precision + method_recall
-    method_hmean = 0 if denominator == 0 else 2.0 * method_precision * method_recall / denominator
+    return method_metrics(matched_sum, num_global_care_gt, num_global_care_pr,
+                          arr_global_confidences, arr_global_matches)
 
-    average_precision = compute_ap(arr_global_confidences, arr_global_matches, num_global_care_gt)
 
-    return method_recall, method_precision, method_hmean, average_precision
+def polygon_bounds(points_list):
+    """ Returns [N, 4] array of x_min, y_min, x_max, y_max of polygons given by 8 points. """
+
+    if not points_list:
+        return np.zeros([0, 4], np.int32)
+    points = np.array([np.array(points[:8]).astype(np.int32) for points in points_list])
+    points = points.reshape([-1, 4, 2])
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def bounds_overlap(bounds1, bounds2):
+    """ Returns mask of pairs of polygons which bounding boxes overlap or touch.
+
+    Polygons of other pairs do not intersect.
+    """
+
+    bounds1, bounds2 = bounds1[:, np.newaxis], bounds2[np.newaxis]
+    return (bounds1[..., 0] <= bounds2[..., 2]) & (bounds2[..., 0] <= bounds1[..., 2]) & \
+           (bounds1[..., 1] <= bounds2[..., 3]) & (bounds2[..., 1] <= bounds1[..., 3])
+
+
+def evaluate_frame(frame_annotations):
+    """ Same as a frame of eval, but polygons are intersected only if their bounding boxes overlap.
+
+    Returns number of matched objects, numbers of not ignored groundtruth and predicted objects,
+    confidences of not ignored predicted objects and whether they are matched.
+    """
+
+    pr_annotation, gt_annotation = frame_annotations
+    gt_polygons_list, gt_dont_care_polygon_nums = parse_gt_objects(gt_annotation)
+    pr_polygons_list, pr_confidences_list = parse_pr_objects(pr_annotation)
+    gt_bounds = polygon_bounds([gt_object['points'] for gt_object in gt_annotation])
+    pr_bounds = polygon_bounds([pr_object['points'] for pr_object in pr_annotation])
+    candidates = bounds_overlap(gt_bounds, pr_bounds)
+
+    pr_dont_care = np.zeros(len(pr_polygons_list), bool)
+    for pr_idx, pr_polygon in enumerate(pr_polygons_list):
+        pd_dimensions = pr_polygon.area()
+        if pd_dimensions == 0:
+            continue
+        for gt_idx in gt_dont_care_polygon_nums:
+            if candidates[gt_idx, pr_idx] and \
+                    get_intersection(gt_polygons_list[gt_idx], pr_polygon) / pd_dimensions \
+                    > AREA_PRECISION_CONSTRAINT:
+                pr_dont_care[pr_idx] = True
+                break
+
+    gt_care = np.ones(len(gt_polygons_list), bool)
+    gt_care[gt_dont_care_polygon_nums] = False
+    num_care_gt = int(np.sum(gt_care))
+    num_care_pr = int(np.sum(~pr_dont_care))
+    if not gt_polygons_list or not pr_polygons_list:
+        return 0, num_care_gt, num_care_pr, [], []
+
+    # ignored objects are never matched, so their IoU is not needed
+    candidates &= gt_care[:, np.newaxis] & ~pr_dont_care[np.newaxis]
+    pr_matched = np.zeros(len(pr_polygons_list), bool)
+    for gt_idx in np.flatnonzero(gt_care):
+        for pr_idx in np.flatnonzero(candidates[gt_idx] & ~pr_matched):
+            iou = get_intersection_over_union(gt_polygons_list[gt_idx], pr_polygons_list[pr_idx])
+            if iou > IOU_CONSTRAINT:
+                pr_matched[pr_idx] = True
+                break
+
+    care_pr_nums = np.flatnonzero(~pr_dont_care)
+    confidences = [pr_confidences_list[pr_num] for pr_num in care_pr_nums]
+    matches = pr_matched[care_pr_nums].tolist()
+    return int(np.sum(pr_matched)), num_care_gt, num_care_pr, confidences, matches
+
+
+def evaluate(pr_annotations, gt_annotations, executor=None):
+    """ Returns the same metrics as eval, frames are evaluated in parallel if `executor`
+        (e.g. concurrent.futures.ProcessPoolExecutor) is given.
+    """
+
+    assert len(pr_annotations) == len(gt_annotations)
+
+    frames = list(zip(pr_annotations, gt_annotations))
+    if executor is None:
+        results = map(evaluate_frame, frames)
+    else:
+        results = executor.map(evaluate_frame, frames, chunksize=max(1, len(frames) // 64))
+
+    matched_sum = 0
+    num_global_care_gt = 0
+    num_global_care_pr = 0
+    arr_global_confidences = []
+    arr_global_matches = []
+    for matched, num_care_gt, num_care_pr, confidences, matches in results:
+        matched_sum += matched
+        num_global_care_gt += num_care_gt
+        num_global_care_pr += num_care_pr
+        arr_global_confidences.extend(confidences)
+        arr_global_matches.extend(matches)
+
+    return method_metrics(matched_sum, num_global_care_gt, num_global_care_pr,
+                          arr_global_confidences, arr_global_matches)
@@ -13,81 +13,66 @@
 # and limitations under the License.
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 from tqdm import tqdm
 import numpy as np
 import tensorflow as tf
 
 from text_detection.model import pixel_link_model
-from text_detection.evaluation import eval
-from text_detection.dataset import get_neighbours, is_valid_coord, TFRecordDataset
+from text_detection.evaluation import eval, evaluate
+from text_detection.dataset import get_neighbours, TFRecordDataset
 from text_detection.common import parse_epoch
 
 
-def decode_image(segm_scores, link_scores, segm_conf_threshold, link_conf_threshold):
-    """ Convert softmax scores to mask. """
-
-    segm_mask = segm_scores >= segm_conf_threshold
-    link_mask = link_scores >= link_conf_threshold
-    points = list(zip(*np.where(segm_mask)))
-    height, width = np.shape(segm_mask)
-    group_mask = dict.fromkeys(points, -1)
+def find_roots(num_nodes, src_nodes, dst_nodes):
+    """ Union-find over flat arrays, returns the smallest node of the component of each node. """
 
-    def find_parent(point):
-        return group_mask[point]
+    parent = np.arange(num_nodes)
+    while True:
+        src_roots, dst_roots = parent[src_nodes], parent[dst_nodes]
+        not_joined = src_roots != dst_roots
+        if not np.any(not_joined):
+            return parent
+        # hooking larger roots to smaller ones keeps every parent below its child
+        np.minimum.at(parent, np.maximum(src_roots, dst_roots)[not_joined],
+                      np.minimum(src_roots, dst_roots)[not_joined])
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
 
-    def set_parent(point, parent):
-        group_mask[point] = parent
 
-    def is_root(point):
-        return find_parent(point) == -1
-
-    def find_root(point):
-        root = point
-        update_parent = False
-        while not is_root(root):
-            root = find_parent(root)
-            update_parent = True
-
-        if update_parent:
-            set_parent(point, root)
-
-        return root
-
-    def join(point1, point2):
-        root1 = find_root(point1)
-        root2 = find_root(point2)
+def decode_image(segm_scores, link_scores, segm_conf_threshold, link_conf_threshold):
+    """ Convert softmax scores to mask.
 
-        if root1 != root2:
-            set_parent(root1, root2)
+    Positive pixels are joined with positive neighbours they link to. Groups are numbered from 1
+    in the raster order of their first pixel.
+    """
 
-    def get_all():
-        root_map = {}
+    segm_mask = segm_scores >= segm_conf_threshold
+    link_mask = link_scores >= link_conf_threshold
+    height, width = np.shape(segm_mask)
 
-        def get_index(root):
-            if root not in root_map:
-                root_map[root] = len(root_map) + 1
-            return root_map[root]
+    points = np.flatnonzero(segm_mask)
+    point_idx = np.full(height * width, -1, np.int64)
+    point_idx[points] = np.arange(len(points))
+    point_idx = np.pad(point_idx.reshape(height, width), 1, mode='constant', constant_values=-1)
 
-        mask = np.zeros_like(segm_mask, dtype=np.int32)
-        for point in points:
-            point_root = find_root(point)
-            bbox_idx = get_index(point_root)
-            mask[point] = bbox_idx
-        return mask
+    src_nodes, dst_nodes = [], []
+    for n_idx, (neighbour_x, neighbour_y) in enumerate(get_neighbours(1, 1)):
+        neighbours = point_idx[neighbour_y:neighbour_y + height, neighbour_x:neighbour_x + width]
+        linked = segm_mask & link_mask[:, :, n_idx] & (neighbours >= 0)
+        src_nodes.append(point_idx[1:-1, 1:-1][linked])
+        dst_nodes.append(neighbours[linked])
 
-    for point in points:
-        y_coord, x_coord = point
-        neighbours = get_neighbours(x_coord, y_coord)
-        for n_idx, (neighbour_x, neighbour_y) in enumerate(neighbours):
-            if is_valid_coord(neighbour_x, neighbour_y, width, height):
-                link_value = link_mask[y_coord, x_coord, n_idx]
-                segm_value = segm_mask[neighbour_y, neighbour_x]
-                if link_value and segm_value:
-                    join(point, (neighbour_y, neighbour_x))
+    roots = find_roots(len(points), np.concatenate(src_nodes), np.concatenate(dst_nodes))
+    bbox_indices = np.cumsum(roots == np.arange(len(points)), dtype=np.int32)
 
-    mask = get_all()
-    return mask
+    mask = np.zeros(height * width, dtype=np.int32)
+    mask[points] = bbox_indices[roots]
+    return mask.reshape(height, width)
 
 
 def rect_to_xys(rect, image_shape):
@@ -152,17 +137,26 @@ def mask_to_bboxes(mask, config, image_shape):
     return bboxes
 
 
-def decode_batch(segm_scores, link_scores, config):
-    """ Returns boxes mask for each input image in batch."""
+def decode_image_args(args):
+    """ decode_image with packed arguments for executor.map. """
+
+    return decode_image(*args)
+
+
+def decode_batch(segm_scores, link_scores, config, executor=None):
+    """ Returns boxes mask for each input image in batch.
+
+    Images are decoded in parallel if `executor` (e.g. concurrent.futures.ProcessPoolExecutor)
+    is given.
+    """
 
     batch_size = segm_scores.shape[0]
-    batch_mask = []
-    for image_idx in range(batch_size):
-        image_pos_pixel_scores = segm_scores[image_idx, :, :]
-        image_pos_link_scores = link_scores[image_idx, :, :, :]
-        mask = decode_image(image_pos_pixel_scores, image_pos_link_scores,
-                            config['segm_conf_thr'], config['link_conf_thr'])
-        batch_mask.append(mask)
+    args = [(segm_scores[image_idx, :, :], link_scores[image_idx, :, :, :],
+             config['segm_conf_thr'], config['link_conf_thr']) for image_idx in range(batch_size)]
+    if executor is None or batch_size == 1:
+        batch_mask = [decode_image_args(image_args) for image_args in args]
+    else:
+        batch_mask = list(executor.map(decode_image_args, args))
     return np.asarray(batch_mask, np.int32)
 
 
@@ -184,8 +178,11 @@ def softmax(logits):
     return numerator / denominator
 
 
-def test(args, config, model=None, dataset=None):
-    """This function performs testing of text detection neural network."""
+def test(args, config, model=None, dataset=None, eval_workers=0):
+    """This function performs testing of text detection neural network.
+
+    Frames are matched in `eval_workers` processes if it is positive.
+    """
 
     print('Evaluating:', args.weights)
 
@@ -234,7 +231,12 @@ def test(args, config, model=None, dataset=None):
                  [cv2.cvtColor(original_image.astype(np.uint8), cv2.COLOR_RGB2BGR)],
                  args.imshow_delay)
 
-    method_recall, method_precision, method_hmean, _ = eval(pr_annotations, gt_annotations)
+    if eval_workers > 0:
+        with ProcessPoolExecutor(eval_workers) as executor:
+            method_recall, method_precision, method_hmean, _ = evaluate(
+                pr_annotations, gt_annotations, executor)
+    else:
+        method_recall, method_precision, method_hmean, _ = evaluate(pr_annotations, gt_annotations)
 
     epoch = parse_epoch(args.weights)
     ema = 'ema' in os.path.basename(args.weights)
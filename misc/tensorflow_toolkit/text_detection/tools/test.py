@@ -38,6 +38,8 @@ def arg_parser():
     parser.add_argument('--imshow_delay', type=int, default=-1,
                         help='If it is non-negative, this script will draw detected and groundtruth'
                              'boxes')
+    parser.add_argument('--eval_workers', type=int, default=0,
+                        help='Number of processes matching detected and groundtruth boxes.')
 
     return parser
 
@@ -49,7 +51,8 @@ def main():
     config = load_config(args.config)
 
     if args.weights:
-        print(args.weights, '(recall, precision, method_hmean)', test(args, config))
+        print(args.weights, '(recall, precision, method_hmean)',
+              test(args, config, eval_workers=args.eval_workers))
     elif args.weights_folder:
         args.weights_folder = os.path.abspath(args.weights_folder)
 
@@ -74,7 +77,7 @@ def main():
 
             for weights in weights_list:
                 args.weights = weights
-                result = test(args, config, model=model)
+                result = test(args, config, model=model, eval_workers=args.eval_workers)
                 newly_tested.append(args.weights + str(result[-1]))
                 already_tested_weights.append(args.weights)
                 print(args.weights, '(recall, precision, method_hmean)', result)
@@ -14,6 +14,7 @@
 
 input_shape = (72, 72, 3)  # (height, width, channels)
 model_dir = 'model'
+shard_dir = None  # Folder for vehicle crops of the annotations, next to the annotation files if None
 
 class train:
   batch_size = 32
@@ -27,6 +27,7 @@ from vehicle_attributes.trainer import create_session, resnet_v1_10_1, InputEval
 def parse_args():
   parser = argparse.ArgumentParser(description='Perform evaluation of a trained vehicle attributes model')
   parser.add_argument('path_to_config', help='Path to a config.py')
+  parser.add_argument('--shard_dir', default=None, help='Folder for vehicle crops, default: shard_dir of the config')
   return parser.parse_args()
 
 def eval_loop(estimator, eval_data, config):
@@ -91,7 +92,8 @@ def main(_):
 
   eval_data = InputEvalData(batch_size=cfg.eval.batch_size,
                             input_shape=cfg.input_shape,
-                            json_path=cfg.eval.annotation_path)
+                            json_path=cfg.eval.annotation_path,
+                            shard_dir=args.shard_dir or getattr(cfg, 'shard_dir', None))
 
   eval_loop(va_estimator, eval_data, cfg)
 
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+
+import argparse
+import os
+
+from tfutils.helpers import load_module
+from vehicle_attributes.readers.vehicle_attributes_json import BarrierAttributesJson
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Write vehicle crops of the train and eval annotations to shards')
+  parser.add_argument('path_to_config', help='Path to a config.py')
+  parser.add_argument('--shard_dir', default=None, help='Folder for vehicle crops, default: shard_dir of the config')
+  parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of decoding processes')
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  cfg = load_module(args.path_to_config)
+
+  shard_dir = args.shard_dir or getattr(cfg, 'shard_dir', None)
+
+  for json_path in (cfg.train.annotation_path, cfg.eval.annotation_path):
+    size = BarrierAttributesJson.write_shard(json_path, shard_dir, args.workers)
+    print('{}: {} vehicles are saved to {}'.format(json_path, size,
+                                                   ', '.join(BarrierAttributesJson.shard_paths(json_path, shard_dir))))
+
+if __name__ == "__main__":
+  main()
@@ -24,9 +24,10 @@ from tfutils.helpers import load_module
 def parse_args():
   parser = argparse.ArgumentParser(description='Perform training of vehicle attributes model')
   parser.add_argument('path_to_config', help='Path to a config.py')
+  parser.add_argument('--shard_dir', default=None, help='Folder for vehicle crops, default: shard_dir of the config')
   return parser.parse_args()
 
-def train(config):
+def train(config, shard_dir=None):
   cv2.setNumThreads(1)
 
   session_config = create_session(config, 'train')
@@ -45,7 +46,8 @@ def train(config):
 
   input_data = InputTrainData(batch_size=config.train.batch_size,
                               input_shape=config.input_shape,
-                              json_path=config.train.annotation_path)
+                              json_path=config.train.annotation_path,
+                              shard_dir=shard_dir)
 
   va_predictor.train(
     input_fn=input_data.input_fn,
@@ -55,7 +57,7 @@ def train(config):
 def main(_):
   args = parse_args()
   cfg = load_module(args.path_to_config)
-  train(cfg)
+  train(cfg, args.shard_dir or getattr(cfg, 'shard_dir', None))
 
 if __name__ == '__main__':
   tf.logging.set_verbosity(tf.logging.INFO)
@@ -18,9 +18,9 @@
 
 import json
 import os
+import uuid
+from multiprocessing import Pool
 
-import sys
-import threading
 from tqdm import tqdm
 
 import cv2
@@ -28,6 +28,10 @@ import jpeg4py as jpeg
 import numpy as np
 import tensorflow as tf
 
+CROP_SHAPE = (72, 72, 3)
+ANNOTATION_SIZE = 7  # one hot type (4) and LAB color (3)
+
+
 def imread(im_path):
   if os.path.splitext(im_path)[1].lower() in ('.jpg', '.jpeg'):
     try:
@@ -52,50 +56,57 @@ def imdecode(data):
 
 
 class BarrierAttributesJson:
-  _cache = dict()
-  _lock = threading.RLock()
-
   @staticmethod
-  def json_iterator(size):
-    def generator():
-      for i in range(size):
-        yield i
-
-    return generator
+  def shard_paths(json_path, shard_dir=None):
+    """Paths of the crops and annotations of the shard, they are next to the json file if shard_dir is None"""
+    base = os.path.splitext(json_path)[0]
+    if shard_dir:
+      base = os.path.join(shard_dir, os.path.basename(base))
+    return base + '.crops.u8', base + '.annotations.f32'
 
-  # pylint: disable=invalid-name
   @staticmethod
-  def init_cache(filename, cache_type):
-    print('Load images in the cache: {}'.format(cache_type))
+  def write_shard(json_path, shard_dir=None, num_workers=None):
+    """Decodes every frame once in a pool of processes and writes uint8 vehicle crops and float32 annotations
+       as fixed length records. Returns the number of records.
+    """
+    print('Write vehicle crops of {}'.format(json_path))
 
-    with open(filename) as f:
+    with open(json_path) as f:
       items = json.load(f)
 
-    size = len(items)
-
-    id = 0
-
-    with BarrierAttributesJson._lock:
-      t = tqdm(items, total=size, unit='images')
-      total_cache_usage = 0
-      for item in t:
-        images, annotations = BarrierAttributesJson._get_annotation(item)
-
-        for image, annotation in zip(images, annotations):
-          BarrierAttributesJson._cache[id] = [image, annotation]
-          id += 1
-
-          total_cache_usage += sys.getsizeof(image)
-          total_cache_usage += sys.getsizeof(annotation)
-
-        t.set_postfix({'cache usage (GB)': total_cache_usage / 1024 ** 3})
-
-    return id
+    if shard_dir:
+      os.makedirs(shard_dir, exist_ok=True)
+    images_path, annotations_path = BarrierAttributesJson.shard_paths(json_path, shard_dir)
+    # every writer has its own temporary files, so concurrent writers of the same shard do not mix records
+    suffix = '.{}.tmp'.format(uuid.uuid4().hex)
+    size = 0
+    try:
+      with Pool(num_workers) as pool, open(images_path + suffix, 'wb') as images_file, \
+          open(annotations_path + suffix, 'wb') as annotations_file:
+        for images, annotations in tqdm(pool.imap(BarrierAttributesJson._get_crops, items, chunksize=16),
+                                        total=len(items), unit='images'):
+          for image, annotation in zip(images, annotations):
+            images_file.write(np.ascontiguousarray(image).tobytes())
+            annotations_file.write(annotation.astype(np.float32).tobytes())
+            size += 1
+
+      os.replace(images_path + suffix, images_path)
+      os.replace(annotations_path + suffix, annotations_path)
+    finally:
+      for path in (images_path + suffix, annotations_path + suffix):
+        if os.path.exists(path):
+          os.remove(path)
+    return size
 
   @staticmethod
-  def _get_image_and_annotation(item):
-    image, annotation = BarrierAttributesJson._cache[item]
-    return image, annotation
+  def prepare_shard(json_path, shard_dir=None, num_workers=None):
+    """Writes the shard if it is missing or older than the json file, returns its number of records"""
+    images_path, annotations_path = BarrierAttributesJson.shard_paths(json_path, shard_dir)
+    json_time = os.path.getmtime(json_path)
+    if not all(os.path.exists(path) and os.path.getmtime(path) >= json_time
+               for path in (images_path, annotations_path)):
+      return BarrierAttributesJson.write_shard(json_path, shard_dir, num_workers)
+    return os.path.getsize(annotations_path) // (ANNOTATION_SIZE * 4)
 
   @staticmethod
   def type_annotation_to_one_hot(item):
@@ -128,20 +139,22 @@ class BarrierAttributesJson:
 
   # pylint: disable=len-as-condition
   @staticmethod
-  def _get_annotation(frame):
+  def _get_crops(frame):
     images = []
     annotations = []
+    img = None
     for item in frame['objects']:
       if item['label'] == 'vehicle' and \
         'color_bbox' in item['attributes'] and \
         len(item['attributes']['color_bbox']) != 0 and \
         'type' in item['attributes'] and \
         len(item['attributes']['type']) != 0:
-        img = imread(frame['image'])
+        if img is None:
+          img = imread(frame['image'])
 
         vbbox = item['bbox']
         veh_image = img[int(vbbox[1]):int(vbbox[3]), int(vbbox[0]): int(vbbox[2])]
-        veh_image = cv2.resize(veh_image, (72, 72), interpolation=cv2.INTER_CUBIC)
+        veh_image = cv2.resize(veh_image, CROP_SHAPE[1::-1], interpolation=cv2.INTER_CUBIC)
 
         #get color annotation
         veh_color = np.zeros(3)
@@ -160,27 +173,30 @@ class BarrierAttributesJson:
         #get type annotation
         veh_type = BarrierAttributesJson.type_annotation_to_one_hot(item['attributes']['type'])
 
-        images.append(veh_image.astype(np.float32) / 255.)
+        images.append(veh_image)
         anno = np.concatenate((veh_type, veh_color.astype(np.float32) / 255.))
         annotations.append(anno)
 
     return images, annotations
 
   @staticmethod
-  def json_decode_entry(value):
-    img, annotation = BarrierAttributesJson._get_image_and_annotation(value)
-    return img, annotation
-
-  @staticmethod
-  def create_dataset(size):
-    gen = BarrierAttributesJson.json_iterator(size)
-    return tf.data.Dataset.from_generator(gen, tf.int64, tf.TensorShape([]))
+  def _get_annotation(frame):
+    images, annotations = BarrierAttributesJson._get_crops(frame)
+    return [image.astype(np.float32) / 255. for image in images], annotations
 
   @staticmethod
-  def transform_fn(value):
-    image, annotation = BarrierAttributesJson.json_decode_entry(value)
-    result = image.astype(np.float32), annotation.astype(np.float32)
-    return result
+  def create_dataset(json_path, shard_dir=None):
+    """Dataset of raw records of the shard and the function decoding them to a float image and annotation"""
+    images_path, annotations_path = BarrierAttributesJson.shard_paths(json_path, shard_dir)
+    images = tf.data.FixedLengthRecordDataset(images_path, int(np.prod(CROP_SHAPE)))
+    annotations = tf.data.FixedLengthRecordDataset(annotations_path, ANNOTATION_SIZE * 4)
+
+    def decode_fn(image, annotation):
+      image = tf.reshape(tf.decode_raw(image, tf.uint8), CROP_SHAPE)
+      annotation = tf.reshape(tf.decode_raw(annotation, tf.float32), [ANNOTATION_SIZE])
+      return tf.cast(image, tf.float32) / 255., annotation
+
+    return tf.data.Dataset.zip((images, annotations)), decode_fn
 
   @staticmethod
   def get_annotations(item):
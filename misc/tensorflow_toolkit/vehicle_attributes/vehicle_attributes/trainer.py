@@ -139,27 +139,24 @@ def resnet_v1_10_1(features,
 class InputTrainData:
   # pylint: disable=too-many-arguments
   def __init__(self, batch_size, input_shape, json_path, cache_type='NONE',
-               num_parallel_calls=4, prefetch_size=4):
+               num_parallel_calls=4, prefetch_size=4, shard_dir=None):
     self.batch_size = batch_size
     self.input_shape = input_shape
     self.json_path = json_path
     self.cache_type = cache_type
     self.num_parallel_calls = num_parallel_calls
     self.prefetch_size = prefetch_size
+    self.shard_dir = shard_dir
 
-    dataset_size = BarrierAttributesJson.init_cache(json_path, cache_type)
+    dataset_size = BarrierAttributesJson.prepare_shard(json_path, shard_dir)
     self.dataset_size = dataset_size
 
-  # pylint: disable=unnecessary-lambda
   def input_fn(self):
-    train_dataset = BarrierAttributesJson.create_dataset(self.dataset_size)
-
-    transform_fn = lambda value: BarrierAttributesJson.transform_fn(value)
-
-    map_fn = lambda value: tf.py_func(transform_fn, [value], (tf.float32, tf.float32))
+    train_dataset, decode_fn = BarrierAttributesJson.create_dataset(self.json_path, self.shard_dir)
 
+    # records are shuffled as raw uint8 crops
     dataset = train_dataset.shuffle(buffer_size=self.dataset_size, reshuffle_each_iteration=True)
-    dataset = dataset.repeat().map(map_fn, num_parallel_calls=self.num_parallel_calls)
+    dataset = dataset.repeat().map(decode_fn, num_parallel_calls=self.num_parallel_calls)
     dataset = dataset.batch(self.batch_size).prefetch(self.prefetch_size)
 
     images, annotation = dataset.make_one_shot_iterator().get_next()
@@ -172,26 +169,22 @@ class InputTrainData:
 class InputEvalData:
   # pylint: disable=too-many-arguments
   def __init__(self, batch_size, input_shape, json_path, cache_type='NONE',
-               num_parallel_calls=4, prefetch_size=4):
+               num_parallel_calls=4, prefetch_size=4, shard_dir=None):
     self.batch_size = batch_size
     self.input_shape = input_shape
     self.json_path = json_path
     self.cache_type = cache_type
     self.num_parallel_calls = num_parallel_calls
     self.prefetch_size = prefetch_size
+    self.shard_dir = shard_dir
 
-    dataset_size = BarrierAttributesJson.init_cache(json_path, cache_type)
+    dataset_size = BarrierAttributesJson.prepare_shard(json_path, shard_dir)
     self.dataset_size = dataset_size
 
-  # pylint: disable=unnecessary-lambda
   def input_fn(self):
-    infer_dataset = BarrierAttributesJson.create_dataset(self.dataset_size)
-
-    transform_fn = lambda value: BarrierAttributesJson.transform_fn(value)
-
-    map_fn = lambda value: tf.py_func(transform_fn, [value], (tf.float32, tf.float32))
+    infer_dataset, decode_fn = BarrierAttributesJson.create_dataset(self.json_path, self.shard_dir)
 
-    dataset = infer_dataset.map(map_fn, num_parallel_calls=self.num_parallel_calls)
+    dataset = infer_dataset.map(decode_fn, num_parallel_calls=self.num_parallel_calls)
     dataset = dataset.batch(self.batch_size).prefetch(self.prefetch_size)
 
     images, annotation = dataset.make_one_shot_iterator().get_next()